@@ -0,0 +1,353 @@
+"""Throughput benchmark for the CSV toolkit.
+
+Builds synthetic versions of the five managed tables by resampling the sample CSV files, with
+unique keys, foreign keys that point at generated parent rows and a share of dirty values
+(currency symbols in prices, 'NULL' strings, '/'-separated dates, padded numbers, duplicate
+rows ...) that go through every branch of clean_data_for_table. Each table is then read,
+cleaned, loaded and exported in separate passes; the seconds, rows/s and peak RSS of every
+stage are printed and saved as JSON so runs can be compared.
+
+    python benchmark.py --rows 10000 100000 --chunk-size 50000
+    python benchmark.py --rows 1000000 --database
+    python benchmark.py --rows 1000000 --workers 4
+    python benchmark.py --rows 1000000 --parser arrow
+
+--database also times loading and exporting. It ERASES the managed tables first, so only point
+it at a scratch database. foodie_contact rows reference auth_user ids 1..N, which must exist.
+
+Generated files are cached in bench_data/ (one file per table, row count, seed and dirty
+ratio); results are written to bench_results/.
+"""
+import argparse
+import contextlib
+import json
+import os
+import platform
+import sys
+import threading
+import time
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+import clean_cache
+import csv_toolkit
+from db_handler import db_connection
+import toolkit_metrics
+from toolkit_metrics import OperationMetrics
+
+SAMPLE_FILES = {
+    'listings_two_dish_rice': 'listings.csv',
+    'adminusers_adminuser': 'adminuser.csv',
+    'foodie_contact': 'foodie_contact.csv',
+    'comments_comment_rate': 'comment_rate.csv',
+    'comments_commentrating': 'commentrating.csv',
+}
+DATA_DIR = 'bench_data'
+RESULTS_DIR = 'bench_results'
+GENERATE_BLOCK_SIZE = 100000 # 生成數據時每次寫入的行數
+RSS_SAMPLE_INTERVAL = 0.01 # 秒
+
+# 每個欄位可注入的髒數據；'{}' 會替換為原本的值 (例如 '${}' 產生 '$38')。
+# 只選擇清洗後仍能寫入數據庫的值 (例如 NOT NULL 欄位不會得到無法解析的值)。
+DIRTY_VALUES = {
+    'listings_two_dish_rice': {
+        'two_dish_price': ['${}', 'HK$ {}', ' {} ', '{}元', '{}.50', 'NULL', '0', '-{}', '面議'],
+        'openhour_afternoon': ['NULL', '', '25:00:00', '12:00', 'noon'],
+        'closehour_afternoon': ['NULL', 'nan'],
+        'openhour_night': ['NULL', 'NaN', ' '],
+        'closehour_nightsnack': ['null', '24:30:00'],
+        'restaurant_name': [None, '  {}  '],
+    },
+    'adminusers_adminuser': {
+        'admin_name': [None, ' {} '],
+        'admin_desc': [' {} ', '{}  '],
+        'admin_email': [None, ' {} '],
+    },
+    'foodie_contact': {
+        'foodie_name': [None, ' {} '],
+        'foodie_desc': ['NULL', '', 'nan', ' {} '],
+        'favor_chinese': ['1', '0', 'yes', ''],
+        'favor_veg': [' true ', 'False', 'N/A'],
+        'is_mvp': ['1', '0', ''],
+        'user_id': [None, ' {} ', '{}.0'],
+    },
+    'comments_comment_rate': {
+        'id': [' {} ', 'abc'],
+        'two_dish_rice_id': [' {} ', '{}.0'],
+        'foodie_name_id': ['NULL', '', ' {} '],
+        'restaurant_name': [None, ' {} '],
+        'foodie_name': ['', 'NULL', 'nan', ' {} '],
+        'edit_date': ['2025-6-30', '2025/06/30'],
+        'comment': [None],
+        'comment_photo1': ['NULL', ' ', 'nan', 'photos/c{}.jpg'],
+        'is_published': ['1', '0', ' true ', 'False'],
+        'restaurant_rating': [' {} ', '{}.0'],
+        'comment_rating': ['NULL', '', ' 4 ', '3.0'],
+    },
+    'comments_commentrating': {
+        'rater_name': [' {} ', '{}\t'],
+        'rating': ['{}.0', '{}.7'],
+        'comment_id': [None, '{}.0'],
+    },
+}
+
+def _timestamps(rng, n):
+    """Returns n random timestamps within two years, as pandas datetimes in UTC."""
+    seconds = rng.integers(0, 2 * 365 * 86400, size=n)
+    micros = rng.integers(0, 1000000, size=n)
+    return pd.Timestamp('2024-01-01', tz='UTC') + pd.to_timedelta(seconds, unit='s') + pd.to_timedelta(micros, unit='us')
+
+def _slash_dates(values):
+    """Formats datetimes like the sample edit_date column ('2025/6/22')."""
+    return (values.year.astype(str) + '/' + values.month.astype(str) + '/' + values.day.astype(str)).to_numpy()
+
+def _generate_block(table_name, sample, start, n, rows, rng):
+    """Generates rows start+1 .. start+n of a table by resampling the sample file's columns."""
+    df = pd.DataFrame({col: sample[col].to_numpy()[rng.integers(0, len(sample), size=n)] for col in sample.columns})
+    ids = np.arange(start + 1, start + n + 1)
+    df['id'] = ids
+    # 父表格的 id 由 1 開始連續分配，子表格只引用清洗後肯定存在的前半部分
+    parent_range = max(2, rows // 2)
+
+    if table_name == 'listings_two_dish_rice':
+        # 自然鍵 (restaurant_name, restaurant_address) 必須唯一
+        df['restaurant_name'] = df['restaurant_name'].astype(str) + ' 第' + ids.astype(str) + '分店'
+        df['restaurant_address'] = ids.astype(str)
+        listed = _timestamps(rng, n)
+        df['list_date'] = listed.strftime('%Y-%m-%d %H:%M:%S.%f+00:00')
+        df['edit_date'] = _slash_dates(listed)
+        for col in ['two_dish_price', 'three_dish_price', 'drink_price', 'soup_price']:
+            df[col] = rng.integers(20, 120, size=n)
+    elif table_name == 'adminusers_adminuser':
+        df['admin_email'] = 'admin' + ids.astype(str) + '@example.com'
+    elif table_name == 'foodie_contact':
+        df['user_id'] = ids
+        df['foodie_name'] = 'User' + ids.astype(str)
+        df['updated_date'] = _timestamps(rng, n).strftime('%Y-%m-%d %H:%M:%S.%f+00:00')
+    elif table_name == 'comments_comment_rate':
+        df['two_dish_rice_id'] = rng.integers(1, parent_range, size=n)
+        df['foodie_name_id'] = rng.integers(0, parent_range, size=n)
+        listed = _timestamps(rng, n)
+        df['list_date'] = listed.strftime('%Y-%m-%d %H:%M:%S.%f+00:00')
+        df['edit_date'] = _slash_dates(listed)
+        df['restaurant_rating'] = rng.integers(1, 6, size=n)
+    elif table_name == 'comments_commentrating':
+        df['comment_id'] = rng.integers(1, parent_range, size=n)
+        df['rater_id'] = rng.integers(1, parent_range, size=n)
+        df['rating'] = rng.integers(1, 6, size=n)
+        df['created_date'] = _timestamps(rng, n).strftime('%Y-%m-%d %H:%M:%S.%f+00:00')
+    return df
+
+def _inject_dirty(df, table_name, dirty_ratio, rng):
+    """Replaces about dirty_ratio of each listed column with dirty values and duplicates some rows."""
+    for col, templates in DIRTY_VALUES.get(table_name, {}).items():
+        if col not in df.columns:
+            continue
+        mask = rng.random(len(df)) < dirty_ratio
+        if not mask.any():
+            continue
+        originals = df.loc[mask, col].astype(str).to_numpy()
+        picks = rng.integers(0, len(templates), size=len(originals))
+        values = [None if templates[p] is None else templates[p].format(o) for p, o in zip(picks, originals)]
+        df[col] = df[col].astype(object)
+        df.loc[mask, col] = values
+
+    # 完全重複的行，用來測試去重
+    duplicates = np.flatnonzero(rng.random(len(df)) < dirty_ratio / 2)
+    if len(duplicates):
+        sources = rng.integers(0, len(df), size=len(duplicates))
+        df.iloc[duplicates] = df.iloc[sources].to_numpy()
+    return df
+
+def generate_table(table_name, rows, path, seed=42, dirty_ratio=0.05):
+    """Writes a synthetic CSV file of the given size for the table, block by block."""
+    sample = pd.read_csv(os.path.join(os.path.dirname(os.path.abspath(__file__)), SAMPLE_FILES[table_name]))
+    sample.columns = [c.lstrip('\ufeff') for c in sample.columns]
+    rng = np.random.default_rng([seed, list(SAMPLE_FILES).index(table_name)])
+    temp_file = f"{path}.part"
+    with open(temp_file, 'w', encoding='utf-8', newline='') as f:
+        for start in range(0, rows, GENERATE_BLOCK_SIZE):
+            n = min(GENERATE_BLOCK_SIZE, rows - start)
+            block = _inject_dirty(_generate_block(table_name, sample, start, n, rows, rng), table_name, dirty_ratio, rng)
+            block.to_csv(f, index=False, header=start == 0)
+    os.replace(temp_file, path)
+
+def dataset_path(data_dir, table_name, rows, seed, dirty_ratio):
+    """Returns the cached data file for the given generator settings, generating it if needed."""
+    path = os.path.join(data_dir, f"{table_name}_{rows}_s{seed}_d{dirty_ratio}.csv")
+    if not os.path.exists(path):
+        os.makedirs(data_dir, exist_ok=True)
+        print(f"生成 {rows} 行 '{table_name}' 測試數據: {path}")
+        generate_table(table_name, rows, path, seed, dirty_ratio)
+    return path
+
+class PeakRss:
+    """Context manager that samples the process RSS in a background thread and keeps the peak (in MB).
+
+    Uses /proc/self/statm where available; elsewhere falls back to the process-wide ru_maxrss.
+    """
+    def __init__(self):
+        self.peak_mb = 0.0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+
+    @staticmethod
+    def current_mb():
+        """Returns the current resident set size in MB."""
+        try:
+            with open('/proc/self/statm') as f:
+                return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 2**20
+        except (OSError, ValueError, AttributeError):
+            import resource
+            maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            return maxrss / 2**20 if sys.platform == 'darwin' else maxrss / 1024
+
+    def _sample(self):
+        while not self._stop.is_set():
+            self.peak_mb = max(self.peak_mb, self.current_mb())
+            self._stop.wait(RSS_SAMPLE_INTERVAL)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.peak_mb = max(self.peak_mb, self.current_mb())
+
+def _stage(seconds, rows, rss):
+    """Builds the result entry of one stage."""
+    return {'seconds': round(seconds, 4), 'rows': rows,
+            'rows_per_second': round(rows / seconds, 1) if seconds > 0 else None,
+            'peak_rss_mb': round(rss.peak_mb, 1)}
+
+def _stage_summary(name, stage):
+    """Formats one stage for the console line; stages too fast to time have no rows per second."""
+    if 'error' in stage:
+        return f"{name} 失敗: {stage['error']}"
+    # 耗時為 0 (例如空檔案) 時沒有速度可言
+    speed = '-' if stage['rows_per_second'] is None else f"{stage['rows_per_second']:,.0f}"
+    return f"{name} {speed} 行/秒 ({stage['peak_rss_mb']} MB)"
+
+def bench_table(table_name, path, chunk_size, database, export_dir, workers=None, csv_parser='pandas'):
+    """Times the read, clean, load and export stages of one table; each stage runs as its own pass.
+
+    The clean and load passes have to read (and clean) the file again; only the time spent in
+    the stage itself is counted, while peak RSS covers the whole pass.
+    """
+    stages = {}
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        with PeakRss() as rss:
+            started = time.perf_counter()
+            frames = csv_toolkit._read_frames(path, chunk_size, 'csv', table_name, csv_parser=csv_parser)
+            rows_read = sum(len(chunk) for chunk in frames)
+            stages['read'] = _stage(time.perf_counter() - started, rows_read, rss)
+
+        with PeakRss() as rss:
+            metrics = OperationMetrics('benchmark', table=table_name)
+            for _ in csv_toolkit._iter_cleaned_chunks(path, table_name, chunk_size, metrics, 'csv', workers,
+                                                      csv_parser=csv_parser):
+                pass
+            stages['clean'] = _stage(metrics.seconds('clean'), metrics.rows('clean', 'rows_in'), rss)
+            stages['clean']['dropped'] = metrics.dropped
+
+    if not database:
+        return stages
+
+    for stage, run in (('load', _bench_load), ('export', _bench_export)):
+        try:
+            with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull), PeakRss() as rss:
+                seconds, rows = run(table_name, path, chunk_size, export_dir)
+            stages[stage] = _stage(seconds, rows, rss)
+        except Exception as e:
+            stages[stage] = {'error': str(e)}
+            break
+    return stages
+
+def _bench_load(table_name, path, chunk_size, export_dir):
+    """Loads the file into the (emptied) table; returns (seconds spent loading, rows loaded)."""
+    metrics = OperationMetrics('benchmark', table=table_name)
+    cleaned_chunks = csv_toolkit._iter_cleaned_chunks(path, table_name, chunk_size, metrics)
+    df_cleaned = next((chunk for chunk in cleaned_chunks if not chunk.empty), None)
+    if df_cleaned is None:
+        raise ValueError("清洗後沒有數據可導入")
+    with db_connection() as conn:
+        if not conn:
+            raise ConnectionError("數據庫連接失敗")
+        with conn.cursor() as cursor:
+            if not csv_toolkit._load_cleaned_chunks(conn, cursor, path, table_name, df_cleaned, cleaned_chunks,
+                                                    metrics, 'append', None):
+                raise RuntimeError("導入失敗")
+    seconds = sum(metrics.seconds(stage) for stage in ('prepare', 'insert', 'commit'))
+    return seconds, metrics.rows('insert')
+
+def _bench_export(table_name, path, chunk_size, export_dir):
+    """Exports the table to export_dir; returns (seconds, rows exported)."""
+    os.makedirs(export_dir, exist_ok=True)
+    export_file = os.path.join(export_dir, f"{table_name}.csv")
+    started = time.perf_counter()
+    if not csv_toolkit.export_db_to_csv(table_name, export_file):
+        raise RuntimeError("導出失敗")
+    seconds = time.perf_counter() - started
+    with db_connection() as conn, conn.cursor() as cursor:
+        cursor.execute(csv_toolkit.sql.SQL("SELECT COUNT(*) FROM {table}").format(
+            table=csv_toolkit.sql.Identifier(table_name)))
+        return seconds, cursor.fetchone()[0]
+
+def build_parser():
+    """Builds the argument parser for the benchmark."""
+    parser = argparse.ArgumentParser(prog='benchmark', description="CSV 數據庫工具包性能測試")
+    parser.add_argument('--rows', type=int, nargs='+', default=[10000], help="每個表格生成的行數 (可多個)")
+    parser.add_argument('--tables', nargs='+', choices=list(SAMPLE_FILES), default=list(SAMPLE_FILES))
+    parser.add_argument('--chunk-size', type=int, default=None, help="分塊讀取及清洗，每塊的行數")
+    parser.add_argument('--workers', type=int, default=None, help="清洗使用的進程數 (見 csv_toolkit.clean_data_parallel)")
+    parser.add_argument('--parser', choices=csv_toolkit.CSV_PARSERS, default='pandas', help="CSV 解析器")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--dirty-ratio', type=float, default=0.05, help="每個欄位注入髒數據的比例")
+    parser.add_argument('--database', action='store_true',
+                        help="同時測試導入及導出 (會先清除所有受管理表格的數據，只可用於測試數據庫)")
+    parser.add_argument('--data-dir', default=DATA_DIR)
+    parser.add_argument('--output', default=None, help="結果 JSON 文件 (預設寫入 bench_results/)")
+    return parser
+
+def main(argv=None):
+    """Generates the data, runs the benchmark and writes the JSON report; returns the exit code."""
+    args = build_parser().parse_args(argv)
+    # 各階段的計時已寫入結果文件，不需要再輸出每次導入/導出的指標記錄
+    toolkit_metrics.configure(metrics='off')
+    # 緩存命中會跳過讀取及清洗，測量的便不是這兩個階段
+    clean_cache.configure(max_mb=0)
+    # 子表格引用父表格的 id，按依賴順序處理
+    tables = [table for table in csv_toolkit.MANAGED_TABLES if table in args.tables]
+    report = {
+        'started_at': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(), 'pandas': pd.__version__, 'platform': platform.platform(),
+        'settings': {'rows': args.rows, 'chunk_size': args.chunk_size, 'workers': args.workers, 'parser': args.parser,
+                     'seed': args.seed,
+                     'dirty_ratio': args.dirty_ratio, 'database': args.database},
+        'results': [],
+    }
+    for rows in args.rows:
+        if args.database and not csv_toolkit.erase_tables(csv_toolkit.MANAGED_TABLES, confirm=False):
+            return 1
+        for table in tables:
+            path = dataset_path(args.data_dir, table, rows, args.seed, args.dirty_ratio)
+            stages = bench_table(table, path, args.chunk_size, args.database,
+                                 os.path.join(args.data_dir, 'export'), args.workers, args.parser)
+            report['results'].append({'table': table, 'rows': rows, 'file_mb': round(os.path.getsize(path) / 2**20, 2),
+                                      'stages': stages})
+            summary = ', '.join(_stage_summary(name, stage) for name, stage in stages.items())
+            print(f"{table} [{rows} 行]: {summary}")
+
+    output = args.output or os.path.join(RESULTS_DIR, f"benchmark_{datetime.now().strftime('%Y%m%d%H%M%S')}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"結果已保存到 '{output}'。")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,149 @@
+"""On-disk cache of cleaned DataFrames for the CSV toolkit.
+
+Re-importing (or dry-running) an unchanged file replays the cleaned chunks stored by an earlier
+run instead of parsing and cleaning it again. An entry is keyed by the SHA-256 of the file's
+content, the target table, the chunk size and format, the version of the cleaning rules and the
+pandas version; it holds one pickle per cleaned chunk plus meta.json with the row counts of the
+original run. Entries are built in a temporary directory and renamed into place once the whole
+file has been cleaned. When the cache grows past its size cap, the least recently used entries
+(by directory mtime, refreshed on every hit) are removed. Settings come from the environment
+(or configure(), used by the batch command line):
+
+    TOOLKIT_CACHE_DIR      cache directory (default .clean_cache)
+    TOOLKIT_CACHE_MAX_MB   size cap in MB (default 0, cache disabled); the batch command line's
+                           --cache turns it on with DEFAULT_MAX_MB
+
+The cache is opt-in: entries are unencrypted pickles of the cleaned rows, contact details
+included, and computing the key costs an extra SHA-256 pass over the file. Directories are
+created readable by their owner only; pickles are only ever read from this directory, which
+must not be writable by others.
+"""
+import hashlib
+import json
+import os
+import shutil
+import threading
+from contextlib import contextmanager
+
+import pandas as pd
+
+META_FILE = 'meta.json'
+DEFAULT_MAX_MB = 1024 # --cache 未指定 TOOLKIT_CACHE_MAX_MB 時的大小上限
+
+_settings = {
+    'cache_dir': os.getenv('TOOLKIT_CACHE_DIR', '.clean_cache'),
+    'max_mb': float(os.getenv('TOOLKIT_CACHE_MAX_MB', 0)),
+}
+_evict_lock = threading.Lock()
+
+def configure(cache_dir=None, max_mb=None):
+    """Overrides the cache directory and size cap taken from the environment."""
+    if cache_dir is not None:
+        _settings['cache_dir'] = cache_dir
+    if max_mb is not None:
+        _settings['max_mb'] = max_mb
+
+def enabled():
+    """Tells whether cleaned frames are cached at all."""
+    return _settings['max_mb'] > 0
+
+def entry_key(content_hash, *parts):
+    """Returns the entry name for a file's content hash and the settings its cleaned frames depend on."""
+    text = '|'.join(str(part) for part in (content_hash, *parts, pd.__version__))
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+class CacheEntry:
+    """A complete cache entry: meta holds the recorded row counts, frames() replays the chunks."""
+
+    def __init__(self, path, meta):
+        self.path = path
+        self.meta = meta
+
+    def frames(self):
+        """Yields the cached chunks in their original order."""
+        for index in range(self.meta['chunks']):
+            yield pd.read_pickle(os.path.join(self.path, f"{index:06d}.pkl"))
+
+def lookup(key):
+    """Returns the CacheEntry stored under key, or None; a hit marks the entry as recently used."""
+    if not enabled():
+        return None
+    path = os.path.join(_settings['cache_dir'], key)
+    try:
+        with open(os.path.join(path, META_FILE), encoding='utf-8') as f:
+            meta = json.load(f)
+        os.utime(path)
+    except (OSError, ValueError):
+        return None
+    return CacheEntry(path, meta)
+
+class CacheWriter:
+    """Collects the cleaned chunks of one file; nothing is visible in the cache until commit()."""
+
+    def __init__(self, key):
+        self.key = key
+        self.temp_path = os.path.join(_settings['cache_dir'], f"{key}.{os.getpid()}.{threading.get_ident()}.tmp")
+        self.chunks = 0
+        # 緩存包含清洗後的完整數據 (包括聯絡資料)，只允許擁有者讀取
+        os.makedirs(_settings['cache_dir'], mode=0o700, exist_ok=True)
+        os.makedirs(self.temp_path, mode=0o700, exist_ok=True)
+
+    def add(self, frame):
+        """Stores the next cleaned chunk."""
+        frame.to_pickle(os.path.join(self.temp_path, f"{self.chunks:06d}.pkl"))
+        self.chunks += 1
+
+    def commit(self, meta):
+        """Publishes the entry with its meta data, then evicts old entries if the cache is over its cap."""
+        with open(os.path.join(self.temp_path, META_FILE), 'w', encoding='utf-8') as f:
+            json.dump({**meta, 'chunks': self.chunks}, f)
+        try:
+            os.replace(self.temp_path, os.path.join(_settings['cache_dir'], self.key))
+        except OSError:
+            # 另一個導入已寫入相同的條目
+            return
+        evict()
+
+@contextmanager
+def writer(key):
+    """Yields a CacheWriter for key (None if the cache is disabled); an uncommitted entry is discarded."""
+    if not enabled():
+        yield None
+        return
+    try:
+        cache_writer = CacheWriter(key)
+    except OSError:
+        yield None
+        return
+    try:
+        yield cache_writer
+    finally:
+        shutil.rmtree(cache_writer.temp_path, ignore_errors=True)
+
+def _entry_size(path):
+    """Returns the total size of the files in an entry directory."""
+    size = 0
+    for name in os.listdir(path):
+        size += os.path.getsize(os.path.join(path, name))
+    return size
+
+def evict(max_mb=None):
+    """Removes least recently used entries until the cache fits in max_mb (default: the configured cap)."""
+    max_bytes = (_settings['max_mb'] if max_mb is None else max_mb) * 2**20
+    cache_dir = _settings['cache_dir']
+    with _evict_lock:
+        entries = []
+        for name in os.listdir(cache_dir):
+            path = os.path.join(cache_dir, name)
+            if name.endswith('.tmp') or not os.path.isdir(path):
+                continue
+            try:
+                entries.append((os.path.getmtime(path), _entry_size(path), path))
+            except OSError:
+                continue # 條目正被其他程序移除
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= max_bytes:
+                break
+            shutil.rmtree(path, ignore_errors=True)
+            total -= size
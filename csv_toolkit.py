@@ -1,95 +1,1153 @@
+import sys
+
+if __name__ == "__main__" and len(sys.argv) > 1:
+    # 帶參數執行時直接進入非互動的批處理模式，不必先導入 pandas、numpy 及 psycopg2
+    from toolkit_cli import main as cli_main
+    sys.exit(cli_main(sys.argv[1:]))
+
 import psycopg2
 from psycopg2 import sql
 import pandas as pd
+import numpy as np
 from dotenv import load_dotenv
 import os
-from db_handler import connect_db # Import the connect_db function
-import tkinter as tk
-from tkinter import filedialog
+import io
+import itertools
+import json
+import re
+import hashlib
+import shutil
+import threading
+import queue
+import multiprocessing
+from datetime import datetime
+from contextlib import contextmanager, closing
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, wait, FIRST_COMPLETED
+from db_handler import db_connection, get_foreign_keys, POOL_Config # Pooled connections shared by all toolkit operations
+from db_schema import ImportPlan, get_table_schema, invalidate_schema
+from toolkit_metrics import OperationMetrics, configure, info, debug, is_debug, preview
+import clean_cache
+import rating_aggregates
 
 # --- Database Interaction Functions --- #
 
-def import_csv_to_db(csv_file, table_name):
-    """Imports data from a CSV file to the specified database table after cleaning."""
+COPY_NULL = '\\N' # COPY 使用的 NULL 標記，與空字串區分
+EXPORT_FETCH_SIZE = 10000 # 導出時每次從伺服器端游標取回的行數
+FILE_FORMATS = ('csv', 'parquet') # 支援的導入/導出文件格式，未指定時按副檔名判斷
+CSV_PARSERS = ('pandas', 'arrow') # 導入 CSV 時可選的解析器，arrow 以多線程解析
+# Arrow 解析器按 pd.read_csv 的預設規則識別布林值及缺失值
+CSV_TRUE_VALUES = ['True', 'TRUE', 'true']
+CSV_FALSE_VALUES = ['False', 'FALSE', 'false']
+CSV_NA_VALUES = ['', '#N/A', '#N/A N/A', '#NA', '-1.#IND', '-1.#QNAN', '-NaN', '-nan', '1.#IND', '1.#QNAN', '<NA>',
+                 'N/A', 'NA', 'NULL', 'NaN', 'None', 'n/a', 'nan', 'null']
+PARQUET_EXTENSIONS = ('.parquet', '.pq')
+PARQUET_COMPRESSION = 'zstd'
+IF_EXISTS_POLICIES = ('ask', 'append', 'truncate', 'sync') # 表格已有數據時的處理方式
+# 增量導出的水位線取修改日期及建立日期中較晚者 (每組按優先次序取第一個存在的欄位) 及記錄水位線的文件名
+WATERMARK_EDIT_COLUMNS = ['edit_date', 'updated_date']
+WATERMARK_CREATE_COLUMNS = ['list_date', 'created_date']
+WATERMARK_FILE = '.export_watermarks.json'
+# 同步模式 (if_exists='sync') 用來對應現有記錄的自然鍵
+NATURAL_KEYS = {
+    'listings_two_dish_rice': ['restaurant_name', 'restaurant_address'],
+    'adminusers_adminuser': ['admin_email'],
+    'comments_comment_rate': ['two_dish_rice_id', 'foodie_name_id', 'list_date'],
+    'comments_commentrating': ['comment_id', 'rater_id'],
+    'foodie_contact': ['user_id'],
+}
+# 去重時視為數字的字串 (與 pd.read_csv 推斷為數值的寫法相同)，用來統一不同區塊推斷出的類型
+NUMBER_PATTERN = r'\s*[-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?\s*'
+INTEGER_PATTERN = r'\s*[-+]?\d+\s*'
+# 數值的雜湊只取決於其位元，非整數的浮點數雜湊後再與此值混合，以免與位元相同的整數得出相同的雜湊值
+FLOAT_HASH_SALT = np.uint64(0x9E3779B97F4A7C15)
+# 多進程清洗時每個分區至少的行數，太小的分區花在進程間傳輸的時間比清洗還多
+CLEAN_PARTITION_MIN_ROWS = 50000
+# 外鍵無效的記錄會寫入與來源文件同名、以此結尾的隔離文件
+REJECT_SUFFIX = '.rejects.csv'
+# 可續傳導入 (resume=True) 的進度與數據在同一事務中記錄在此表格，並抄寫到與來源文件同名、以此結尾的檢查點文件
+CHECKPOINT_TABLE = 'toolkit_import_checkpoints'
+CHECKPOINT_SUFFIX = '.checkpoint.json'
+# 導出篩選條件可用的運算符 (in / not in 的值為列表)
+EXPORT_FILTER_OPERATORS = ('=', '!=', '<', '<=', '>', '>=', 'like', 'in', 'not in', 'is null', 'is not null')
+PARTITION_NULL_LABEL = '__null__' # 分區導出時分區欄位為 NULL 的行寫入的文件標籤
+SNAPSHOT_MANIFEST = 'manifest.json' # 快照目錄中記錄行數及校驗和的清單
+# 流水線導入時每個階段之間最多暫存的區塊數，限制記憶體。連同各線程持有的區塊 (讀取 1 個、清洗 2 個、
+# 寫入 1 個)，同一時間最多有 2 * PIPELINE_QUEUE_SIZE + 4 個區塊，啟用清洗緩存時再加 1 個預先清洗的區塊
+PIPELINE_QUEUE_SIZE = 2
+PIPELINE_POLL_SECONDS = 0.1 # 隊列已滿時檢查下游是否已停止的間隔
+# 工具包管理的表格 (與主選單一致)
+MANAGED_TABLES = ['listings_two_dish_rice', 'adminusers_adminuser', 'foodie_contact',
+                  'comments_comment_rate', 'comments_commentrating']
+
+def _frame_to_copy_buffer(df):
+    """Serializes a DataFrame into an in-memory CSV buffer suitable for COPY ... FROM STDIN."""
+    df_out = df
+    # COPY 不會像參數化 INSERT 一樣把 3.0 轉為整數，故將全為整數值的浮點欄位轉為 Int64
+    for col in df.columns:
+        if pd.api.types.is_float_dtype(df[col].dtype):
+            values = df[col].dropna()
+            if not values.empty and (values == values.round()).all():
+                if df_out is df:
+                    df_out = df.copy()
+                df_out[col] = df[col].astype('Int64')
+    buffer = io.StringIO()
+    df_out.to_csv(buffer, index=False, header=False, na_rep=COPY_NULL)
+    buffer.seek(0)
+    return buffer
+
+@contextmanager
+def _staged_frame(cursor, df, table_name):
+    """Copies a DataFrame into a temporary staging table shaped like the target table's columns.
+
+    Yields the staging table identifier; the table is dropped when the block completes. If the
+    block fails, the transaction is rolled back and the temporary table goes with it.
+    """
+    stage = sql.Identifier(f"_stage_{table_name}")
+    columns = sql.SQL(', ').join(sql.Identifier(col) for col in df.columns)
+    # 臨時表只複製欄位類型，不複製 NOT NULL 等約束，讓省略的欄位 (例如 id) 不會阻礙 COPY
+    cursor.execute(sql.SQL("CREATE TEMP TABLE {stage} AS SELECT {columns} FROM {table} WITH NO DATA").format(
+        stage=stage, columns=columns, table=sql.Identifier(table_name)))
+    copy_sql = sql.SQL("COPY {stage} ({columns}) FROM STDIN WITH (FORMAT csv, NULL {null})").format(
+        stage=stage, columns=columns, null=sql.Literal(COPY_NULL))
+    cursor.copy_expert(copy_sql.as_string(cursor), _frame_to_copy_buffer(df))
+    yield stage
+    cursor.execute(sql.SQL("DROP TABLE {stage}").format(stage=stage))
+
+def copy_frame_to_table(cursor, df, table_name):
+    """Bulk loads a DataFrame via COPY into a staging table and merges it into the target table.
+
+    Rows that conflict with existing keys are skipped (ON CONFLICT DO NOTHING). The inserted rows
+    are added to the table's rating aggregates, if it has any (see rating_aggregates).
+    Returns the number of rows actually inserted.
+    """
+    columns = sql.SQL(', ').join(sql.Identifier(col) for col in df.columns)
+    with _staged_frame(cursor, df, table_name) as stage:
+        return rating_aggregates.execute_tracked(cursor, table_name, sql.SQL(
+            "INSERT INTO {table} AS t ({columns}) SELECT {columns} FROM {stage} ON CONFLICT DO NOTHING").format(
+                table=sql.Identifier(table_name), columns=columns, stage=stage))
+
+def sync_frame_to_table(cursor, df, table_name, key_columns):
+    """Upserts a DataFrame into the target table, matching rows on natural key columns.
+
+    Each staged row is hashed (md5 of its column values) and compared with the hash of the
+    existing row with the same key; only new keys are inserted and only rows whose hash differs
+    are updated. When a key appears more than once in the frame, the last row wins. Rows with a
+    NULL key column cannot be matched and are skipped. Inserted and updated rows are applied to
+    the table's rating aggregates, if it has any.
+    Returns (inserted, updated, skipped_null_keys).
+    """
+    missing_keys = [col for col in key_columns if col not in df.columns]
+    if missing_keys:
+        raise ValueError(f"同步模式的自然鍵欄位不存在: {', '.join(missing_keys)}")
+    null_keys = df[key_columns].isna().any(axis=1)
+    df = df[~null_keys]
+    if df.empty:
+        return 0, 0, int(null_keys.sum())
+
+    target = sql.Identifier(table_name)
+    value_columns = [col for col in df.columns if col not in key_columns]
+    keys = sql.SQL(', ').join(sql.Identifier(col) for col in key_columns)
+    columns = sql.SQL(', ').join(sql.Identifier(col) for col in df.columns)
+    key_match = sql.SQL(' AND ').join(
+        sql.SQL("t.{c} = s.{c}").format(c=sql.Identifier(col)) for col in key_columns)
+
+    def row_hash(alias):
+        return sql.SQL("md5(ROW({values})::text)").format(values=sql.SQL(', ').join(
+            sql.SQL("{a}.{c}").format(a=sql.Identifier(alias), c=sql.Identifier(col)) for col in df.columns))
+
+    with _staged_frame(cursor, df, table_name) as stage:
+        # 同一自然鍵在文件中出現多次時，以最後一行為準
+        latest = sql.SQL("SELECT DISTINCT ON ({keys}) {columns} FROM {stage} ORDER BY {keys}, ctid DESC").format(
+            keys=keys, columns=columns, stage=stage)
+        updated = 0
+        if value_columns:
+            old_alias = None
+            old_row, old_match = sql.SQL(''), sql.SQL('')
+            if rating_aggregates.tracked(cursor, table_name):
+                # 再次引用目標表格 (以 ctid 對應同一行) 取得更新前的值，用來從匯總中減去
+                old_alias = 'o'
+                old_row = sql.SQL(", {target} o").format(target=target)
+                old_match = sql.SQL("o.ctid = t.ctid AND ")
+            updated = rating_aggregates.execute_tracked(cursor, table_name, sql.SQL(
+                "UPDATE {target} t SET {assignments} FROM ({latest}) s{old_row} "
+                "WHERE {old_match}{key_match} AND {t_hash} <> {s_hash}").format(
+                    target=target, latest=latest, old_row=old_row, old_match=old_match, key_match=key_match,
+                    t_hash=row_hash('t'), s_hash=row_hash('s'),
+                    assignments=sql.SQL(', ').join(
+                        sql.SQL("{c} = s.{c}").format(c=sql.Identifier(col)) for col in value_columns)), old_alias)
+        inserted = rating_aggregates.execute_tracked(cursor, table_name, sql.SQL(
+            "INSERT INTO {target} AS t ({columns}) SELECT {columns} FROM ({latest}) s "
+            "WHERE NOT EXISTS (SELECT 1 FROM {target} t WHERE {key_match}) ON CONFLICT DO NOTHING").format(
+                target=target, columns=columns, latest=latest, key_match=key_match))
+    return inserted, updated, int(null_keys.sum())
+
+_reference_keys_cache = {}
+_reference_keys_lock = threading.Lock()
+
+def _reference_keys(cursor, table_name, column):
+    """Returns the values of a referenced key column as a pd.Index, cached across chunks and imports.
+
+    The index keeps its hash table between lookups, so each chunk is checked in one pass. A cached
+    set is reused while max(column) is unchanged (an index lookup on the referenced key) and
+    reloaded with COPY otherwise; writes made through the toolkit also drop it (see
+    invalidate_reference_keys).
+    """
+    table, col = sql.Identifier(table_name), sql.Identifier(column)
+    cursor.execute(sql.SQL("SELECT max({col}) FROM {table}").format(col=col, table=table))
+    current_max = cursor.fetchone()[0]
+    with _reference_keys_lock:
+        cached = _reference_keys_cache.get((table_name, column))
+    if cached is not None and cached[0] == current_max:
+        return cached[1]
+
+    buffer = io.StringIO()
+    cursor.copy_expert(sql.SQL("COPY (SELECT {col} FROM {table} WHERE {col} IS NOT NULL) TO STDOUT").format(
+        col=col, table=table).as_string(cursor), buffer)
+    buffer.seek(0)
+    if buffer.getvalue():
+        keys = pd.Index(pd.read_csv(buffer, header=None, keep_default_na=False)[0])
+    else:
+        keys = pd.Index([])
+    with _reference_keys_lock:
+        _reference_keys_cache[(table_name, column)] = (current_max, keys)
+    return keys
+
+def invalidate_reference_keys(table_name):
+    """Drops the cached key sets of a table after its rows have changed."""
+    with _reference_keys_lock:
+        for key in [key for key in _reference_keys_cache if key[0] == table_name]:
+            del _reference_keys_cache[key]
+
+def _in_keys(values, keys):
+    """Vectorised membership test of a column against a key index; NULLs count as present."""
+    found = np.ones(len(values), dtype=bool)
+    notna = values.notna().to_numpy()
+    candidates = values[notna]
+    if pd.api.types.is_integer_dtype(keys.dtype) and pd.api.types.is_integer_dtype(candidates.dtype):
+        found[notna] = keys.get_indexer(candidates.to_numpy(dtype='int64')) >= 0
+    else:
+        found[notna] = candidates.astype(str).isin(keys.astype(str)).to_numpy()
+    return found
+
+def _split_orphans(cursor, df, foreign_keys):
+    """Splits off rows whose foreign key values do not exist in the referenced table.
+
+    df should be converted by the table's ImportPlan first, so key columns hold the same values
+    (e.g. Int64 rather than 5.0 or ' 5') as the referenced keys. foreign_keys are (table,
+    column, referenced_table, referenced_column) tuples of the target table. Returns (valid
+    rows, orphan rows with a '_reject_reason' column naming the first broken reference).
+    """
+    orphan = np.zeros(len(df), dtype=bool)
+    reasons = np.full(len(df), '', dtype=object)
+    for _, column, ref_table, ref_column in foreign_keys:
+        if column not in df.columns:
+            continue
+        missing = ~_in_keys(df[column], _reference_keys(cursor, ref_table, ref_column))
+        reasons[missing & ~orphan] = f"{column} 不存在於 {ref_table}.{ref_column}"
+        orphan |= missing
+    if not orphan.any():
+        return df, df.iloc[0:0]
+    return df[~orphan], df[orphan].assign(_reject_reason=reasons[orphan])
+
+# 導入時以 remap_ids=True 記錄的 id 對應：(表格, 欄位) -> [(文件中的舊 id, 數據庫分配的新 id), ...]
+_id_maps = {}
+_id_maps_lock = threading.Lock()
+
+def _as_ids(values):
+    """Converts a column to a nullable Int64 array; values that are not whole numbers become NA."""
+    if pd.api.types.is_integer_dtype(values.dtype):
+        return pd.array(values, dtype='Int64')
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        values = values.astype(object)
+    numbers = pd.to_numeric(values, errors='coerce').to_numpy(dtype='float64', na_value=np.nan)
+    whole = ~np.isnan(numbers) & (numbers == np.floor(numbers))
+    result = pd.array(np.where(whole, numbers, 0).astype('int64'), dtype='Int64')
+    result[~whole] = pd.NA
+    return result
+
+def _publish_ids(table_name, column, pairs):
+    """Makes committed (old ids, new ids) pairs of a parent table available to its child imports."""
+    with _id_maps_lock:
+        _id_maps.setdefault((table_name, column), []).extend(pairs)
+
+def forget_id_maps(tables=None):
+    """Drops the recorded id mappings of the given tables (default: all)."""
+    with _id_maps_lock:
+        for key in [key for key in _id_maps if tables is None or key[0] in tables]:
+            del _id_maps[key]
+
+def _id_map(table_name, column):
+    """Returns the recorded mapping of a parent key as a Series of new ids indexed by old id, or None."""
+    with _id_maps_lock:
+        pairs = list(_id_maps.get((table_name, column), []))
+    if not pairs:
+        return None
+    old_ids = np.concatenate([old for old, _ in pairs])
+    new_ids = np.concatenate([new for _, new in pairs])
+    id_map = pd.Series(new_ids, index=pd.Index(old_ids))
+    # 同一舊 id 在文件中出現多次時以第一行為準
+    return id_map[~id_map.index.duplicated()]
+
+def _remap_foreign_keys(df, remaps):
+    """Rewrites foreign key columns from the ids of the parent file to the ids the database assigned.
+
+    remaps are (column, referenced_table, referenced_column, id map) tuples. All rows are
+    looked up in one get_indexer pass per column; NULLs stay NULL. References without a
+    mapping keep their value, so they are checked against the referenced table like any other.
+    """
+    rewritten = {}
+    for column, ref_table, ref_column, id_map in remaps:
+        if column not in df.columns:
+            continue
+        values = df[column]
+        old_ids = _as_ids(values)
+        whole = ~old_ids.isna()
+        positions = np.full(len(df), -1, dtype=np.intp)
+        positions[whole] = id_map.index.get_indexer(old_ids[whole].to_numpy(dtype='int64'))
+        found = positions >= 0
+        if not found.any():
+            continue
+        if whole.sum() == values.notna().sum():
+            new_ids = old_ids.copy()
+            new_ids[found] = id_map.to_numpy()[positions[found]]
+        else:
+            # 有非整數的值時保留原值，交由外鍵檢查隔離
+            new_ids = values.astype(object).to_numpy(copy=True)
+            new_ids[found] = id_map.to_numpy()[positions[found]]
+        rewritten[column] = new_ids
+    if not rewritten:
+        return df
+    return df.assign(**{column: pd.Series(new_ids, index=df.index) for column, new_ids in rewritten.items()})
+
+def _allocate_ids(cursor, sequence, count):
+    """Reserves count values of a sequence in one round trip and returns them as an int64 array."""
+    cursor.execute("SELECT nextval(%s) FROM generate_series(1, %s)", (sequence, count))
+    return np.array([row[0] for row in cursor.fetchall()], dtype='int64')
+
+def _inserted_ids(cursor, table_name, column, new_ids):
+    """Returns the mask of pre-allocated ids that were actually inserted (others hit ON CONFLICT)."""
+    cursor.execute(sql.SQL("SELECT {col} FROM {table} WHERE {col} = ANY(%s)").format(
+        col=sql.Identifier(column), table=sql.Identifier(table_name)), (new_ids.tolist(),))
+    return np.isin(new_ids, np.array([row[0] for row in cursor.fetchall()], dtype='int64'))
+
+def _natural_key_ids(cursor, df, old_ids, table_name, key_columns, column):
+    """Returns (old ids, new ids) of synced rows by joining their natural keys to the target table."""
+    keys = df[key_columns].assign(**{column: old_ids})
+    key_match = sql.SQL(' AND ').join(
+        sql.SQL("t.{c} = s.{c}").format(c=sql.Identifier(col)) for col in key_columns)
+    with _staged_frame(cursor, keys.dropna(), table_name) as stage:
+        cursor.execute(sql.SQL("SELECT s.{col}, t.{col} FROM {stage} s JOIN {table} t ON {key_match}").format(
+            col=sql.Identifier(column), stage=stage, table=sql.Identifier(table_name), key_match=key_match))
+        rows = cursor.fetchall()
+    pairs = np.array(rows, dtype='int64').reshape(-1, 2)
+    return pairs[:, 0], pairs[:, 1]
+
+def _write_rejects(rejects, reject_file, header):
+    """Writes quarantined rows to the reject file, starting it (with a header) or appending to it."""
+    with open(reject_file, 'w' if header else 'a', encoding='utf-8-sig' if header else 'utf-8', newline='') as f:
+        rejects.to_csv(f, index=False, header=header)
+
+def _checkpoint_file(source_file):
+    """Returns the path of the checkpoint file kept next to the source file."""
+    return f"{os.path.splitext(source_file)[0]}{CHECKPOINT_SUFFIX}"
+
+def _load_checkpoint(saved, content_hash, table_name, chunk_size):
+    """Returns the progress committed for this file content, table and chunk size, or a fresh checkpoint.
+
+    saved is the progress read by _recorded_checkpoint. 'chunks' counts the source chunks whose
+    rows are committed; with the same content and chunk size they cover the same rows, so a
+    rerun can skip exactly that many chunks.
+    """
+    checkpoint = {'file_sha256': content_hash, 'table': table_name, 'chunk_size': chunk_size, 'chunks': 0,
+                  'rows_cleaned': 0, 'inserted': 0, 'updated': 0, 'null_keys': 0, 'rejected': 0}
+    if saved is None:
+        return checkpoint
+    if any(saved.get(field) != checkpoint[field] for field in ('file_sha256', 'table', 'chunk_size')):
+        print(f"表格 '{table_name}' 的導入進度屬於其他文件內容或分塊大小，從頭開始導入。")
+        return checkpoint
+    return {**checkpoint, **saved}
+
+def _recorded_checkpoint(conn, source_file, table_name):
+    """Returns the progress committed by an earlier resumable import of the file into the table, or None.
+
+    The checkpoint table is created here on first use, in a transaction of its own, so that the
+    chunks only ever write a row to it.
+    """
+    with conn.cursor() as cursor:
+        cursor.execute(sql.SQL(
+            "CREATE TABLE IF NOT EXISTS {table} (source text NOT NULL, table_name text NOT NULL, "
+            "progress jsonb NOT NULL, updated_at timestamptz NOT NULL DEFAULT now(), "
+            "PRIMARY KEY (source, table_name))").format(table=sql.Identifier(CHECKPOINT_TABLE)))
+        cursor.execute(sql.SQL("SELECT progress FROM {table} WHERE source = %s AND table_name = %s").format(
+            table=sql.Identifier(CHECKPOINT_TABLE)), (os.path.abspath(source_file), table_name))
+        row = cursor.fetchone()
+    conn.commit()
+    return row[0] if row else None
+
+def _record_checkpoint(cursor, source_file, checkpoint):
+    """Stores the progress in the checkpoint table; it is committed together with the chunk's rows."""
+    cursor.execute(sql.SQL(
+        "INSERT INTO {table} (source, table_name, progress) VALUES (%s, %s, %s) "
+        "ON CONFLICT (source, table_name) DO UPDATE SET progress = excluded.progress, updated_at = now()").format(
+            table=sql.Identifier(CHECKPOINT_TABLE)),
+        (os.path.abspath(source_file), checkpoint['table'], json.dumps(checkpoint, ensure_ascii=False)))
+
+def _forget_checkpoint(cursor, source_file, table_name):
+    """Removes the progress of a finished import from the checkpoint table (committed by the caller)."""
+    cursor.execute(sql.SQL("DELETE FROM {table} WHERE source = %s AND table_name = %s").format(
+        table=sql.Identifier(CHECKPOINT_TABLE)), (os.path.abspath(source_file), table_name))
+
+def _save_checkpoint(checkpoint_file, checkpoint):
+    """Mirrors the committed progress to the checkpoint file atomically (temporary file + rename)."""
+    temp_file = f"{checkpoint_file}.part"
+    with open(temp_file, 'w', encoding='utf-8') as f:
+        json.dump({**checkpoint, 'updated_at': datetime.now().isoformat(timespec='seconds')}, f,
+                  ensure_ascii=False, indent=2)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temp_file, checkpoint_file)
+
+def _file_format(path, file_format=None):
+    """Returns 'csv' or 'parquet': file_format if given, otherwise decided by the file extension."""
+    if file_format is not None:
+        if file_format not in FILE_FORMATS:
+            raise ValueError(f"未知的文件格式: {file_format}")
+        return file_format
+    return 'parquet' if os.path.splitext(path)[1].lower() in PARQUET_EXTENSIONS else 'csv'
+
+def _import_pyarrow():
+    """Imports pyarrow, which is only needed for Parquet files."""
     try:
-        df = pd.read_csv(csv_file)
-        if df.empty:
-            print(f"CSV 文件 '{csv_file}' 為空，無法導入。")
-            return False
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise ImportError("Parquet 格式需要安裝 pyarrow (pip install pyarrow)。") from None
+    return pa, pq
 
-        print(f"開始為表格 '{table_name}' 清洗數據...")
-        df_cleaned = clean_data_for_table(df.copy(), table_name)
+def _import_pyarrow_csv():
+    """Imports the pyarrow modules used by the Arrow CSV parser."""
+    try:
+        import pyarrow as pa
+        import pyarrow.compute as pc
+        import pyarrow.csv as pcsv
+    except ImportError:
+        raise ImportError("Arrow CSV 解析器需要安裝 pyarrow (pip install pyarrow)。") from None
+    return pa, pc, pcsv
 
-        if df_cleaned.empty:
-            print(f"數據清洗後，CSV 文件 '{csv_file}' 無有效數s可導入到表格 '{table_name}'。")
-            return False
+def _infer_arrow_types(pa, pc, table, keep_strings):
+    """Types the all-string columns of an Arrow table the way pd.read_csv types them.
 
-        conn = connect_db()
-        if not conn:
-            print("數據庫連接失敗。")
-            return False
-        
-        cursor = conn.cursor()
-        
+    Numbers (spaces and tabs around them allowed) become int64 (uint64 if they only fit that),
+    or float64 if not all of them are integers; integers too large for either stay strings
+    rather than losing precision as floats. Columns holding only TRUE/FALSE words become bool;
+    columns without values become float64. Other columns, and those in keep_strings, stay strings.
+    """
+    true_values = pa.array(CSV_TRUE_VALUES)
+    boolean_values = pa.array(CSV_TRUE_VALUES + CSV_FALSE_VALUES)
+    columns = []
+    for name, column in zip(table.column_names, table.columns):
+        if name in keep_strings:
+            pass
+        elif column.null_count == len(column):
+            column = column.cast(pa.float64())
+        else:
+            trimmed = pc.utf8_trim(column, characters=' \t')
+            numbers = None
+            for number_type in (pa.int64(), pa.uint64(), pa.float64()):
+                if number_type == pa.float64() and pc.all(pc.match_substring_regex(
+                        pc.drop_null(trimmed), f"^{INTEGER_PATTERN}$")).as_py():
+                    break # 超出整數範圍的整數保留為字串
+                try:
+                    numbers = pc.cast(trimmed, number_type)
+                    break
+                except pa.ArrowInvalid:
+                    continue
+            if numbers is not None:
+                column = numbers
+            elif pc.all(pc.is_in(pc.drop_null(column), value_set=boolean_values)).as_py():
+                column = pc.if_else(pc.is_null(column), None, pc.is_in(column, value_set=true_values))
+        columns.append(column)
+    return pa.table(columns, names=table.column_names)
+
+def _arrow_csv_frames(source_file, chunk_size, usecols, keep_strings):
+    """Yields the CSV file as DataFrames parsed by Arrow's CSV reader, for _read_frames.
+
+    The file is parsed into string columns (quoted values may span lines, e.g. menu and comment),
+    which _infer_arrow_types then types per chunk like pd.read_csv does, so the frames match
+    the pandas parser's. Strings stay in Arrow buffers ('str' dtype). A whole file is read with
+    Arrow's multithreaded reader; chunks are streamed and cut to exactly chunk_size rows.
+    """
+    pa, pc, pcsv = _import_pyarrow_csv()
+    parse_options = pcsv.ParseOptions(newlines_in_values=True)
+    with pcsv.open_csv(source_file, parse_options=parse_options) as reader:
+        names = [name for name in reader.schema.names if usecols is None or usecols(name)]
+    convert_options = pcsv.ConvertOptions(
+        column_types=dict.fromkeys(names, pa.string()), include_columns=names, null_values=CSV_NA_VALUES,
+        strings_can_be_null=True, quoted_strings_can_be_null=True)
+
+    def to_frame(table, start):
+        frame = _infer_arrow_types(pa, pc, table, keep_strings).to_pandas()
+        # 與 pd.read_csv 分塊讀取相同，行索引跨區塊連續
+        frame.index = pd.RangeIndex(start, start + len(frame))
+        return frame
+
+    if not chunk_size:
+        yield to_frame(pcsv.read_csv(source_file, parse_options=parse_options, convert_options=convert_options), 0)
+        return
+    start = 0
+    with pcsv.open_csv(source_file, parse_options=parse_options, convert_options=convert_options) as reader:
+        pending = []
+        rows = 0
+        for batch in reader:
+            pending.append(batch)
+            rows += batch.num_rows
+            while rows >= chunk_size:
+                table = pa.Table.from_batches(pending, schema=reader.schema)
+                yield to_frame(table.slice(0, chunk_size), start)
+                start += chunk_size
+                rest = table.slice(chunk_size)
+                pending, rows = rest.to_batches(), rest.num_rows
+        if rows:
+            yield to_frame(pa.Table.from_batches(pending, schema=reader.schema), start)
+
+def _parquet_types_mapper(pa):
+    """Maps Arrow integer and boolean columns to pandas nullable dtypes, so NULLs do not turn them into float/object."""
+    mapping = {
+        pa.int8(): pd.Int8Dtype(), pa.int16(): pd.Int16Dtype(), pa.int32(): pd.Int32Dtype(),
+        pa.int64(): pd.Int64Dtype(), pa.bool_(): pd.BooleanDtype(),
+    }
+    return mapping.get
+
+def _compact_frame(df, category_columns, flag_columns):
+    """Shrinks a freshly read frame without changing its values.
+
+    Integer columns are downcast to the smallest integer type that holds them, flag columns
+    whose TRUE/FALSE values were read as objects (because of empty cells) become nullable
+    boolean, and category columns, as well as flag columns read as strings, become category.
+    Values are unchanged, so cleaning and COPY output are the same as before.
+    """
+    for col in df.columns:
+        series = df[col]
+        if pd.api.types.is_integer_dtype(series.dtype):
+            df[col] = pd.to_numeric(series, downcast='integer')
+        elif col in flag_columns and series.dtype == object and pd.api.types.infer_dtype(series, skipna=True) == 'boolean':
+            df[col] = series.astype('boolean')
+        elif (col in category_columns or col in flag_columns) and pd.api.types.is_string_dtype(series.dtype):
+            # 含有髒值的 flag 欄位仍按字串讀取，同樣只有少數不同值
+            df[col] = series.astype('category')
+    return df
+
+def _read_frames(source_file, chunk_size, file_format, table_name=None, schema=None, csv_parser='pandas'):
+    """Yields the source file as DataFrames of chunk_size rows (a single DataFrame if chunk_size is None).
+
+    Columns the target table does not have are not read at all. The table's columns and flag
+    (boolean) columns come from schema, a db_schema.TableSchema, when given (imports); without
+    a database connection (dry runs, benchmarks) they come from the table's DTYPE_PLANS entry.
+    Every projected frame is compacted with _compact_frame. csv_parser 'arrow' parses CSV files
+    with _arrow_csv_frames instead of pd.read_csv.
+    """
+    plan = DTYPE_PLANS.get(table_name)
+    category = plan['category'] if plan else []
+    if schema is not None:
+        columns, flags = set(schema.columns), schema.columns_of_type('boolean')
+    elif plan:
+        columns, flags = plan['columns'], plan['flags']
+    else:
+        columns = flags = None
+    skipped = []
+
+    def usecols(column):
+        if column.strip() in columns:
+            return True
+        skipped.append(column)
+        return False
+
+    if file_format == 'parquet':
+        pa, pq = _import_pyarrow()
+        parquet_file = pq.ParquetFile(source_file)
+        names = [name for name in parquet_file.schema_arrow.names if usecols(name)] if columns else None
+        batches = parquet_file.iter_batches(batch_size=chunk_size, columns=names) if chunk_size \
+            else [parquet_file.read(columns=names)]
+        types_mapper = _parquet_types_mapper(pa)
+        frames = (batch.to_pandas(types_mapper=types_mapper) for batch in batches)
+    elif csv_parser == 'arrow':
+        frames = _arrow_csv_frames(source_file, chunk_size, usecols if columns else None, category if columns else [])
+    else:
+        options = {'usecols': usecols, 'dtype': dict.fromkeys(category, 'category')} if columns else {}
+        frames = pd.read_csv(source_file, chunksize=chunk_size, **options) if chunk_size \
+            else [pd.read_csv(source_file, **options)]
+    for index, frame in enumerate(frames):
+        if index == 0 and skipped:
+            info(f"表格 '{table_name}' 沒有以下欄位，讀取時已略過: {', '.join(skipped)}")
+        yield frame if columns is None else _compact_frame(frame, category, flags)
+
+def _number_hashes(numbers):
+    """Hashes numbers by value: whole values hash alike whether they were int or float (5 and 5.0)."""
+    if pd.api.types.is_integer_dtype(numbers.dtype):
+        return pd.util.hash_array(numbers.to_numpy().astype('int64'))
+    values = numbers.to_numpy(dtype='float64', na_value=np.nan)
+    whole = (np.abs(values) < 2**53) & (values == np.floor(values))
+    hashes = pd.util.hash_array(pd.util.hash_array(values) ^ FLOAT_HASH_SALT)
+    hashes[whole] = pd.util.hash_array(values[whole].astype('int64'))
+    return hashes
+
+def _cell_hashes(series):
+    """Returns a 64-bit hash per value of a column, in the same canonical form whatever dtype it was read as.
+
+    Numbers (including strings that read_csv would parse as numbers, e.g. '5' and '5.0') hash by
+    value, other values by their text; NULL hashes like an empty string.
+    """
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        series = series.astype(object)
+    missing = series.isna().to_numpy()
+    hashes = np.full(len(series), pd.util.hash_array(np.array([''], dtype=object))[0], dtype='uint64')
+    if pd.api.types.is_bool_dtype(series.dtype):
+        text = np.where(series.to_numpy(dtype=bool, na_value=False), 'True', 'False').astype(object)
+        hashes[~missing] = pd.util.hash_array(text[~missing])
+        return hashes
+    if pd.api.types.is_numeric_dtype(series.dtype):
+        hashes[~missing] = _number_hashes(series[~missing])
+        return hashes
+    strings = series.astype(str)
+    # 只把看起來像數字的字串轉為數值，逐個嘗試轉換所有字串太慢
+    numeric = strings.str.fullmatch(NUMBER_PATTERN).fillna(False).to_numpy(dtype=bool) & ~missing
+    if numeric.any():
+        # 整數字串單獨轉換，以免與小數一併轉為 float64 而失去精度
+        integer = numeric & strings.str.fullmatch(INTEGER_PATTERN).fillna(False).to_numpy(dtype=bool)
+        for part in (integer, numeric & ~integer):
+            if part.any():
+                hashes[part] = _number_hashes(pd.to_numeric(strings[part]))
+    text = ~numeric & ~missing
+    if text.any():
+        hashes[text] = pd.util.hash_array(strings[text].to_numpy(dtype=object), categorize=False)
+    return hashes
+
+def _row_hashes(df):
+    """Returns a 64-bit content hash per row, stable across chunks with differently inferred dtypes."""
+    # 不同區塊可能把同一欄推斷為 int、float 或 str (例如 5、5.0 與 '5')，每個值先按規範形式計算雜湊值
+    cells = pd.DataFrame({col: _cell_hashes(df[col]) for col in df.columns}, index=df.index)
+    return pd.util.hash_pandas_object(cells, index=False)
+
+def _iter_cleaned_chunks(csv_file, table_name, chunk_size, metrics, file_format='csv', workers=None, schema=None,
+                         pipeline=False, skip_chunks=0, csv_parser='pandas'):
+    """Yields cleaned DataFrames read from the CSV or Parquet file, chunk_size rows at a time (whole file if None).
+
+    In chunked mode, rows already seen in an earlier chunk are dropped before cleaning so that
+    de-duplication matches a single pass over the whole file. Time and row counts are recorded
+    in metrics as the 'read' and 'clean' stages. With workers > 1, large chunks are cleaned on
+    a process pool (see clean_data_parallel). schema is passed on to _read_frames. With pipeline,
+    the next chunk is read on a background thread while the current one is being cleaned.
+    skip_chunks leaves out the first chunks (already loaded by an interrupted import); they are
+    still read and hashed for de-duplication, but not cleaned, and the cache is not used.
+    csv_parser is passed on to _read_frames.
+
+    If clean_cache is enabled and the same file has been cleaned for the table before, the
+    chunks and row counts are replayed from it instead (hashing and lookup are timed as the
+    'cache' stage). A new entry is stored as soon as the last chunk has been cleaned, even if
+    the caller stops early (a declined prompt or a failed load), so the next attempt can reuse
+    it; only then is the next chunk cleaned ahead of the one being yielded.
+    """
+    key = None
+    if clean_cache.enabled() and not skip_chunks:
+        with metrics.stage('cache'):
+            key = clean_cache.entry_key(_file_sha256(csv_file), table_name, chunk_size, file_format, CLEANING_VERSION,
+                                        schema and schema.fingerprint(), csv_parser)
+            cached = clean_cache.lookup(key)
+        if cached is not None:
+            yield from _replay_cached(cached, csv_file, metrics)
+            return
+
+    before = (metrics.rows('read'), metrics.rows('clean', 'rows_in'), metrics.rows('clean'), dict(metrics.dropped))
+    with metrics.stage('read'):
+        reader = iter(_read_frames(csv_file, chunk_size, file_format, table_name, schema, csv_parser))
+    frames = _timed_frames(reader, metrics)
+    if pipeline:
+        frames = _pipelined(frames, 'reader')
+    with closing(frames), _cleaning_pool(workers) as executor, clean_cache.writer(key) as entry:
+        chunks = _clean_chunks(frames, table_name, chunk_size, metrics, executor, workers, skip_chunks)
+        if entry is None:
+            for current in chunks:
+                if len(current.columns) == 0:
+                    # 缺少必要欄位，clean_data_for_table 已打印錯誤，終止後續區塊
+                    return
+                yield current
+            return
+        # 預先清洗下一個區塊，以便在交出最後一個區塊之前寫入緩存
+        current = next(chunks, None)
+        while current is not None:
+            if len(current.columns) == 0:
+                # 缺少必要欄位，clean_data_for_table 已打印錯誤，終止後續區塊
+                return
+            following = next(chunks, None)
+            entry.add(current)
+            if following is None:
+                entry.commit({
+                    'rows_read': metrics.rows('read') - before[0],
+                    'rows_in': metrics.rows('clean', 'rows_in') - before[1],
+                    'rows_out': metrics.rows('clean') - before[2],
+                    'dropped': {rule: rows - before[3].get(rule, 0) for rule, rows in metrics.dropped.items()},
+                })
+            yield current
+            current = following
+
+def _replay_cached(cached, csv_file, metrics):
+    """Yields the chunks of a cache entry, recording the row counts of the run that stored it."""
+    meta = cached.meta
+    with metrics.stage('read') as stage:
+        stage.rows_out = meta['rows_read']
+    with metrics.stage('clean') as stage:
+        stage.rows_in, stage.rows_out = meta['rows_in'], meta['rows_out']
+    for rule, rows in meta['dropped'].items():
+        metrics.drop(rule, rows)
+    info(f"文件 '{csv_file}' 未變更，使用緩存的清洗結果 ({meta['rows_out']} 行)。")
+    frames = cached.frames()
+    while True:
+        with metrics.stage('cache') as stage:
+            frame = next(frames, None)
+            stage.rows_out = 0 if frame is None else len(frame)
+        if frame is None:
+            return
+        yield frame
+
+def _timed_frames(reader, metrics):
+    """Yields the frames of reader, timing each read as the 'read' stage."""
+    while True:
+        with metrics.stage('read') as stage:
+            chunk = next(reader, None)
+            stage.rows_out = 0 if chunk is None else len(chunk)
+        if chunk is None:
+            return
+        yield chunk
+
+def _pipelined(iterable, name):
+    """Yields the items of iterable, producing them on a background thread ahead of the consumer.
+
+    At most PIPELINE_QUEUE_SIZE items wait in between, plus the one the producer is blocked on
+    putting, so a slow consumer holds back the producer instead of letting it fill memory. An exception raised by the producer is re-raised
+    in the consumer. Closing this generator (or leaving it early) stops the producer and closes
+    iterable on the producer's thread.
+    """
+    items = queue.Queue(maxsize=PIPELINE_QUEUE_SIZE)
+    stopped = threading.Event()
+    done = object()
+
+    def put(item):
+        while not stopped.is_set():
+            try:
+                items.put(item, timeout=PIPELINE_POLL_SECONDS)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def produce():
+        iterator = iter(iterable)
+        try:
+            for item in iterator:
+                if not put((item, None)):
+                    return
+            put((done, None))
+        except BaseException as e:
+            put((done, e))
+        finally:
+            if hasattr(iterator, 'close'):
+                iterator.close()
+
+    producer = threading.Thread(target=produce, name=f"import-{name}", daemon=True)
+    producer.start()
+    try:
+        while True:
+            item, error = items.get()
+            if error is not None:
+                raise error
+            if item is done:
+                return
+            yield item
+    finally:
+        stopped.set()
+        producer.join()
+
+def _clean_chunks(frames, table_name, chunk_size, metrics, executor, workers, skip_chunks=0):
+    """Cleans the chunks produced by frames for _iter_cleaned_chunks, leaving out the first skip_chunks."""
+    seen_hashes = set()
+    for chunk in frames:
+        if chunk.empty:
+            continue
+        if skip_chunks:
+            # 已提交的區塊不再清洗，但仍記錄其雜湊值，使跨區塊去重與完整導入一致
+            skip_chunks -= 1
+            seen_hashes.update(_row_hashes(chunk).tolist())
+            continue
+
+        with metrics.stage('clean') as stage:
+            stage.rows_in = len(chunk)
+            if chunk_size:
+                hashes = _row_hashes(chunk)
+                keep = ~hashes.duplicated() & pd.Series([h not in seen_hashes for h in hashes.tolist()], index=hashes.index)
+                seen_hashes.update(hashes[keep].tolist())
+                dropped = len(chunk) - int(keep.sum())
+                if dropped:
+                    metrics.drop('duplicate_rows', dropped)
+                    info(f"移除了 {dropped} 行與先前區塊重複的數據。")
+                chunk = chunk[keep]
+
+            debug(f"開始為表格 '{table_name}' 清洗數據...")
+            if executor is None:
+                df_cleaned = clean_data_for_table(chunk, table_name, metrics)
+            else:
+                df_cleaned = clean_data_parallel(chunk, table_name, executor, workers, metrics)
+            stage.rows_out = len(df_cleaned)
+        yield df_cleaned
+        if len(df_cleaned.columns) == 0:
+            return
+
+def _reset_sequence(cursor, schema):
+    """Restarts the sequence behind the table's generated column at 1; returns False if it has none."""
+    if schema.sequence is None:
+        return False
+    cursor.execute("SELECT setval(%s, 1, false)", (schema.sequence,))
+    return True
+
+def _print_problems(header, problems):
+    """Prints a header followed by one line per problem found by an ImportPlan."""
+    print(header)
+    for problem in problems:
+        print(f"  - {problem}")
+
+def _load_cleaned_chunks(conn, cursor, csv_file, table_name, df_cleaned, cleaned_chunks, metrics, if_exists, key_columns,
+                         checkpoint=None, remap_ids=False):
+    """Prepares the target table and bulk loads the first cleaned chunk followed by the remaining ones.
+
+    Chunks are projected and converted by an ImportPlan compiled from the table's catalog schema
+    (see db_schema); if the file's columns or the first chunk's values do not fit the table, the
+    table is left untouched. Time spent is recorded in metrics as the 'validate', 'prepare',
+    'insert' and 'commit' stages.
+
+    Without checkpoint everything is committed in one transaction at the end. With a checkpoint
+    (see _load_checkpoint), every chunk is committed on its own together with the progress row
+    in CHECKPOINT_TABLE, so a chunk's rows and its progress are committed or lost as one; the
+    checkpoint file is only a readable copy written after the commit. If the checkpoint already
+    records committed chunks, cleaned_chunks starts after them and the table is not prepared
+    again.
+
+    With remap_ids, foreign keys are rewritten through the id mappings recorded by earlier
+    imports, and if other tables reference this table's generated key, the file's ids are
+    recorded against the new ones: in append mode the ids are reserved from the sequence before
+    the insert, in sync mode they are read back by joining the natural keys. Mappings are
+    published at each commit, so a rolled back chunk never leaks ids that do not exist.
+    References without a mapping are left unchanged for the foreign key check.
+    """
+    schema = get_table_schema(cursor, table_name)
+    if schema is None:
+        print(f"表格 '{table_name}' 不存在。")
+        return False
+    plan = ImportPlan(schema, list(df_cleaned.columns))
+    with metrics.stage('validate'):
+        first_insert, problems = plan.apply(df_cleaned)
+    problems = plan.file_errors() + problems
+    if problems:
+        # 表格結構可能在本程序啟動後被修改 (例如遷移)，下次導入時重新讀取
+        invalidate_schema(table_name)
+        _print_problems(f"CSV 文件 '{csv_file}' 不符合表格 '{table_name}' 的結構，未寫入任何數據:", problems)
+        return False
+    if not plan.columns:
+        print(f"數據在移除自動生成的欄位後沒有可導入的欄位，無法導入到表格 '{table_name}'。")
+        return False
+    if plan.generated:
+        # 序列或 IDENTITY 欄位 (例如 id) 由數據庫生成
+        print(f"注意：已從導入數據中移除 {', '.join(plan.generated)} 欄位，以允許 '{table_name}' 表格的自動主鍵生成。")
+
+    # 檢查點只在提交了第一個非空區塊後才寫入，因此 rows_cleaned 為 0 表示從頭開始
+    resuming = checkpoint is not None and checkpoint['rows_cleaned'] > 0
+    if resuming:
+        # 已提交的區塊不能再清除，續傳時一律追加
+        print(f"從檢查點繼續導入：跳過之前已提交的 {checkpoint['rows_cleaned']} 筆記錄。")
+    else:
         # 檢查表格是否有數據
         cursor.execute(f"SELECT COUNT(*) FROM {table_name}")
         existing_count = cursor.fetchone()[0]
-        
+    
         if existing_count > 0:
             print(f"表格 '{table_name}' 中已有 {existing_count} 筆數據。")
-            choice = input("是否清除現有數據後導入？ (y/n，預設為 n - 跳過重複數據): ").lower()
-            
+            if if_exists == 'ask':
+                choice = input("是否清除現有數據後導入？ (y/n，預設為 n - 跳過重複數據): ").lower()
+            else:
+                choice = 'y' if if_exists == 'truncate' else 'n'
+        
             if choice == 'y':
-                cursor.execute(f"DELETE FROM {table_name}")
-                cursor.execute(f"ALTER SEQUENCE {table_name}_id_seq RESTART WITH 1")
+                with metrics.stage('prepare') as stage:
+                    stage.rows_in = existing_count
+                    if len(_dependent_tables([table_name], get_foreign_keys(cursor))) == 1:
+                        # 沒有其他表格引用此表格，TRUNCATE 的耗時與數據量無關
+                        cursor.execute(sql.SQL("TRUNCATE {table} RESTART IDENTITY").format(table=sql.Identifier(table_name)))
+                    else:
+                        # 被引用的表格不能單獨 TRUNCATE，逐行刪除讓外鍵約束檢查子表格
+                        cursor.execute(f"DELETE FROM {table_name}")
+                        _reset_sequence(cursor, schema)
+                    rating_aggregates.clear(cursor, [table_name])
                 print(f"已清除表格 '{table_name}' 的現有數據，並重置 ID 序列。")
             elif choice not in ['n', '']:
                 print("無效輸入，導入操作已取消。")
                 return False
-            else:
+            elif schema.sequence is not None:
                 # 即使不清除數據，也詢問是否要重置 ID 序列
-                reset_choice = input("是否要重置 ID 序列從 1 開始？ (y/n，預設為 n): ").lower()
+                reset_choice = input("是否要重置 ID 序列從 1 開始？ (y/n，預設為 n): ").lower() if if_exists == 'ask' else 'n'
                 if reset_choice == 'y':
-                    cursor.execute(f"ALTER SEQUENCE {table_name}_id_seq RESTART WITH 1")
+                    _reset_sequence(cursor, schema)
                     print(f"已重置表格 '{table_name}' 的 ID 序列從 1 開始。")
-        else:
+        elif _reset_sequence(cursor, schema):
             # 如果表格是空的，也應該重置序列到 1
-            cursor.execute(f"ALTER SEQUENCE {table_name}_id_seq RESTART WITH 1")
             print(f"表格 '{table_name}' 為空，已重置 ID 序列從 1 開始。")
-        
-        df_to_insert = df_cleaned.copy()
-
-        # 如果導入到 'adminusers_adminuserid' 且 CSV 中存在 'id' 欄位，則移除它
-        # 假設數據庫中的 'id' 是自動遞增主鍵
-        if table_name in ['adminusers_adminuser', 'listings_two_dish_rice', 'comments_comment_rate', 'comments_commentrating', 'auth_user', 'foodie_contact'] and 'id' in df_to_insert.columns:
-            df_to_insert.drop(columns=['id'], inplace=True, errors='ignore')
-            print(f"注意：已從導入數據中移除 'id' 欄位，以允許 '{table_name}' 表格的自動主鍵生成。")
-
-        if df_to_insert.empty:
-            if not df_cleaned.empty: # df_cleaned had data, but df_to_insert is now empty (e.g. after ID drop)
-                print(f"數據在移除 'id' 欄位後變為空，無法導入到表格 '{table_name}'。")
-            else: # df_cleaned was already empty (this path might be less likely if prior check exists)
-                print(f"數據清洗後，CSV 文件 '{csv_file}' 無有效數據可導入到表格 '{table_name}'。")
-            return False
 
-        columns = ', '.join(df_to_insert.columns) # Using df_to_insert
-        placeholders = ', '.join(['%s'] * len(df_to_insert.columns))
-        
-        # 使用 ON CONFLICT DO NOTHING 來跳過重複的主鍵
-        insert_sql = f"INSERT INTO {table_name} ({columns}) VALUES ({placeholders}) ON CONFLICT DO NOTHING" # Using new 'columns' from df_to_insert
-
-        inserted_count = 0 # Reset inserted_count for the new loop
-        for index, row in df_to_insert.iterrows(): # Loop over df_to_insert
-            cursor.execute(insert_sql, tuple(row))
-            if cursor.rowcount > 0:
-                inserted_count += 1
-        
+    # 外鍵預先檢查：引用不存在的記錄會令整個事務失敗，先在寫入前移到隔離文件
+    foreign_keys = [fk for fk in schema.foreign_keys if fk[2] != table_name]
+    reject_file = f"{os.path.splitext(csv_file)[0]}{REJECT_SUFFIX}"
+    if os.path.exists(reject_file) and not resuming:
+        os.remove(reject_file)
+    checkpoint_file = _checkpoint_file(csv_file)
+
+    id_column, remaps, pending_ids = None, [], []
+    if remap_ids:
+        # 只記錄被其他表格引用、由序列生成的主鍵
+        referenced = {(fk[2], fk[3]) for fk in get_foreign_keys(cursor) if fk[0] != table_name}
+        id_column = next((col for col in plan.generated
+                          if schema.columns[col].sequence and (table_name, col) in referenced), None)
+        if id_column is not None and not resuming:
+            forget_id_maps([table_name])
+        for _, column, ref_table, ref_column in foreign_keys:
+            id_map = _id_map(ref_table, ref_column)
+            if id_map is not None and column in df_cleaned.columns:
+                remaps.append((column, ref_table, ref_column, id_map))
+        if remaps:
+            print(f"將按本次導入的 id 對應改寫欄位: {', '.join(f'{column} -> {ref_table}' for column, ref_table, _, _ in remaps)}")
+
+    # 續傳時的統計包括之前已提交的區塊
+    progress = checkpoint or {}
+    cleaned_count = progress.get('rows_cleaned', 0)
+    inserted_count = progress.get('inserted', 0)
+    updated_count = progress.get('updated', 0)
+    skipped_null_keys = progress.get('null_keys', 0)
+    rejected_count = progress.get('rejected', 0)
+    for chunk_index, df_cleaned in enumerate(itertools.chain([df_cleaned], cleaned_chunks)):
+        cleaned_count += len(df_cleaned)
+        with metrics.stage('validate') as stage:
+            stage.rows_in = len(df_cleaned)
+            source = df_cleaned
+            if remaps:
+                df_cleaned = _remap_foreign_keys(df_cleaned, remaps)
+            if chunk_index == 0 and df_cleaned is source:
+                df_to_insert = first_insert
+            else:
+                df_to_insert, problems = plan.apply(df_cleaned)
+            orphans = df_to_insert.iloc[:0]
+            if foreign_keys and not problems:
+                # 按轉換後的值比對外鍵 (例如 5.0 或 ' 5' 已轉為整數 5)
+                df_to_insert, orphans = _split_orphans(cursor, df_to_insert, foreign_keys)
+                if not orphans.empty:
+                    # 隔離文件保留清洗後、改寫 id 前的原始欄位 (包括 id)，與來源文件一致，方便修正後重新導入
+                    orphans = source.loc[orphans.index].assign(_reject_reason=orphans['_reject_reason'])
+            stage.rows_out = len(df_to_insert)
+        if problems:
+            if checkpoint is None:
+                header = f"第 {chunk_index + 1} 個區塊不符合表格 '{table_name}' 的結構，導入已取消，未寫入任何數據:"
+            else:
+                header = (f"第 {chunk_index + 1} 個區塊不符合表格 '{table_name}' 的結構，導入已停止；"
+                          f"之前的 {checkpoint['chunks']} 個區塊已提交:")
+            _print_problems(header, problems)
+            return False # 未提交的事務 (包括清除現有數據) 在連接歸還連接池時回滾
+        if not orphans.empty:
+            metrics.drop('orphan_reference', len(orphans))
+            _write_rejects(orphans, reject_file, header=not os.path.exists(reject_file))
+            rejected_count += len(orphans)
+
+        if not df_to_insert.empty:
+            with metrics.stage('insert') as stage:
+                stage.rows_in = len(df_to_insert)
+                if id_column is not None:
+                    old_ids = _as_ids(df_cleaned.loc[df_to_insert.index, id_column])
+                if if_exists == 'sync':
+                    # 按自然鍵比對內容雜湊值，只寫入新增及有變更的記錄
+                    inserted, updated, null_keys = sync_frame_to_table(cursor, df_to_insert, table_name, key_columns)
+                    inserted_count += inserted
+                    updated_count += updated
+                    skipped_null_keys += null_keys
+                    stage.rows_out = inserted + updated
+                    if id_column is not None:
+                        pending_ids.append(_natural_key_ids(cursor, df_to_insert, old_ids, table_name, key_columns,
+                                                            id_column))
+                else:
+                    if id_column is not None:
+                        # 預先從序列取得新 id 並一併寫入，舊 id 與新 id 按行對應
+                        new_ids = _allocate_ids(cursor, schema.columns[id_column].sequence, len(df_to_insert))
+                        df_to_insert = df_to_insert.assign(**{id_column: new_ids})
+                    # 以 COPY 批量寫入臨時表，再以 ON CONFLICT DO NOTHING 合併，跳過重複的主鍵
+                    inserted = copy_frame_to_table(cursor, df_to_insert, table_name)
+                    inserted_count += inserted
+                    stage.rows_out = inserted
+                    if id_column is not None:
+                        kept = ~old_ids.isna()
+                        if inserted < len(df_to_insert):
+                            kept &= _inserted_ids(cursor, table_name, id_column, new_ids)
+                        pending_ids.append((old_ids[kept].to_numpy(dtype='int64'), new_ids[kept]))
+
+        if checkpoint is not None:
+            checkpoint.update(chunks=checkpoint['chunks'] + 1, rows_cleaned=cleaned_count, inserted=inserted_count,
+                              updated=updated_count, null_keys=skipped_null_keys, rejected=rejected_count)
+            with metrics.stage('commit'):
+                # 進度與區塊的數據在同一事務中提交，中斷後不會重複寫入已提交的區塊
+                _record_checkpoint(cursor, csv_file, checkpoint)
+                conn.commit()
+            if pending_ids:
+                _publish_ids(table_name, id_column, pending_ids)
+                pending_ids = []
+            _save_checkpoint(checkpoint_file, checkpoint)
+    
+    with metrics.stage('commit'):
+        if checkpoint is not None:
+            _forget_checkpoint(cursor, csv_file, table_name)
         conn.commit()
-        print(f"CSV 文件 '{csv_file}' (經清洗後) 的數據已成功導入到表格 '{table_name}'。")
-        print(f"共處理 {len(df_cleaned)} 筆記錄，成功插入 {inserted_count} 筆新數據。")
-        if inserted_count < len(df_cleaned):
-            print(f"跳過了 {len(df_cleaned) - inserted_count} 筆重複數據。")
+    invalidate_reference_keys(table_name)
+    if pending_ids:
+        _publish_ids(table_name, id_column, pending_ids)
+    if os.path.exists(checkpoint_file):
+        # 導入已完成，舊的進度不再適用
+        os.remove(checkpoint_file)
+    rows_cleaned = cleaned_count - rejected_count
+    print(f"CSV 文件 '{csv_file}' (經清洗後) 的數據已成功導入到表格 '{table_name}'。")
+    if rejected_count:
+        print(f"已將 {rejected_count} 筆外鍵引用不存在的記錄隔離到 '{reject_file}'，未寫入數據庫。")
+    if if_exists == 'sync':
+        unchanged_count = rows_cleaned - inserted_count - updated_count - skipped_null_keys
+        print(f"共處理 {rows_cleaned} 筆記錄，新增 {inserted_count} 筆，更新 {updated_count} 筆，{unchanged_count} 筆未變更。")
+        if skipped_null_keys:
+            print(f"跳過了 {skipped_null_keys} 筆自然鍵 ({', '.join(key_columns)}) 含空值的記錄。")
         return True
+    print(f"共處理 {rows_cleaned} 筆記錄，成功插入 {inserted_count} 筆新數據。")
+    if inserted_count < rows_cleaned:
+        print(f"跳過了 {rows_cleaned - inserted_count} 筆重複數據。")
+    return True
+
+def import_csv_to_db(csv_file, table_name, chunk_size=None, if_exists='ask', dry_run=False, key_columns=None,
+                     file_format=None, workers=None, pipeline=False, resume=False, csv_parser='pandas', remap_ids=False):
+    """Imports data from a CSV or Parquet file to the specified database table after cleaning.
+
+    If chunk_size is given, the file is read, cleaned and loaded chunk_size rows at a time,
+    keeping memory use flat regardless of the file size.
+    if_exists decides what happens when the table already has data: 'ask' prompts the user,
+    'append' keeps the existing rows and skips duplicates, 'truncate' clears the table first,
+    'sync' inserts new rows and updates changed ones, matched on key_columns (default NATURAL_KEYS).
+    dry_run reads and cleans the file without touching the database.
+    file_format is 'csv' or 'parquet'; by default it is decided by the file extension.
+    workers > 1 cleans large files (or chunks) on that many processes.
+    pipeline (with chunk_size) reads, cleans and loads on separate threads connected by bounded
+    queues, so the next chunks are parsed and cleaned while the current one is being written.
+    resume (with chunk_size) commits every chunk together with its progress in CHECKPOINT_TABLE
+    (mirrored to a checkpoint file next to the source file); running the same import again
+    continues after the last committed chunk, appending to the table whatever if_exists says.
+    csv_parser 'arrow' parses CSV files with Arrow's multithreaded reader (needs pyarrow); the
+    cleaned data is the same as with the default 'pandas'.
+    remap_ids keeps parent and child files linked although the database assigns new keys: the
+    file's ids of a referenced table are recorded against the ids given to the inserted rows,
+    and foreign keys of later imports (in this process) that reference it are rewritten to the
+    new ids; a reference to an id that was not imported is kept as it is and checked against
+    the referenced table like any other. The mappings live in memory only, so remap_ids cannot
+    be combined with resume.
+    """
+    if if_exists not in IF_EXISTS_POLICIES:
+        print(f"未知的導入策略: {if_exists}")
+        return False
+    if resume and not chunk_size:
+        print("可續傳導入需要指定 chunk_size (每次提交的行數)。")
+        return False
+    if resume and remap_ids:
+        print("id 對應只保存在記憶體中，續傳時之前已提交的記錄沒有對應；remap_ids 不能與 resume 一併使用。")
+        return False
+    if csv_parser not in CSV_PARSERS:
+        print(f"未知的 CSV 解析器: {csv_parser}")
+        return False
+    if if_exists == 'sync':
+        key_columns = key_columns or NATURAL_KEYS.get(table_name)
+        if not key_columns:
+            print(f"表格 '{table_name}' 未定義自然鍵，同步模式需要指定 key_columns。")
+            return False
+    metrics = OperationMetrics('import', table=table_name, file=csv_file, chunk_size=chunk_size,
+                               if_exists=if_exists, dry_run=dry_run, workers=workers, pipeline=pipeline,
+                               resume=resume, csv_parser=csv_parser, remap_ids=remap_ids)
+    success = _import_file(csv_file, table_name, chunk_size, if_exists, dry_run, key_columns, file_format, workers,
+                           bool(pipeline and chunk_size), resume, csv_parser, remap_ids, metrics)
+    metrics.finish(success)
+    return success
+
+def _import_file(csv_file, table_name, chunk_size, if_exists, dry_run, key_columns, file_format, workers, pipeline,
+                 resume, csv_parser, remap_ids, metrics):
+    """Reads, cleans and loads the file for import_csv_to_db; returns True on success."""
+    try:
+        schema, recorded = None, None
+        if not dry_run:
+            # 先讀取表格結構，讀取文件時只保留表格擁有的欄位
+            with db_connection() as conn:
+                if not conn:
+                    print("數據庫連接失敗。")
+                    return False
+                with conn.cursor() as cursor:
+                    schema = get_table_schema(cursor, table_name)
+                if schema is not None and resume:
+                    recorded = _recorded_checkpoint(conn, csv_file, table_name)
+            if schema is None:
+                print(f"表格 '{table_name}' 不存在。")
+                return False
+        checkpoint = None
+        if resume and not dry_run:
+            checkpoint = _load_checkpoint(recorded, _file_sha256(csv_file), table_name, chunk_size)
+        committed_chunks = checkpoint['chunks'] if checkpoint else 0
+        cleaned_chunks = _iter_cleaned_chunks(csv_file, table_name, chunk_size, metrics,
+                                              _file_format(csv_file, file_format), workers, schema, pipeline,
+                                              committed_chunks, csv_parser)
+        if pipeline:
+            # 寫入當前區塊時，背景線程繼續讀取及清洗後續區塊
+            cleaned_chunks = _pipelined(cleaned_chunks, 'cleaner')
+        with closing(cleaned_chunks):
+            df_cleaned = None
+            for chunk in cleaned_chunks:
+                if not chunk.empty:
+                    df_cleaned = chunk
+                    break
+                if checkpoint is not None:
+                    checkpoint['chunks'] += 1 # 清洗後為空的區塊沒有需要提交的數據
+
+            if df_cleaned is None:
+                if committed_chunks:
+                    # 上次導入在提交最後一個區塊後中斷
+                    with db_connection() as conn:
+                        if not conn:
+                            print("數據庫連接失敗。")
+                            return False
+                        with conn.cursor() as cursor:
+                            _forget_checkpoint(cursor, csv_file, table_name)
+                        conn.commit()
+                    if os.path.exists(_checkpoint_file(csv_file)):
+                        os.remove(_checkpoint_file(csv_file))
+                    print(f"CSV 文件 '{csv_file}' 的所有區塊已導入到表格 '{table_name}'。")
+                    return True
+                if metrics.rows('read') == 0:
+                    print(f"CSV 文件 '{csv_file}' 為空，無法導入。")
+                else:
+                    print(f"數據清洗後，CSV 文件 '{csv_file}' 無有效數據可導入到表格 '{table_name}'。")
+                return False
+
+            if dry_run:
+                for _ in cleaned_chunks:
+                    pass
+                print(f"試運行：CSV 文件 '{csv_file}' 共讀取 {metrics.rows('read')} 筆記錄，清洗後剩餘 {metrics.rows('clean')} 筆，未寫入表格 '{table_name}'。")
+                return True
+
+            with db_connection() as conn:
+                if not conn:
+                    print("數據庫連接失敗。")
+                    return False
+                with conn.cursor() as cursor:
+                    return _load_cleaned_chunks(conn, cursor, csv_file, table_name, df_cleaned, cleaned_chunks, metrics,
+                                                if_exists, key_columns, checkpoint, remap_ids)
     except FileNotFoundError:
         print(f"錯誤：CSV 文件 '{csv_file}' 未找到。")
         return False
@@ -98,128 +1156,895 @@ def import_csv_to_db(csv_file, table_name):
         return False
     except Exception as e:
         print(f"導入 CSV 文件 '{csv_file}' 到表格 '{table_name}' 時發生錯誤: {e}")
-        if 'conn' in locals() and conn:
-            conn.rollback() # Rollback on error
-        return False
-    finally:
-        if 'cursor' in locals() and cursor:
-            cursor.close()
-        if 'conn' in locals() and conn:
-            conn.close()
-
-def export_db_to_csv(table_name, csv_file):
-    """Exports data from the specified database table to a CSV file."""
-    conn = None
+        return False # 未提交的事務在連接歸還連接池時回滾
+
+def _export_column_profile(cursor, table_name, where=None, params=None, group_by=None):
+    """Returns per-column adjustments that make chunked exports format like a whole-table DataFrame.
+
+    pandas decides some formats from the whole column: nullable integer columns become float64
+    only if a NULL is present, and naive timestamps share one precision. These are looked up
+    with a single aggregate query (over the rows matching where, if given) so each chunk can be
+    written the same way. With group_by, the same query is grouped by that column and returns
+    {value: profile} for every value it holds, e.g. one profile per partition file.
+    """
+    schema = get_table_schema(cursor, table_name)
+    if schema is None:
+        return {}
+    int_columns = [col for col in schema.columns_of_type('smallint', 'integer', 'bigint') if schema.columns[col].nullable]
+    timestamp_columns = schema.columns_of_type('timestamp without time zone')
+    if not int_columns and not timestamp_columns and group_by is None:
+        return {}
+
+    checks = []
+    for col in int_columns:
+        checks.append(sql.SQL("bool_or({c} IS NULL)").format(c=sql.Identifier(col)))
+    for col in timestamp_columns:
+        c = sql.Identifier(col)
+        checks.append(sql.SQL("bool_and({c} = date_trunc('day', {c}))").format(c=c))
+        # 用 mod() 而非 %，查詢帶參數時 % 會被當作佔位符
+        checks.append(sql.SQL("bool_or(mod(date_part('microseconds', {c})::bigint, 1000) <> 0)").format(c=c))
+        checks.append(sql.SQL("bool_or(mod(date_part('microseconds', {c})::bigint, 1000000) <> 0)").format(c=c))
+    table, where = sql.Identifier(table_name), where or sql.SQL('')
+    if group_by is None:
+        cursor.execute(sql.SQL("SELECT {checks} FROM {table} {where}").format(
+            checks=sql.SQL(', ').join(checks), table=table, where=where), params)
+        rows = [(None,) + tuple(cursor.fetchone())]
+    else:
+        col = sql.Identifier(group_by)
+        cursor.execute(sql.SQL("SELECT {columns} FROM {table} {where} GROUP BY {col}").format(
+            columns=sql.SQL(', ').join([col] + checks), table=table, where=where, col=col), params)
+        rows = cursor.fetchall()
+
+    profiles = {}
+    for row in rows:
+        flags = iter(row[1:])
+        profile = profiles[row[0]] = {}
+        for col in int_columns:
+            if next(flags):
+                profile[col] = 'float'
+        for col in timestamp_columns:
+            dates_only, has_us, has_ms = next(flags), next(flags), next(flags)
+            if dates_only:
+                profile[col] = 'date'
+            elif has_us:
+                profile[col] = 'us'
+            elif has_ms:
+                profile[col] = 'ms'
+            else:
+                profile[col] = 's'
+    return profiles if group_by is not None else profiles[None]
+
+def _rows_to_frame(rows, columns, profile):
+    """Builds a DataFrame from fetched rows the same way pd.read_sql_query does, then applies the column profile."""
+    df = pd.DataFrame.from_records(rows, columns=columns, coerce_float=True)
+    for col in df.columns:
+        if isinstance(df[col].dtype, pd.DatetimeTZDtype):
+            df[col] = pd.to_datetime(df[col], utc=True)
+
+    for col, kind in profile.items():
+        if col not in df.columns:
+            continue
+        if kind == 'float':
+            df[col] = df[col].astype('float64')
+        elif df[col].notna().any():
+            values = pd.to_datetime(df[col])
+            if kind == 'date':
+                df[col] = values.dt.strftime('%Y-%m-%d')
+            elif kind == 'us':
+                df[col] = values.dt.strftime('%Y-%m-%d %H:%M:%S.%f')
+            elif kind == 'ms':
+                df[col] = values.dt.strftime('%Y-%m-%d %H:%M:%S.%f').str[:-3]
+            else:
+                df[col] = values.dt.strftime('%Y-%m-%d %H:%M:%S')
+    return df
+
+class _ExportFile:
+    """One CSV or Parquet file written from fetched rows; it only appears under its name on finish().
+
+    A CSV file gets the header row and BOM unless header is False (ready to be appended), and
+    its rows are formatted with the column profile (see _export_column_profile). A Parquet file
+    is written one row group per batch, with a schema mapped from the column types.
+    """
+
+    def __init__(self, path, file_format, description, profile=None, header=True):
+        self.path = path
+        self.temp_file = f"{path}.part"
+        self.rows = 0
+        self._columns = [column[0] for column in description]
+        self._profile = profile or {}
+        self._header = header
+        self._file = self._parquet = None
+        if file_format == 'parquet':
+            self._pa, pq = _import_pyarrow()
+            fields, self._converters = zip(*(_arrow_field(self._pa, column) for column in description))
+            self._schema = self._pa.schema(fields)
+            self._parquet = pq.ParquetWriter(self.temp_file, self._schema, compression=PARQUET_COMPRESSION)
+        else:
+            # 與 df.to_csv(..., encoding='utf-8-sig') 相同：檔首寫入 BOM，不轉換換行符
+            self._file = open(self.temp_file, 'w', encoding='utf-8-sig' if header else 'utf-8', newline='')
+
+    def write(self, rows):
+        """Appends a batch of fetched rows."""
+        if self._parquet is not None:
+            self._parquet.write_table(_rows_to_arrow(self._pa, rows, self._schema, self._converters))
+        else:
+            _rows_to_frame(rows, self._columns, self._profile).to_csv(self._file, index=False, header=self._header)
+            self._header = False
+        self.rows += len(rows)
+
+    def _close(self):
+        if self._parquet is not None:
+            self._parquet.close()
+        if self._file is not None:
+            self._file.close()
+        self._file = self._parquet = None
+
+    def finish(self):
+        """Closes the file and moves it into place."""
+        self._close()
+        os.replace(self.temp_file, self.path)
+
+    def discard(self):
+        """Closes and removes an unfinished file; does nothing after finish()."""
+        self._close()
+        if os.path.exists(self.temp_file):
+            os.remove(self.temp_file)
+
+def _stream_query(conn, query, path, file_format, params=None, profile=None, header=True):
+    """Streams the rows of a query into one _ExportFile through a server-side cursor.
+
+    The file is only created if the query returns rows; returns the number of rows written.
+    """
+    # 具名游標會在伺服器端保存結果集，每次只取回一批數據
+    with conn.cursor(name='csv_toolkit_export') as cursor:
+        cursor.itersize = EXPORT_FETCH_SIZE
+        cursor.execute(query, params)
+        rows = cursor.fetchmany(EXPORT_FETCH_SIZE)
+        if not rows:
+            return 0
+        output = _ExportFile(path, file_format, cursor.description, profile, header)
+        try:
+            while rows:
+                output.write(rows)
+                rows = cursor.fetchmany(EXPORT_FETCH_SIZE)
+            output.finish()
+        finally:
+            output.discard()
+    return output.rows
+
+def _stream_query_to_csv(conn, query, csv_file, profile, params=None, header=True):
+    """Streams the rows of a query into a CSV file through a server-side cursor.
+
+    The file is only created if the query returns rows; returns the number of rows written.
+    With header=False the file gets neither the header row nor the BOM, ready to be appended.
+    """
+    return _stream_query(conn, query, csv_file, 'csv', params, profile, header)
+
+def _stream_partitions(conn, query, csv_file, file_format, profiles, params=None):
+    """Streams a query into one file per partition (see _partition_file) in a single pass.
+
+    The query's first column is the partition value and its rows are sorted by it; the value is
+    not written, and the output moves on to the next file whenever it changes. profiles maps
+    each value to the column profile of its CSV file. Returns [(path, rows written)].
+    """
+    written, output, current = [], None, None
+    with conn.cursor(name='csv_toolkit_export') as cursor:
+        cursor.itersize = EXPORT_FETCH_SIZE
+        cursor.execute(query, params)
+        description = cursor.description[1:]
+        try:
+            rows = cursor.fetchmany(EXPORT_FETCH_SIZE)
+            while rows:
+                for value, group in itertools.groupby(rows, key=lambda row: row[0]):
+                    # NaN 與自身不相等，但屬於同一分區
+                    if output is None or not (value == current or (value != value and current != current)):
+                        if output is not None:
+                            output.finish()
+                            written.append((output.path, output.rows))
+                        current = value
+                        output = _ExportFile(_partition_file(csv_file, value), file_format, description,
+                                             profiles.get(value))
+                    output.write([row[1:] for row in group])
+                rows = cursor.fetchmany(EXPORT_FETCH_SIZE)
+            if output is not None:
+                output.finish()
+                written.append((output.path, output.rows))
+        finally:
+            if output is not None:
+                output.discard()
+    return written
+
+def _json_text(value):
+    """Converts a value Parquet has no matching type for to text; json/jsonb values are serialised as JSON."""
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, ensure_ascii=False)
+    return str(value)
+
+def _arrow_field(pa, column):
+    """Maps a cursor.description column to (Arrow field, value converter or None).
+
+    PostgreSQL types with a Parquet equivalent keep their type (and numeric precision/scale);
+    anything else is stored as text.
+    """
+    types = {
+        16: pa.bool_(), 20: pa.int64(), 21: pa.int16(), 23: pa.int32(),
+        700: pa.float32(), 701: pa.float64(), 25: pa.string(), 1042: pa.string(), 1043: pa.string(),
+        1082: pa.date32(), 1083: pa.time64('us'), 1114: pa.timestamp('us'),
+        1184: pa.timestamp('us', tz='UTC'), 1186: pa.duration('us'),
+    }
+    converter = None
+    if column.type_code in types:
+        arrow_type = types[column.type_code]
+    elif column.type_code == 1700 and column.precision is not None and 0 < column.precision <= 38:
+        arrow_type = pa.decimal128(column.precision, column.scale or 0)
+    elif column.type_code == 1700:
+        # 未限定精度的 numeric 沒有對應的定點類型
+        arrow_type, converter = pa.float64(), float
+    elif column.type_code == 17:
+        arrow_type, converter = pa.binary(), bytes
+    else:
+        arrow_type, converter = pa.string(), _json_text
+    return pa.field(column.name, arrow_type), converter
+
+def _rows_to_arrow(pa, rows, schema, converters):
+    """Builds an Arrow table with the given schema from fetched rows."""
+    arrays = []
+    for index, (field, converter) in enumerate(zip(schema, converters)):
+        values = [row[index] for row in rows]
+        if converter is not None:
+            values = [None if value is None else converter(value) for value in values]
+        arrays.append(pa.array(values, type=field.type))
+    return pa.Table.from_arrays(arrays, schema=schema)
+
+def _stream_query_to_parquet(conn, query, parquet_file, params=None):
+    """Streams the rows of a query into a compressed Parquet file through a server-side cursor.
+
+    Every batch of EXPORT_FETCH_SIZE rows becomes one row group written with a schema mapped
+    from the column types, so types survive the round trip. The file is only created if the
+    query returns rows; returns the number of rows written.
+    """
+    return _stream_query(conn, query, parquet_file, 'parquet', params)
+
+def _export_condition(schema, column, operator, value):
+    """Compiles one structured filter (column, operator, value) into an SQL condition and its params.
+
+    Only columns of the table and EXPORT_FILTER_OPERATORS are accepted; values are always sent
+    as query parameters, never spliced into the SQL text.
+    """
+    if column not in schema.columns:
+        raise ValueError(f"表格 '{schema.name}' 沒有欄位 '{column}'。")
+    operator = ' '.join(str(operator).lower().split())
+    if operator not in EXPORT_FILTER_OPERATORS:
+        raise ValueError(f"不支援的篩選運算符 '{operator}'，可用: {', '.join(EXPORT_FILTER_OPERATORS)}")
+    col = sql.Identifier(column)
+    if operator in ('is null', 'is not null'):
+        return sql.SQL("{col} " + operator.upper()).format(col=col), []
+    if operator in ('in', 'not in'):
+        values = list(value) if isinstance(value, (list, tuple, set)) else [value]
+        data_type = schema.columns[column].data_type
+        if data_type in ('USER-DEFINED', 'ARRAY'):
+            # 枚舉等類型沒有可直接引用的類型名稱，改以文字比較
+            col, data_type = sql.SQL("{col}::text").format(col=col), 'text'
+        template = "{col} = ANY(%s::{type}[])" if operator == 'in' else "{col} <> ALL(%s::{type}[])"
+        return sql.SQL(template).format(col=col, type=sql.SQL(data_type)), [values]
+    operator = '<>' if operator == '!=' else operator.upper()
+    return sql.SQL("{col} " + operator + " %s").format(col=col), [value]
+
+def _where_clause(conditions):
+    """Joins SQL conditions into a WHERE clause (an empty fragment if there are none)."""
+    if not conditions:
+        return sql.SQL('')
+    return sql.SQL("WHERE ") + sql.SQL(" AND ").join(conditions)
+
+def _export_select(schema, columns=None, order_by=None, partition_by=None):
+    """Returns the projected column list and ORDER BY clause of an export, checking every column name.
+
+    order_by lists column names; a leading '-' sorts that column in descending order. With
+    partition_by, the rows are sorted by that column first.
+    """
+    names = list(columns or [])
+    sort_keys = [(key[1:], True) if key.startswith('-') else (key, False) for key in order_by or []]
+    if partition_by is not None:
+        sort_keys.insert(0, (partition_by, False))
+    unknown = [name for name in names + [key for key, _ in sort_keys] if name not in schema.columns]
+    if unknown:
+        raise ValueError(f"表格 '{schema.name}' 沒有以下欄位: {', '.join(dict.fromkeys(unknown))}")
+    select = sql.SQL(', ').join(map(sql.Identifier, names)) if names else sql.SQL('*')
+    if not sort_keys:
+        return select, sql.SQL('')
+    order = sql.SQL(', ').join(sql.SQL("{col} DESC" if desc else "{col}").format(col=sql.Identifier(key))
+                               for key, desc in sort_keys)
+    return select, sql.SQL("ORDER BY ") + order
+
+def _partition_file(csv_file, value):
+    """Returns the output file of one partition: the value, made safe for a file name, after the stem."""
+    stem, ext = os.path.splitext(csv_file)
+    label = PARTITION_NULL_LABEL if value is None else re.sub(r'[^\w.-]+', '_', str(value)).strip('._') or '_'
+    return f"{stem}_{label}{ext}"
+
+def export_db_to_csv(table_name, csv_file, file_format=None, columns=None, filters=None, order_by=None,
+                     partition_by=None):
+    """Exports data from the specified database table to a CSV or Parquet file.
+
+    Rows are streamed through a server-side cursor and written EXPORT_FETCH_SIZE rows at a
+    time, so client memory stays constant regardless of the table size. file_format is 'csv'
+    or 'parquet'; by default it is decided by the file extension.
+
+    columns limits the export to those columns (in that order), filters is a list of
+    (column, operator, value) predicates that must all hold, e.g. [('is_published', '=', True)],
+    and order_by lists the sort columns ('-column' for descending). All of them are applied by
+    the database. With partition_by, one file per distinct value of that column is written,
+    named <stem>_<value><ext>, all from the same snapshot of the table and in a single query
+    sorted by that column.
+    """
+    metrics = OperationMetrics('export', table=table_name, file=csv_file)
+    success = _export_table(table_name, csv_file, file_format, metrics, columns, filters, order_by, partition_by)
+    metrics.finish(success)
+    return success
+
+def _export_table(table_name, csv_file, file_format, metrics, columns=None, filters=None, order_by=None,
+                  partition_by=None):
+    """Writes the table to the file(s) for export_db_to_csv; returns True on success."""
     try:
-        conn = connect_db()
-        if not conn:
-            print("數據庫連接失敗。")
-            return False
+        file_format = _file_format(csv_file, file_format)
+        with db_connection() as conn:
+            if not conn:
+                print("數據庫連接失敗。")
+                return False
+
+            with conn.cursor() as cursor:
+                if partition_by is not None:
+                    # 各分區文件須來自同一份數據快照
+                    _begin_snapshot(cursor)
+                schema = get_table_schema(cursor, table_name)
+                if schema is None:
+                    print(f"表格 '{table_name}' 不存在。")
+                    return False
+                select, order = _export_select(schema, columns, order_by, partition_by)
+                conditions, params = [], []
+                for column, operator, value in filters or []:
+                    condition, values = _export_condition(schema, column, operator, value)
+                    conditions.append(condition)
+                    params.extend(values)
+                where, params = _where_clause(conditions), params or None
+
+                if partition_by is not None:
+                    # 一次查詢取得所有分區值及各分區的欄位格式，之後只掃描表格一次
+                    with metrics.stage('profile'):
+                        profiles = _export_column_profile(cursor, table_name, where, params, group_by=partition_by)
+                    paths = [_partition_file(csv_file, value) for value in profiles]
+                    clashes = sorted({path for path in paths if paths.count(path) > 1})
+                    if clashes:
+                        raise ValueError(f"不同的 '{partition_by}' 值對應到相同的文件名: {', '.join(clashes)}")
+                elif file_format == 'csv':
+                    with metrics.stage('profile'):
+                        profile = _export_column_profile(cursor, table_name, where, params)
 
-        query = f"SELECT * FROM {table_name}"
-        df = pd.read_sql_query(query, conn)
+            if partition_by is not None:
+                query = sql.SQL("SELECT {partition}, {select} FROM {table} {where} {order}").format(
+                    partition=sql.Identifier(partition_by), select=select, table=sql.Identifier(table_name),
+                    where=where, order=order)
+                with metrics.stage('export') as stage:
+                    written = _stream_partitions(conn, query, csv_file, file_format, profiles, params)
+                    stage.rows_out = sum(row_count for _, row_count in written)
+            else:
+                query = sql.SQL("SELECT {select} FROM {table} {where} {order}").format(
+                    select=select, table=sql.Identifier(table_name), where=where, order=order)
+                with metrics.stage('export') as stage:
+                    if file_format == 'parquet':
+                        row_count = _stream_query_to_parquet(conn, query, csv_file, params)
+                    else:
+                        row_count = _stream_query_to_csv(conn, query, csv_file, profile, params)
+                    stage.rows_out = row_count
+                written = [(csv_file, row_count)] if row_count else []
 
-        if df.empty:
+        if not written:
             print(f"表格 '{table_name}' 中沒有數據可供導出。")
             return False # Indicate no data to export, but not necessarily an error
+        if partition_by is None:
+            print(f"表格 '{table_name}' 的數據已成功導出到 '{csv_file}'。")
+        else:
+            print(f"表格 '{table_name}' 的數據已按 '{partition_by}' 分區導出到 {len(written)} 個文件:")
+            for path, row_count in written:
+                print(f"  {path}: {row_count} 行")
+        return True
+    except Exception as e:
+        print(f"導出表格 '{table_name}' 到 '{csv_file}' 時發生錯誤: {e}")
+        return False
+
+def _watermark_expression(cursor, table_name):
+    """Returns (label, SQL expression) of the incremental export watermark, or None if the table has none.
+
+    The watermark is the later of the table's edit column and creation column (the first of
+    WATERMARK_EDIT_COLUMNS and WATERMARK_CREATE_COLUMNS that exists), so both new and edited
+    rows move past it. If either is a date, both are compared as dates.
+    """
+    schema = get_table_schema(cursor, table_name)
+    if schema is None:
+        return None
+    columns = []
+    for group in (WATERMARK_EDIT_COLUMNS, WATERMARK_CREATE_COLUMNS):
+        found = [col for col in group if col in schema.columns]
+        if found:
+            columns.append(found[0])
+    if not columns:
+        return None
+    by_date = any(schema.columns[col].data_type == 'date' for col in columns)
+    terms = [sql.SQL("{col}::date" if by_date else "{col}").format(col=sql.Identifier(col)) for col in columns]
+    if len(terms) == 1:
+        return columns[0], terms[0]
+    return f"greatest({', '.join(columns)})", sql.SQL("greatest({terms})").format(terms=sql.SQL(', ').join(terms))
+
+def _load_watermarks(store_path):
+    """Reads the watermark store, returning an empty dict if it does not exist yet."""
+    if not os.path.exists(store_path):
+        return {}
+    with open(store_path, encoding='utf-8') as f:
+        return json.load(f)
+
+def _save_watermarks(store_path, watermarks):
+    """Writes the watermark store atomically (temporary file + rename)."""
+    temp_file = f"{store_path}.part"
+    with open(temp_file, 'w', encoding='utf-8') as f:
+        json.dump(watermarks, f, ensure_ascii=False, indent=2)
+    os.replace(temp_file, store_path)
+
+def _append_file(source, target):
+    """Appends source to target, restoring target's original length if the copy fails."""
+    original_size = os.path.getsize(target)
+    try:
+        with open(source, 'rb') as src, open(target, 'ab') as dst:
+            shutil.copyfileobj(src, dst)
+    except Exception:
+        with open(target, 'ab') as dst:
+            dst.truncate(original_size)
+        raise
+
+def export_incremental(table_name, csv_file, mode='append'):
+    """Exports only the rows changed since the previous incremental export of the table.
+
+    The watermark is the largest value of the table's watermark expression (see
+    _watermark_expression) already exported; it is kept per table in WATERMARK_FILE next to
+    csv_file and only advanced once the rows have been written. Rows at the watermark are
+    selected again (>=) because a date cannot tell apart changes later on the same day; the
+    store keeps the md5 of the rows exported at the watermark so unchanged ones are skipped.
+    mode='append' appends the new rows to csv_file (creating it with a header on the first run;
+    an existing file without a stored watermark is refused, since the full export would
+    duplicate its rows); mode='delta' writes them to a new timestamped file beside csv_file.
+    Rows whose watermark is NULL are only included in the first export.
+    """
+    if mode not in ('append', 'delta'):
+        print(f"未知的增量導出模式: {mode}")
+        return False
+    if _file_format(csv_file) != 'csv':
+        print("增量導出只支援 CSV 文件。")
+        return False
+    metrics = OperationMetrics('export_incremental', table=table_name, file=csv_file, mode=mode)
+    success = _export_incremental(table_name, csv_file, mode, metrics)
+    metrics.finish(success)
+    return success
 
-        df.to_csv(csv_file, index=False, encoding='utf-8-sig') # Added encoding for better compatibility
-        print(f"表格 '{table_name}' 的數據已成功導出到 '{csv_file}'。")
+def _export_incremental(table_name, csv_file, mode, metrics):
+    """Exports the rows past the stored watermark for export_incremental; returns True on success."""
+    store_path = os.path.join(os.path.dirname(os.path.abspath(csv_file)), WATERMARK_FILE)
+    try:
+        watermarks = _load_watermarks(store_path)
+        with db_connection() as conn:
+            if not conn:
+                print("數據庫連接失敗。")
+                return False
+
+            with conn.cursor() as cursor:
+                # 最大值查詢與導出查詢須看到同一份數據快照
+                cursor.execute("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ")
+                watermark = _watermark_expression(cursor, table_name)
+                if watermark is None:
+                    columns = ', '.join(WATERMARK_EDIT_COLUMNS + WATERMARK_CREATE_COLUMNS)
+                    print(f"表格 '{table_name}' 沒有可用作水位線的欄位 ({columns})。")
+                    return False
+                column, expression = watermark
+                table = sql.Identifier(table_name)
+                # 整行內容的雜湊值，用來辨認水位線當天已導出且沒有變更的行
+                row_hash = sql.SQL("md5({table}::text)").format(table=table)
+                previous = watermarks.get(table_name)
+                last_value = previous['value'] if previous and previous['column'] == column else None
+                if last_value is None:
+                    if mode == 'append' and os.path.exists(csv_file):
+                        print(f"文件 '{csv_file}' 已存在，但沒有表格 '{table_name}' ({column}) 的水位線記錄；"
+                              f"追加完整導出會令數據重複。請改用 delta 模式或先移走該文件。")
+                        return False
+                    where, params = sql.SQL(''), None
+                else:
+                    where = sql.SQL("WHERE {expr} >= %s AND NOT ({expr} = %s AND {row_hash} = ANY(%s))").format(
+                        expr=expression, row_hash=row_hash)
+                    params = (last_value, last_value, previous.get('boundary', []))
+
+                with metrics.stage('profile'):
+                    cursor.execute(sql.SQL("SELECT max({expr}) FROM {table} {where}").format(
+                        expr=expression, table=table, where=where), params)
+                    new_value = cursor.fetchone()[0]
+                    if new_value is None:
+                        print(f"表格 '{table_name}' 自上次導出 ({column} >= {last_value}) 後沒有新數據。")
+                        return True
+                    profile = _export_column_profile(cursor, table_name, where, params)
+                    cursor.execute(sql.SQL("SELECT {row_hash} FROM {table} WHERE {expr} = %s").format(
+                        row_hash=row_hash, table=table, expr=expression), (new_value,))
+                    boundary = sorted(row[0] for row in cursor.fetchall())
+
+            query = sql.SQL("SELECT * FROM {table} {where} ORDER BY {expr}").format(
+                table=table, where=where, expr=expression)
+            with metrics.stage('export') as stage:
+                if mode == 'delta':
+                    stem, ext = os.path.splitext(csv_file)
+                    output_file = f"{stem}_{datetime.now().strftime('%Y%m%d%H%M%S')}{ext or '.csv'}"
+                    row_count = _stream_query_to_csv(conn, query, output_file, profile, params)
+                elif not os.path.exists(csv_file):
+                    output_file = csv_file
+                    row_count = _stream_query_to_csv(conn, query, output_file, profile, params)
+                else:
+                    output_file = csv_file
+                    delta_file = f"{csv_file}.delta"
+                    row_count = _stream_query_to_csv(conn, query, delta_file, profile, params, header=False)
+                    try:
+                        _append_file(delta_file, csv_file)
+                    finally:
+                        if os.path.exists(delta_file):
+                            os.remove(delta_file)
+                stage.rows_out = row_count
+
+        watermarks[table_name] = {'column': column, 'value': new_value.isoformat(), 'boundary': boundary,
+                                  'exported_at': datetime.now().isoformat(timespec='seconds')}
+        _save_watermarks(store_path, watermarks)
+        print(f"表格 '{table_name}' 的 {row_count} 筆新數據已導出到 '{output_file}'，水位線更新為 {column} = {new_value}。")
         return True
     except Exception as e:
-        print(f"導出表格 '{table_name}' 到 CSV 時發生錯誤: {e}")
+        print(f"增量導出表格 '{table_name}' 時發生錯誤: {e}")
         return False
+
+def _file_sha256(path):
+    """Returns the SHA-256 hex digest of a file, read in 1 MiB blocks."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(2**20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def _begin_snapshot(cursor, snapshot_id=None):
+    """Starts a read-only REPEATABLE READ transaction, importing snapshot_id if given.
+
+    Must run before any other statement of the transaction; the settings only apply to this
+    transaction, so the pooled connection is left as it was.
+    """
+    cursor.execute("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ READ ONLY")
+    if snapshot_id is not None:
+        cursor.execute("SET TRANSACTION SNAPSHOT %s", (snapshot_id,))
+
+def _write_empty_table(cursor, table_name, path, file_format):
+    """Writes a file holding only the table's columns (header row or Parquet schema)."""
+    cursor.execute(sql.SQL("SELECT * FROM {table} LIMIT 0").format(table=sql.Identifier(table_name)))
+    if file_format == 'parquet':
+        pa, pq = _import_pyarrow()
+        schema = pa.schema([_arrow_field(pa, column)[0] for column in cursor.description])
+        pq.write_table(schema.empty_table(), path, compression=PARQUET_COMPRESSION)
+    else:
+        pd.DataFrame(columns=[column.name for column in cursor.description]).to_csv(path, index=False, encoding='utf-8-sig')
+
+def _snapshot_table(table_name, path, file_format, snapshot_id, metrics):
+    """Exports one table inside the shared snapshot for snapshot_export; returns its row count."""
+    with db_connection() as conn:
+        if not conn:
+            raise ConnectionError("數據庫連接失敗")
+        with conn.cursor() as cursor:
+            _begin_snapshot(cursor, snapshot_id)
+        query = sql.SQL("SELECT * FROM {table}").format(table=sql.Identifier(table_name))
+        with metrics.stage('export') as stage:
+            if file_format == 'parquet':
+                row_count = _stream_query_to_parquet(conn, query, path)
+            else:
+                with conn.cursor() as cursor:
+                    profile = _export_column_profile(cursor, table_name)
+                row_count = _stream_query_to_csv(conn, query, path, profile)
+            if row_count == 0:
+                with conn.cursor() as cursor:
+                    _write_empty_table(cursor, table_name, path, file_format)
+            stage.rows_out = row_count
+    return row_count
+
+def snapshot_export(archive_dir=None, tables=None, file_format='csv', max_workers=None):
+    """Exports several tables (default MANAGED_TABLES) as one consistent point-in-time backup.
+
+    A coordinating connection exports a REPEATABLE READ snapshot with pg_export_snapshot() and
+    keeps it open while worker connections, one per table on a thread pool, import it, so every
+    file sees the database as of the same moment. The files are written to archive_dir (default
+    snapshot_<timestamp>) together with SNAPSHOT_MANIFEST, which lists each file's row count,
+    size and SHA-256 checksum. The directory only appears once every table has been exported.
+    Returns the archive directory, or None on failure.
+    """
+    tables = list(tables or MANAGED_TABLES)
+    if file_format not in FILE_FORMATS:
+        print(f"未知的文件格式: {file_format}")
+        return None
+    if POOL_Config['maxconn'] < 2:
+        print("快照導出至少需要 2 個數據庫連接，請調高 DB_POOL_MAX。")
+        return None
+    archive_dir = archive_dir or f"snapshot_{datetime.now().strftime('%Y%m%d%H%M%S')}"
+    if os.path.exists(archive_dir):
+        print(f"目錄 '{archive_dir}' 已存在，請指定新的快照目錄。")
+        return None
+    temp_dir = f"{archive_dir}.part"
+    extension = '.parquet' if file_format == 'parquet' else '.csv'
+    # 協調連接佔用一個連接，其餘留給導出執行緒
+    max_workers = max_workers or min(len(tables), POOL_Config['maxconn'] - 1)
+    metrics = OperationMetrics('snapshot', archive=archive_dir, tables=len(tables), file_format=file_format)
+    success = False
+    try:
+        with db_connection() as conn:
+            if not conn:
+                print("數據庫連接失敗。")
+                return None
+            with conn.cursor() as cursor:
+                _begin_snapshot(cursor)
+                cursor.execute("SELECT pg_export_snapshot(), now()")
+                snapshot_id, snapshot_time = cursor.fetchone()
+                cursor.execute("SELECT table_name FROM information_schema.tables WHERE table_name = ANY(%s)", (tables,))
+                existing = {row[0] for row in cursor.fetchall()}
+            missing = [table for table in tables if table not in existing]
+            if missing:
+                print(f"表格 {', '.join(missing)} 不存在，無法建立快照。")
+                return None
+
+            shutil.rmtree(temp_dir, ignore_errors=True)
+            os.makedirs(temp_dir)
+            files = {table: f"{table}{extension}" for table in tables}
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                futures = {table: executor.submit(_snapshot_table, table, os.path.join(temp_dir, files[table]),
+                                                  file_format, snapshot_id, metrics)
+                           for table in tables}
+                row_counts = {table: future.result() for table, future in futures.items()}
+            # 所有工作連接都已完成導出，快照可以隨協調事務結束
+
+        manifest = {
+            'created_at': datetime.now().isoformat(timespec='seconds'),
+            'snapshot_time': snapshot_time.isoformat(),
+            'format': file_format,
+            'tables': [
+                {'table': table, 'file': files[table], 'rows': row_counts[table],
+                 'bytes': os.path.getsize(os.path.join(temp_dir, files[table])),
+                 'sha256': _file_sha256(os.path.join(temp_dir, files[table]))}
+                for table in tables
+            ],
+        }
+        with open(os.path.join(temp_dir, SNAPSHOT_MANIFEST), 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=2)
+        os.replace(temp_dir, archive_dir)
+        success = True
+        print(f"已在同一快照中導出 {len(tables)} 個表格 (共 {sum(row_counts.values())} 筆記錄) 到 '{archive_dir}'。")
+        return archive_dir
+    except Exception as e:
+        print(f"建立快照 '{archive_dir}' 時發生錯誤: {e}")
+        return None
     finally:
-        if conn:
-            conn.close()
+        shutil.rmtree(temp_dir, ignore_errors=True)
+        metrics.finish(success)
+
+def _to_nullable_int(series):
+    """Converts a column to nullable Int64, truncating like int() and mapping invalid values to <NA>."""
+    values = pd.to_numeric(series, errors='coerce')
+    return pd.Series(np.trunc(values), index=series.index).astype('Int64')
 
-def clean_data_for_table(df, table_name):
-    """Cleans the DataFrame based on the target table name."""
-    df_cleaned = df.copy()
-    print(f"執行表格 '{table_name}' 的通用清洗操作...")
+def _is_typed(series, kind):
+    """Tells whether a column (e.g. read from Parquet) already holds values of the given kind.
+
+    kind is 'number' (including Decimal values), 'bool', 'date' or 'time'; such columns can
+    skip the string parsing that CSV columns need.
+    """
+    if kind == 'number':
+        if series.dtype == object:
+            return pd.api.types.infer_dtype(series, skipna=True) == 'decimal'
+        return pd.api.types.is_numeric_dtype(series.dtype) and not pd.api.types.is_bool_dtype(series.dtype)
+    if kind == 'bool':
+        return pd.api.types.is_bool_dtype(series.dtype)
+    return series.dtype == object and pd.api.types.infer_dtype(series, skipna=True) == kind
+
+# 讀取時的欄位類型計劃：category 為重複值多的字串欄位；columns (表格的全部欄位) 及 flags (TRUE/FALSE 欄位)
+# 只在沒有數據庫連接時使用 (試運行)，導入時改由表格結構決定；整數欄位一律縮小類型，見 _compact_frame
+DTYPE_PLANS = {
+    'listings_two_dish_rice': {
+        'columns': {
+            'id', 'restaurant_name', 'list_date', 'edit_date', 'restaurant_photo_main', 'restaurant_area',
+            'restaurant_district', 'restaurant_street', 'restaurant_address',
+            'fullday', 'openhour_fullday', 'closehour_fullday', 'afternoon', 'openhour_afternoon', 'closehour_afternoon',
+            'night', 'openhour_night', 'closehour_night', 'nightsnack', 'openhour_nightsnack', 'closehour_nightsnack',
+            'category_chinese', 'category_western', 'category_seafood', 'category_veg', 'category_japan',
+            'menu', 'menu_photo1', 'menu_photo2', 'menu_photo3', 'menu_photo4', 'menu_photo5', 'menu_photo6',
+            'two_dish_price', 'three_dish_price', 'drink_price', 'soup_price',
+            'payment_cash', 'payment_octopus', 'payment_alipayhk', 'payment_wechatpay', 'payment_payeme',
+            'dine_in', 'takeaway', 'takeaway_self', 'takeaway_keeta', 'takeaway_foodpanda', 'is_published',
+            'discount_coupon',
+        },
+        'category': [
+            'restaurant_area', 'restaurant_district',
+            'openhour_fullday', 'closehour_fullday', 'openhour_afternoon', 'closehour_afternoon',
+            'openhour_night', 'closehour_night', 'openhour_nightsnack', 'closehour_nightsnack',
+        ],
+        'flags': [
+            'fullday', 'afternoon', 'night', 'nightsnack',
+            'category_chinese', 'category_western', 'category_seafood', 'category_veg', 'category_japan',
+            'payment_cash', 'payment_octopus', 'payment_alipayhk', 'payment_wechatpay', 'payment_payeme',
+            'dine_in', 'takeaway', 'takeaway_self', 'takeaway_keeta', 'takeaway_foodpanda', 'is_published',
+            'discount_coupon',
+        ],
+    },
+    'adminusers_adminuser': {
+        'columns': {'id', 'admin_name', 'admin_photo', 'admin_desc', 'admin_email'},
+        'category': [],
+        'flags': [],
+    },
+    'comments_comment_rate': {
+        'columns': {
+            'id', 'two_dish_rice_id', 'foodie_name_id', 'restaurant_name', 'foodie_name', 'list_date', 'edit_date',
+            'comment', 'comment_photo1', 'comment_photo2', 'comment_photo3', 'comment_photo4', 'comment_photo5',
+            'comment_photo6', 'is_published', 'restaurant_rating', 'comment_rating',
+        },
+        'category': [],
+        'flags': ['is_published'],
+    },
+    'comments_commentrating': {
+        'columns': {'id', 'rater_id', 'rater_name', 'rating', 'created_date', 'comment_id'},
+        'category': [],
+        'flags': [],
+    },
+    'foodie_contact': {
+        'columns': {
+            'id', 'foodie_name', 'updated_date', 'gender', 'age_range', 'occupation', 'live_district',
+            'favor_chinese', 'favor_western', 'favor_veg', 'favor_organic', 'favor_japan', 'favor_korean',
+            'favor_thai', 'favor_seafood', 'favor_muslim', 'favor_no_beef', 'favor_no_pork',
+            'foodie_desc', 'foodie_photo', 'is_mvp', 'user_id',
+        },
+        'category': ['gender', 'age_range', 'occupation', 'live_district'],
+        'flags': [
+            'favor_chinese', 'favor_western', 'favor_veg', 'favor_organic', 'favor_japan', 'favor_korean',
+            'favor_thai', 'favor_seafood', 'favor_muslim', 'favor_no_beef', 'favor_no_pork', 'is_mvp',
+        ],
+    },
+}
+# 必填欄位（改成實際欄位名）
+REQUIRED_COLUMNS = {
+    'listings_two_dish_rice': ['restaurant_name', 'two_dish_price'],
+    'adminusers_adminuser': ['admin_name', 'admin_email'],  # 修正表格名稱
+    'comments_comment_rate': ['restaurant_name', 'comment'], # Define actual required columns
+    'comments_commentrating': ['rating', 'comment_id'],
+    'foodie_contact': ['foodie_name', 'user_id']
+}
+# 清洗規則的版本；修改清洗邏輯時須遞增，使 clean_cache 中舊規則的結果失效
+CLEANING_VERSION = 2
+# 未指定格式、由 pd.to_datetime 按第一個非空值推斷格式的日期欄位
+DATETIME_COLUMNS = {
+    'comments_comment_rate': ['list_date', 'edit_date'],
+    'comments_commentrating': ['created_date'],
+    'foodie_contact': ['updated_date'],
+}
+# pd.to_datetime 推斷格式時跳過的字串
+_DATETIME_BLANKS = {'', 'NaT', 'nat', 'NAT', 'nan', 'NaN', 'NAN', 'now', 'today'}
+
+def _drop_duplicates_and_incomplete(df_cleaned, table_name, metrics):
+    """Runs the whole-frame steps of the cleaning in place: duplicate rows and rows missing a required field.
+
+    Returns None if a required column is missing altogether.
+    """
+    debug(f"執行表格 '{table_name}' 的通用清洗操作...")
     # 1. 去重
     original_rows = len(df_cleaned)
     df_cleaned.drop_duplicates(inplace=True)
     dropped = original_rows - len(df_cleaned)
     if dropped:
-        print(f"移除了 {dropped} 行重複數據。")
-
-    # 2. 必填欄位（改成實際欄位名）
-    required_columns = {
-        'listings_two_dish_rice': ['restaurant_name', 'two_dish_price'],
-        'adminusers_adminuser': ['admin_name', 'admin_email'],  # 修正表格名稱
-        'comments_comment_rate': ['restaurant_name', 'comment'], # Define actual required columns
-        'comments_commentrating': ['rating', 'comment_id'],
-        'foodie_contact': ['foodie_name', 'user_id'] 
-    }
-    if table_name in required_columns:
+        metrics.drop('duplicate_rows', dropped)
+        info(f"移除了 {dropped} 行重複數據。")
+
+    # 2. 必填欄位
+    if table_name in REQUIRED_COLUMNS:
         # 檢查必需的欄位是否存在
-        missing_cols = [col for col in required_columns[table_name] if col not in df_cleaned.columns]
+        missing_cols = [col for col in REQUIRED_COLUMNS[table_name] if col not in df_cleaned.columns]
         if missing_cols:
             print(f"錯誤：CSV 檔案缺少必要的欄位：{', '.join(missing_cols)}。無法繼續處理表格 '{table_name}'。")
-            return pd.DataFrame() # 返回空的 DataFrame 來終止後續操作
+            return None
 
         # 只保留這些欄位都非空的行
-        df_cleaned.dropna(subset=required_columns[table_name], how='any', inplace=True)
+        rows_before = len(df_cleaned)
+        df_cleaned.dropna(subset=REQUIRED_COLUMNS[table_name], how='any', inplace=True)
+        metrics.drop('missing_required', rows_before - len(df_cleaned))
+    return df_cleaned
+
+def _datetime_anchors(df, table_name):
+    """Returns the value each DATETIME_COLUMNS column takes its date format from, keyed by column.
+
+    pd.to_datetime guesses the format from the first non-blank string of the column. Fixing
+    that value up front keeps the parsing the same whether the column is parsed whole or in
+    partitions, and regardless of rows dropped in between.
+    """
+    anchors = {}
+    for col in df.columns:
+        if col.strip() not in DATETIME_COLUMNS.get(table_name, ()):
+            continue
+        values = df[col][df[col].notna()]
+        values = values[~values.isin(_DATETIME_BLANKS)]
+        if len(values) and isinstance(values.iloc[0], str):
+            anchors[col.strip()] = values.iloc[0]
+    return anchors
+
+def _to_datetime(series, anchor=None):
+    """pd.to_datetime(errors='coerce'), inferring the format from anchor instead of the column's first value."""
+    if anchor is None:
+        return pd.to_datetime(series, errors='coerce')
+    anchored = pd.concat([pd.Series([anchor], dtype=series.dtype), series], ignore_index=True)
+    parsed = pd.to_datetime(anchored, errors='coerce').iloc[1:]
+    parsed.index = series.index
+    return parsed
+
+def clean_data_for_table(df, table_name, metrics=None, datetime_anchors=None):
+    """Cleans the DataFrame based on the target table name.
+
+    Rows removed by each rule are recorded in metrics (an OperationMetrics), if given.
+    datetime_anchors (see _datetime_anchors) is computed from df unless given.
+    """
+    if metrics is None:
+        metrics = OperationMetrics('clean', table=table_name)
+    df_cleaned = _drop_duplicates_and_incomplete(df.copy(), table_name, metrics)
+    if df_cleaned is None:
+        return pd.DataFrame() # 返回空的 DataFrame 來終止後續操作
+    if datetime_anchors is None:
+        datetime_anchors = _datetime_anchors(df_cleaned, table_name)
 
     # 通用：去除欄位名稱前後空白
     df_cleaned.columns = [c.strip() for c in df_cleaned.columns]
 
     # 3. 各表特定清洗
     if table_name == 'listings_two_dish_rice':
-        print("執行『兩餸飯資料』表格的特定清洗...")
+        debug("執行『兩餸飯資料』表格的特定清洗...")
         # 處理 two_dish_price
         if 'two_dish_price' in df_cleaned.columns:
-            # 移除貨幣符號和空白字符
-            df_cleaned['two_dish_price'] = df_cleaned['two_dish_price'].astype(str).str.replace(r'[^\d.]', '', regex=True)
-            # 轉換為數值，無效值設為NaN
-            df_cleaned['two_dish_price'] = pd.to_numeric(df_cleaned['two_dish_price'], errors='coerce')
+            if _is_typed(df_cleaned['two_dish_price'], 'number'):
+                # 已是數值：與字串路徑一致，負號會隨非數字字符一併移除
+                df_cleaned['two_dish_price'] = pd.to_numeric(df_cleaned['two_dish_price'], errors='coerce').abs()
+            else:
+                # 移除貨幣符號和空白字符
+                df_cleaned['two_dish_price'] = df_cleaned['two_dish_price'].astype(str).str.replace(r'[^\d.]', '', regex=True)
+                # 轉換為數值，無效值設為NaN
+                df_cleaned['two_dish_price'] = pd.to_numeric(df_cleaned['two_dish_price'], errors='coerce')
             # 移除價格為0或負數的記錄
+            rows_before = len(df_cleaned)
             df_cleaned = df_cleaned[df_cleaned['two_dish_price'] > 0]
-            print("已清洗 'two_dish_price'：移除無效價格和非正數價格。")
+            metrics.drop('invalid_price', rows_before - len(df_cleaned))
+            debug("已清洗 'two_dish_price'：移除無效價格和非正數價格。")
 
         # 處理所有時間相關欄位
         time_columns = ['openhour_afternoon', 'openhour_night', 'openhour_fullday', 'openhour_nightsnack',
                        'closehour_afternoon', 'closehour_night', 'closehour_fullday', 'closehour_nightsnack']
         for col in time_columns:
-            if col in df_cleaned.columns:
-                # 先處理字符串形式的NaN和空值
-                df_cleaned[col] = df_cleaned[col].replace(['NaN', 'nan', 'NULL', 'null', ''], None)
-                # 將None和NaN統一處理
-                df_cleaned[col] = df_cleaned[col].where(pd.notna(df_cleaned[col]), None)
-                
-                # 對非None值進行時間格式轉換
-                def parse_time(time_val):
-                    if time_val is None or pd.isna(time_val):
-                        return None
-                    try:
-                        # 嘗試解析時間格式
-                        parsed_time = pd.to_datetime(str(time_val), format='%H:%M:%S', errors='coerce')
-                        if pd.isna(parsed_time):
-                            return None
-                        return parsed_time.time()
-                    except:
-                        return None
-                
-                df_cleaned[col] = df_cleaned[col].apply(parse_time)
-                print(f"已處理 '{col}' 並將無效值/空值轉為 None。")
+            if col in df_cleaned.columns and _is_typed(df_cleaned[col], 'time'):
+                df_cleaned[col] = df_cleaned[col].where(df_cleaned[col].notna(), None)
+            elif col in df_cleaned.columns:
+                # 整欄一次解析時間格式；'NaN'、'NULL'、空字串等無法解析的值都會變成 NaT，再統一轉為 None
+                parsed_time = pd.to_datetime(df_cleaned[col].astype(str), format='%H:%M:%S', errors='coerce')
+                df_cleaned[col] = parsed_time.dt.time.astype(object).where(parsed_time.notna(), None)
+                debug(f"已處理 '{col}' 並將無效值/空值轉為 None。")
 
         # 清理 restaurant_name
         if 'restaurant_name' in df_cleaned.columns:
             df_cleaned['restaurant_name'] = df_cleaned['restaurant_name'].str.strip()
 
     elif table_name == 'adminusers_adminuser':
-        print("執行 'adminusers_adminuser' 表格的特定清洗...")
+        debug("執行 'adminusers_adminuser' 表格的特定清洗...")
         # 假設與 listings 類似，主要處理字串欄位的空白
         for col in ['admin_name', 'admin_desc', 'admin_email']:  # 移除 'admin_photo'，允許空值
             if col in df_cleaned.columns:
                 df_cleaned[col] = df_cleaned[col].astype(str).str.strip()
                 df_cleaned[col] = df_cleaned[col].replace(['NaN', 'nan', 'NULL', 'null', ''], None)
                 df_cleaned[col] = df_cleaned[col].where(pd.notna(df_cleaned[col]), None)
-        print("已清洗 'adminusers_adminuser' 的字串欄位並處理空值。")
+        debug("已清洗 'adminusers_adminuser' 的字串欄位並處理空值。")
 
     elif table_name == 'comments_comment_rate':
-        print("執行 'comments_comment_rate' 表格的特定清洗...")
+        debug("執行 'comments_comment_rate' 表格的特定清洗...")
 
         # 清洗主鍵 'id' 欄位
         if 'id' in df_cleaned.columns:
@@ -234,7 +2059,8 @@ def clean_data_for_table(df, table_name):
             dropped_count_id_nan = initial_rows_before_id_dropna - len(df_cleaned)
             
             if dropped_count_id_nan > 0:
-                print(f"由於主鍵 'id' 欄位無效或轉換為數字失敗，已移除 {dropped_count_id_nan} 行。")
+                metrics.drop('invalid_id', dropped_count_id_nan)
+                info(f"由於主鍵 'id' 欄位無效或轉換為數字失敗，已移除 {dropped_count_id_nan} 行。")
 
             # 確保 'id' 欄位存在且 DataFrame 不為空，並且所有 'id' 值都不是 NaN
             if 'id' in df_cleaned.columns and not df_cleaned.empty and df_cleaned['id'].notna().all():
@@ -254,56 +2080,58 @@ def clean_data_for_table(df, table_name):
             if col in df_cleaned.columns:
                 df_cleaned[col] = df_cleaned[col].astype(str).str.strip()
                 df_cleaned[col] = df_cleaned[col].replace(['', 'nan', 'NaN', 'NULL', 'null', ' '], None, regex=False)
-                df_cleaned[col] = df_cleaned[col].apply(lambda x: None if isinstance(x, str) and x.strip() == '' else x)
+                df_cleaned[col] = df_cleaned[col].mask(df_cleaned[col].str.strip() == '', None)
 
         for col in string_cols_to_process['to_empty_string']:
             if col in df_cleaned.columns:
-                df_cleaned[col] = df_cleaned[col].astype(str).str.strip()
+                photo_paths = df_cleaned[col].astype(str).str.strip()
                 # For photo paths, convert null-like values to empty string '' instead of None
                 # to satisfy potential NOT NULL constraints if an empty path is acceptable.
-                df_cleaned[col] = df_cleaned[col].replace(['nan', 'NaN', 'NULL', 'null', ' '], '', regex=False)
-                # Ensure actual empty strings are also just '', not None from a previous step or read_csv default
-                df_cleaned[col] = df_cleaned[col].fillna('')
-                df_cleaned[col] = df_cleaned[col].apply(lambda x: '' if isinstance(x, str) and x.strip() == '' else x)
-                # If after stripping, it's empty, ensure it's '', not None
-                df_cleaned.loc[df_cleaned[col].isnull(), col] = ''
+                blank = photo_paths.isna() | photo_paths.isin(['nan', 'NaN', 'NULL', 'null', ' ']) | (photo_paths.str.strip() == '')
+                df_cleaned[col] = photo_paths.mask(blank, '')
 
         # 處理日期欄位
         if 'list_date' in df_cleaned.columns:
-            df_cleaned['list_date'] = pd.to_datetime(df_cleaned['list_date'], errors='coerce')
-        if 'edit_date' in df_cleaned.columns:
+            df_cleaned['list_date'] = _to_datetime(df_cleaned['list_date'], datetime_anchors.get('list_date'))
+        if 'edit_date' in df_cleaned.columns and pd.api.types.is_datetime64_any_dtype(df_cleaned['edit_date']):
+            df_cleaned['edit_date'] = df_cleaned['edit_date'].dt.date
+        elif 'edit_date' in df_cleaned.columns and not _is_typed(df_cleaned['edit_date'], 'date'):
             # 處理不同的日期格式
             df_cleaned['edit_date'] = df_cleaned['edit_date'].astype(str).str.replace('/', '-')
-            df_cleaned['edit_date'] = pd.to_datetime(df_cleaned['edit_date'], errors='coerce').dt.date
+            anchor = datetime_anchors.get('edit_date')
+            df_cleaned['edit_date'] = _to_datetime(df_cleaned['edit_date'], anchor and anchor.replace('/', '-')).dt.date
 
-        if 'is_published' in df_cleaned.columns:
+        if 'is_published' in df_cleaned.columns and _is_typed(df_cleaned['is_published'], 'bool'):
+            df_cleaned['is_published'] = df_cleaned['is_published'].astype(object).where(df_cleaned['is_published'].notna(), None)
+        elif 'is_published' in df_cleaned.columns:
             df_cleaned['is_published'] = df_cleaned['is_published'].astype(str).str.strip().str.upper()
             df_cleaned['is_published'] = df_cleaned['is_published'].map({'TRUE': True, 'FALSE': False, '1': True, '0': False})
             df_cleaned['is_published'] = df_cleaned['is_published'].where(pd.notna(df_cleaned['is_published']), None)
 
         # 處理評分欄位，空值轉為 None
         for col in ['restaurant_rating', 'comment_rating']:
-            if col in df_cleaned.columns:
+            if col in df_cleaned.columns and _is_typed(df_cleaned[col], 'number'):
+                df_cleaned[col] = _to_nullable_int(df_cleaned[col])
+            elif col in df_cleaned.columns:
                 # 先處理空格和各種空值
                 df_cleaned[col] = df_cleaned[col].astype(str).str.strip()
                 df_cleaned[col] = df_cleaned[col].replace(['', 'nan', 'NaN', 'NULL', 'null', ' '], None, regex=False)
-                df_cleaned[col] = pd.to_numeric(df_cleaned[col], errors='coerce')
-                df_cleaned[col] = df_cleaned[col].apply(lambda x: int(x) if pd.notnull(x) else None)
+                df_cleaned[col] = _to_nullable_int(df_cleaned[col])
 
         # 處理 ID 欄位，空值轉為 None 或 0
         for col in ['two_dish_rice_id', 'foodie_name_id']:
             if col in df_cleaned.columns:
-                # 先處理空格和各種空值
-                df_cleaned[col] = df_cleaned[col].astype(str).str.strip()
-                df_cleaned[col] = df_cleaned[col].replace(['', 'nan', 'NaN', 'NULL', 'null', ' '], None, regex=False)
-                df_cleaned[col] = pd.to_numeric(df_cleaned[col], errors='coerce')
+                if not _is_typed(df_cleaned[col], 'number'):
+                    # 先處理空格和各種空值
+                    df_cleaned[col] = df_cleaned[col].astype(str).str.strip()
+                    df_cleaned[col] = df_cleaned[col].replace(['', 'nan', 'NaN', 'NULL', 'null', ' '], None, regex=False)
                 # 對於 foodie_name_id，如果是 0 就保持 0，否則轉為整數或 None
                 if col == 'foodie_name_id':
-                    df_cleaned[col] = df_cleaned[col].apply(lambda x: int(x) if pd.notnull(x) else 0)
+                    df_cleaned[col] = _to_nullable_int(df_cleaned[col]).fillna(0)
                 else:
-                    df_cleaned[col] = df_cleaned[col].apply(lambda x: int(x) if pd.notnull(x) else None)
+                    df_cleaned[col] = _to_nullable_int(df_cleaned[col])
         
-        print("已清洗 'comments_comment_rate' 的欄位並處理空值。")
+        debug("已清洗 'comments_comment_rate' 的欄位並處理空值。")
 
         # 修改：如果 foodie_name 清洗後為 None，將其替換為 "Guest"
         if 'foodie_name' in df_cleaned.columns:
@@ -314,39 +2142,34 @@ def clean_data_for_table(df, table_name):
             df_cleaned['foodie_name'] = df_cleaned['foodie_name'].replace(['None', 'nan', 'NaN', 'NULL', 'null', ''], pd.NA, regex=False).fillna('Guest')
             # 再次確保沒有空字串殘留，如果上一步的 pd.NA 處理後仍有空字串，也換成 Guest
             df_cleaned.loc[df_cleaned['foodie_name'].str.strip() == '', 'foodie_name'] = 'Guest'
-            print(f"已將 'foodie_name' 為空的記錄值替換為 'Guest'。")
+            debug(f"已將 'foodie_name' 為空的記錄值替換為 'Guest'。")
 
-        # 調試打印：檢查 comments_comment_rate 清洗後的狀態
-        print(f"DEBUG: 表格 '{table_name}' 清洗完成，準備返回。")
-        if 'id' in df_cleaned.columns:
-            unique_ids = df_cleaned['id'].unique().tolist()
-            print(f"DEBUG: 清洗後 '{table_name}' 的 ID 列表 (共 {len(unique_ids)} 個): {unique_ids}")
-            if 6 in df_cleaned['id'].values:
-                print(f"DEBUG: 清洗後 '{table_name}' 中 id=6 的數據:")
-                print(df_cleaned[df_cleaned['id'] == 6].to_string())
+        # 調試打印：檢查 comments_comment_rate 清洗後的 ID (只列出部分)
+        if is_debug() and 'id' in df_cleaned.columns:
+            debug(f"DEBUG: 清洗後 '{table_name}' 的 ID 列表: {preview(df_cleaned['id'].unique().tolist())}")
 
     elif table_name == 'comments_commentrating':
-        print("執行 'comments_commentrating' 表格的特定清洗...")
+        debug("執行 'comments_commentrating' 表格的特定清洗...")
         string_cols_to_strip_and_none = ['rater_name']
         for col in string_cols_to_strip_and_none:
             if col in df_cleaned.columns:
                 df_cleaned[col] = df_cleaned[col].astype(str).str.strip().replace(['', 'nan', 'NaN', 'NULL', 'null'], None, regex=False)
 
         if 'created_date' in df_cleaned.columns:
-            df_cleaned['created_date'] = pd.to_datetime(df_cleaned['created_date'], errors='coerce')
+            df_cleaned['created_date'] = _to_datetime(df_cleaned['created_date'], datetime_anchors.get('created_date'))
 
         for col in ['rater_id', 'rating', 'comment_id']:
             if col in df_cleaned.columns:
-                df_cleaned[col] = pd.to_numeric(df_cleaned[col], errors='coerce').apply(lambda x: int(x) if pd.notnull(x) and x != '' else None)
+                df_cleaned[col] = _to_nullable_int(df_cleaned[col])
         
-        # 新增調試：打印 comments_commentrating 清洗後的 comment_id 列表
-        if 'comment_id' in df_cleaned.columns:
-            print(f"DEBUG: 清洗後 'comments_commentrating' 的 comment_id 列表: {df_cleaned['comment_id'].unique().tolist()}")
+        # 新增調試：打印 comments_commentrating 清洗後的 comment_id (只列出部分)
+        if is_debug() and 'comment_id' in df_cleaned.columns:
+            debug(f"DEBUG: 清洗後 'comments_commentrating' 的 comment_id 列表: {preview(df_cleaned['comment_id'].unique().tolist())}")
             
-        print("已清洗 'comments_commentrating' 的欄位並處理空值。")
+        debug("已清洗 'comments_commentrating' 的欄位並處理空值。")
 
     elif table_name == 'foodie_contact':
-        print("執行 'foodie_contact' 表格的特定清洗...")
+        debug("執行 'foodie_contact' 表格的特定清洗...")
         # 處理字串欄位
         string_cols = ['foodie_name', 'gender', 'age_range', 'occupation', 'live_district', 
                        'foodie_desc', 'foodie_photo']
@@ -364,108 +2187,341 @@ def clean_data_for_table(df, table_name):
                      'favor_japan', 'favor_korean', 'favor_thai', 'favor_seafood', 
                      'favor_muslim', 'favor_no_beef', 'favor_no_pork', 'is_mvp']
         for col in bool_cols:
-            if col in df_cleaned.columns:
+            if col in df_cleaned.columns and _is_typed(df_cleaned[col], 'bool'):
+                df_cleaned[col] = df_cleaned[col].fillna(False).astype(bool)
+            elif col in df_cleaned.columns:
                 df_cleaned[col] = df_cleaned[col].astype(str).str.strip().str.upper()
                 df_cleaned[col] = df_cleaned[col].map({'TRUE': True, 'FALSE': False, '1': True, '0': False})
                 df_cleaned[col] = df_cleaned[col].where(pd.notna(df_cleaned[col]), False)
         
         # 處理日期欄位
         if 'updated_date' in df_cleaned.columns:
-            df_cleaned['updated_date'] = pd.to_datetime(df_cleaned['updated_date'], errors='coerce')
+            df_cleaned['updated_date'] = _to_datetime(df_cleaned['updated_date'], datetime_anchors.get('updated_date'))
         
         # 處理 ID 欄位
         if 'user_id' in df_cleaned.columns:
-            df_cleaned['user_id'] = pd.to_numeric(df_cleaned['user_id'], errors='coerce')
-            df_cleaned['user_id'] = df_cleaned['user_id'].apply(lambda x: int(x) if pd.notnull(x) else None)
+            df_cleaned['user_id'] = _to_nullable_int(df_cleaned['user_id'])
         
-        print("已清洗 'foodie_contact' 的欄位並處理空值。")
+        debug("已清洗 'foodie_contact' 的欄位並處理空值。")
     else:
         print(f"警告：未為表格 '{table_name}' 定義特定清洗邏輯，僅執行通用步驟。")
 
     # 在函數末尾加上這行，確保總是返回清洗後的 DataFrame
-    print(f"表格 '{table_name}' 清洗完成，剩餘 {len(df_cleaned)} 行。")
+    info(f"表格 '{table_name}' 清洗完成，剩餘 {len(df_cleaned)} 行。")
     return df_cleaned
 
+@contextmanager
+def _cleaning_pool(workers):
+    """Yields a process pool for clean_data_parallel, or None when cleaning runs in this process."""
+    if not workers or workers < 2:
+        yield None
+        return
+    # spawn：導入可能在執行緒中進行 (import_tables_parallel)，fork 會複製其他執行緒持有的鎖及數據庫連接
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn')) as executor:
+        yield executor
 
-def erase_table_data(table_name):
-    """Erases all data from the specified table after confirmation."""
-    conn = None
-    cursor = None
-    confirm_phrase = f"確認清除{table_name}"
-    print(f"\n警告：此操作將會永久刪除表格 '{table_name}' 中的所有數據！")
-    print(f"此操作無法撤銷。")
-    user_confirmation = input(f"如果確定要清除表格 '{table_name}' 的所有數據，請輸入以下文字進行確認 '{confirm_phrase}': ")
+def _clean_partition(df, table_name, datetime_anchors):
+    """Cleans one partition in a worker process; returns the cleaned frame and the rows dropped per rule."""
+    configure(verbosity=0) # 進度信息由主進程匯總輸出
+    metrics = OperationMetrics('clean', table=table_name)
+    return clean_data_for_table(df, table_name, metrics, datetime_anchors), metrics.dropped
 
-    if user_confirmation != confirm_phrase:
-        print("確認失敗，操作已取消。")
-        return False
+def clean_data_parallel(df, table_name, executor, partitions, metrics=None):
+    """Cleans the DataFrame like clean_data_for_table, split into up to partitions parts on a process pool.
 
+    Duplicate rows, the required-column check and the date formats are settled on the whole frame
+    first and the cleaned parts are concatenated in order, so the result equals a single-process
+    run. Frames smaller than two CLEAN_PARTITION_MIN_ROWS partitions are cleaned in this process.
+    """
+    if metrics is None:
+        metrics = OperationMetrics('clean', table=table_name)
+    partitions = min(partitions, len(df) // CLEAN_PARTITION_MIN_ROWS)
+    if partitions < 2 or table_name not in REQUIRED_COLUMNS:
+        return clean_data_for_table(df, table_name, metrics)
 
+    df_cleaned = _drop_duplicates_and_incomplete(df.copy(), table_name, metrics)
+    if df_cleaned is None:
+        return pd.DataFrame()
+    anchors = _datetime_anchors(df_cleaned, table_name)
+    bounds = np.linspace(0, len(df_cleaned), partitions + 1, dtype=int)
+    parts = [df_cleaned.iloc[start:end] for start, end in zip(bounds[:-1], bounds[1:])]
+    debug(f"以 {len(parts)} 個進程清洗表格 '{table_name}' 的 {len(df_cleaned)} 行數據...")
+
+    frames = []
+    invalid_ids = 0
+    for frame, dropped in executor.map(_clean_partition, parts, itertools.repeat(table_name), itertools.repeat(anchors)):
+        for rule, rows in dropped.items():
+            metrics.drop(rule, rows)
+        invalid_ids += dropped.get('invalid_id', 0)
+        frames.append(frame)
+    if invalid_ids:
+        info(f"由於主鍵 'id' 欄位無效或轉換為數字失敗，已移除 {invalid_ids} 行。")
+    # 空分區的欄位類型未經轉換 (例如 id 仍是 float)，合併時會改變其他分區的類型
+    non_empty = [frame for frame in frames if not frame.empty]
+    df_cleaned = pd.concat(non_empty) if non_empty else frames[0]
+    info(f"表格 '{table_name}' 清洗完成，剩餘 {len(df_cleaned)} 行。")
+    return df_cleaned
+
+
+def _dependent_tables(tables, foreign_keys):
+    """Returns the given tables followed by every table that references them, directly or indirectly."""
+    referencing = {}
+    for table, _, ref_table, _ in foreign_keys:
+        if table != ref_table:
+            referencing.setdefault(ref_table, set()).add(table)
+    result = list(dict.fromkeys(tables))
+    pending = list(result)
+    while pending:
+        for child in sorted(referencing.get(pending.pop(), ())):
+            if child not in result:
+                result.append(child)
+                pending.append(child)
+    return result
+
+def erase_tables(tables, confirm=True, cascade=False):
+    """Erases all data from the given tables in one TRUNCATE ... RESTART IDENTITY transaction.
+
+    Only the named tables are cleared. If other tables reference them through foreign keys
+    (looked up in the catalog), the erase is refused unless those tables are named too or
+    cascade=True is given; interactively (confirm=True) the user is asked whether to include
+    them. The group is erased completely or not at all.
+    confirm=False skips the typed confirmation, for callers that have already confirmed (e.g. batch mode).
+    """
+    tables = list(tables)
+    label = ', '.join(tables)
     try:
-        conn = connect_db()
-        if not conn:
-            print("數據庫連接失敗。")
-            return False
-        cursor = conn.cursor()
-        
-        # 檢查表格是否存在 (可選，但更安全)
-        cursor.execute("SELECT EXISTS (SELECT FROM information_schema.tables WHERE table_name = %s);", (table_name,))
-        if not cursor.fetchone()[0]:
-            print(f"表格 '{table_name}' 不存在。")
-            return False
-            
-        sql = f"DELETE FROM {table_name}" # 或者 TRUNCATE TABLE {table_name} 以獲得更好性能，但 TRUNCATE 可能有不同事務行為
-        cursor.execute(sql)
-        conn.commit()
-        print(f"表格 '{table_name}' 的所有數據已成功清除。")
+        with db_connection() as conn:
+            if not conn:
+                print("數據庫連接失敗。")
+                return False
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT table_name FROM information_schema.tables WHERE table_name = ANY(%s)", (list(tables),))
+                existing = {row[0] for row in cursor.fetchall()}
+                missing = [table for table in tables if table not in existing]
+                if missing:
+                    print(f"表格 '{', '.join(missing)}' 不存在。")
+                    return False
+                targets = _dependent_tables(tables, get_foreign_keys(cursor))
+
+        dependents = [table for table in targets if table not in tables]
+        if dependents and not cascade:
+            print(f"以下表格透過外鍵引用表格 '{label}'：{', '.join(dependents)}")
+            if not confirm:
+                print("未清除任何數據。請把這些表格一併列出，或明確指定 cascade (--cascade) 以一併清除。")
+                return False
+            choice = input("是否一併清除這些表格？ (y/n，預設為 n): ").lower()
+            if choice != 'y':
+                print("操作已取消，未清除任何數據。")
+                return False
+        if dependents:
+            print(f"以下表格透過外鍵引用上述表格，亦會一併清除：{', '.join(dependents)}")
+        if confirm:
+            confirm_phrase = f"確認清除{tables[0]}" if len(targets) == 1 else f"確認清除{len(targets)}個表格"
+            print(f"\n警告：此操作將會永久刪除表格 '{', '.join(targets)}' 中的所有數據！")
+            print(f"此操作無法撤銷。")
+            user_confirmation = input(f"如果確定要清除以上表格的所有數據，請輸入以下文字進行確認 '{confirm_phrase}': ")
+
+            if user_confirmation != confirm_phrase:
+                print("確認失敗，操作已取消。")
+                return False
+
+        with db_connection() as conn:
+            if not conn:
+                print("數據庫連接失敗。")
+                return False
+            with conn.cursor() as cursor:
+                # 不使用 CASCADE：所有依賴表格已明確列出並確認，若外鍵查詢有遺漏，TRUNCATE 會報錯而非靜默清除
+                cursor.execute(sql.SQL("TRUNCATE {tables} RESTART IDENTITY").format(
+                    tables=sql.SQL(', ').join(sql.Identifier(table) for table in targets)))
+                rating_aggregates.clear(cursor, targets)
+            conn.commit()
+        forget_id_maps(targets)
+        for table in targets:
+            invalidate_reference_keys(table)
+        print(f"表格 '{', '.join(targets)}' 的所有數據已成功清除，並已重置 ID 序列。")
         return True
     except Exception as e:
-        print(f"清除表格 '{table_name}' 數據時發生錯誤: {e}")
-        if conn:
-            conn.rollback()
+        print(f"清除表格 '{label}' 數據時發生錯誤: {e}")
+        return False # 未提交的事務在連接歸還連接池時回滾
+
+def rebuild_rating_aggregates(tables=None, create=False):
+    """Recomputes the rating aggregates (see rating_aggregates) from the full source tables.
+
+    Imports keep existing aggregates current on their own; this is for rows changed or deleted
+    outside the toolkit. create also creates the aggregate tables that do not exist yet, the
+    only way they are created. tables limits the rebuild to the aggregates of those source tables.
+    """
+    try:
+        with db_connection() as conn:
+            if not conn:
+                print("數據庫連接失敗。")
+                return False
+            with conn.cursor() as cursor:
+                filled = rating_aggregates.rebuild(cursor, tables, create=create)
+            conn.commit()
+        if filled:
+            print(f"評分匯總表格已重新計算: {', '.join(filled)}")
+        else:
+            print("沒有需要重新計算的評分匯總表格；如需建立，請執行 toolkit_cli.py aggregates --create。")
+        return True
+    except Exception as e:
+        print(f"重新計算評分匯總時發生錯誤: {e}")
         return False
-    finally:
-        if cursor:
-            cursor.close()
-        if conn:
-            conn.close()
+
+def erase_table_data(table_name, confirm=True, cascade=False):
+    """Erases all data from the specified table after confirmation (see erase_tables for referencing tables)."""
+    return erase_tables([table_name], confirm=confirm, cascade=cascade)
+
+def _table_dependencies(tables):
+    """Reads foreign keys from the catalog and returns {table: set of selected tables it references}."""
+    with db_connection() as conn:
+        if not conn:
+            return None
+        with conn.cursor() as cursor:
+            foreign_keys = get_foreign_keys(cursor)
+    dependencies = {table: set() for table in tables}
+    for table, _, referenced_table, _ in foreign_keys:
+        if table in dependencies and referenced_table in dependencies and referenced_table != table:
+            dependencies[table].add(referenced_table)
+    return dependencies
+
+def _dependency_order(dependencies):
+    """Returns the tables ordered so that referenced tables come first, or None if the references form a cycle."""
+    order = []
+    remaining = {table: set(refs) for table, refs in dependencies.items()}
+    while remaining:
+        ready = [table for table, refs in remaining.items() if not refs]
+        if not ready:
+            return None
+        for table in ready:
+            order.append(table)
+            del remaining[table]
+        for refs in remaining.values():
+            refs.difference_update(ready)
+    return order
+
+def import_tables_parallel(jobs, if_exists='append', max_workers=None, chunk_size=None, remap_ids=False):
+    """Imports several CSV files at once, each table waiting only for the tables it references.
+
+    jobs maps table names to CSV file paths. Foreign keys between the selected tables are read
+    from the database catalog; tables with no pending dependencies are loaded concurrently on a
+    thread pool. A table is skipped if a table it references failed to import. With remap_ids
+    (see import_csv_to_db), child tables are rewritten to the ids assigned to their parents,
+    which always finish first.
+    Returns {table: success}.
+    """
+    if if_exists == 'ask':
+        print("並行導入無法逐一詢問，請指定 'append' 或 'truncate' 策略。")
+        return {}
+    dependencies = _table_dependencies(list(jobs))
+    if dependencies is None:
+        print("數據庫連接失敗。")
+        return {}
+    if _dependency_order(dependencies) is None:
+        print(f"表格之間的外鍵依賴形成循環，無法安排導入順序: {', '.join(jobs)}")
+        return {}
+
+    max_workers = max_workers or min(len(jobs), POOL_Config['maxconn'])
+    results = {}
+    pending = dict(dependencies)
+    running = {}
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        while pending or running:
+            ready = [table for table, refs in pending.items() if refs <= results.keys()]
+            for table in ready:
+                refs = pending.pop(table)
+                failed_refs = [ref for ref in refs if not results[ref]]
+                if failed_refs:
+                    print(f"由於依賴的表格 {', '.join(failed_refs)} 導入失敗，跳過表格 '{table}'。")
+                    results[table] = False
+                    continue
+                print(f"\n開始導入表格: {table} (檔案: {jobs[table]})")
+                future = executor.submit(import_csv_to_db, jobs[table], table, chunk_size, if_exists,
+                                         remap_ids=remap_ids)
+                running[future] = table
+            if ready and not running:
+                continue # 跳過的表格可能解除了其他表格的等待
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                results[running.pop(future)] = future.result()
+    return results
+
+def _ask_if_exists_policy():
+    """Asks once how tables that already contain data should be handled during a group import."""
+    choice = input("如表格中已有數據，是否清除現有數據後導入？ (y/n，預設為 n - 跳過重複數據): ").lower()
+    return 'truncate' if choice == 'y' else 'append'
+
+def _ask_open_csv(table):
+    """Shows a file dialog for choosing the CSV file to import into the given table."""
+    # tkinter 只在互動模式需要，延遲導入讓批處理模式不必載入 GUI
+    import tkinter as tk
+    from tkinter import filedialog
+    root = tk.Tk()
+    root.withdraw()
+    csv_file_path = filedialog.askopenfilename(
+        title=f"請選擇要導入到 '{table}' 的 CSV 檔案",
+        filetypes=(("CSV 檔案", "*.csv"), ("Parquet 檔案", "*.parquet *.pq"), ("所有檔案", "*.*"))
+    )
+    root.destroy()
+    return csv_file_path
+
+def _ask_save_csv(table):
+    """Shows a file dialog for choosing where to export the given table."""
+    import tkinter as tk
+    from tkinter import filedialog
+    root = tk.Tk()
+    root.withdraw()
+    csv_file_path = filedialog.asksaveasfilename(
+        defaultextension=".csv",
+        filetypes=[("CSV files", "*.csv"), ("Parquet files", "*.parquet"), ("All files", "*.*")],
+        title=f"請選擇 '{table}' 的匯出位置和檔名"
+    )
+    root.destroy()
+    return csv_file_path
+
+def _ask_snapshot_dir():
+    """Shows a folder dialog for choosing where the snapshot directory is created."""
+    import tkinter as tk
+    from tkinter import filedialog
+    root = tk.Tk()
+    root.withdraw()
+    parent_dir = filedialog.askdirectory(title="請選擇存放快照備份的資料夾")
+    root.destroy()
+    return parent_dir
+
+def _import_group(tables):
+    """Lets the user pick a CSV file per table and imports the chosen files in parallel."""
+    jobs = {}
+    for table in tables:
+        csv_file_path = _ask_open_csv(table)
+        if csv_file_path:
+            print(f"'{table}' 選擇的檔案: {csv_file_path}")
+            jobs[table] = csv_file_path
+        else:
+            print(f"未選擇 '{table}' 的檔案，跳過此表格。")
+    if not jobs:
+        return
+    # 同一組文件的 id 互相引用，按本次導入分配的新 id 改寫子表格的外鍵；之前導入留下的對應不再適用
+    forget_id_maps()
+    results = import_tables_parallel(jobs, if_exists=_ask_if_exists_policy(), remap_ids=True)
+    for table, success in results.items():
+        print(f"  {table}: {'成功' if success else '失敗'}")
 
 def import_export_comments(action):
     """Handles import, export, and erase operations for comments data (both tables)."""
     comment_tables = ['comments_comment_rate', 'comments_commentrating']
-    # For erase operation, we need to reverse the order due to foreign key constraints
-    erase_order_tables = ['comments_commentrating', 'comments_comment_rate']
-    
+
     if action == 'import':
         print("\n評論數據導入操作:")
-        # For import, use the original order to respect foreign key dependencies
-        for table in comment_tables:
-            print(f"\n正在處理表格: {table}")
-            root = tk.Tk()
-            root.withdraw()
-            csv_file_path = filedialog.askopenfilename(
-                title=f"請選擇要導入到 '{table}' 的 CSV 檔案",
-                filetypes=(("CSV 檔案", "*.csv"), ("所有檔案", "*.*"))
-            )
-            root.destroy()
-            if csv_file_path:
-                print(f"選擇的檔案: {csv_file_path}")
-                import_csv_to_db(csv_file_path, table)
-            else:
-                print(f"未選擇 '{table}' 的檔案，跳過此表格。")
+        # 導入順序由外鍵依賴決定：comments_commentrating 會等待 comments_comment_rate 完成
+        _import_group(comment_tables)
     
     elif action == 'export':
         print("\n評論數據導出操作:")
-        for table in comment_tables:
+        # 評分匯總表格在導入時更新，可像其他表格一樣導出
+        for table in comment_tables + rating_aggregates.AGGREGATE_TABLES:
             print(f"\n正在處理表格: {table}")
-            root = tk.Tk()
-            root.withdraw()
-            csv_file_path = filedialog.asksaveasfilename(
-                defaultextension=".csv",
-                filetypes=[("CSV files", "*.csv"), ("All files", "*.*")],
-                title=f"請選擇 '{table}' 的匯出位置和檔名"
-            )
-            root.destroy()
+            csv_file_path = _ask_save_csv(table)
             if csv_file_path:
                 export_db_to_csv(table, csv_file_path)
             else:
@@ -474,14 +2530,8 @@ def import_export_comments(action):
     elif action == 'erase':
         print("\n評論數據清除操作:")
         print("警告：此操作將清除所有評論相關表格的數據！")
-        confirm = input("確定要繼續嗎？(y/n): ").lower()
-        if confirm == 'y':
-            # Use erase_order_tables to respect foreign key constraints
-            for table in erase_order_tables:
-                print(f"\n正在清除表格: {table}")
-                erase_table_data(table)
-        else:
-            print("操作已取消。")
+        # 兩個表格在同一事務中清除，無需考慮外鍵順序
+        erase_tables(comment_tables)
     
     else:
         print(f"未知操作: {action}")
@@ -492,33 +2542,13 @@ def import_export_auth_foodie(action):
     
     if action == 'import':
         print("\n用戶及聯絡人數據導入操作:")
-        for table in tables:
-            print(f"\n正在處理表格: {table}")
-            root = tk.Tk()
-            root.withdraw()
-            csv_file_path = filedialog.askopenfilename(
-                title=f"請選擇要導入到 '{table}' 的 CSV 檔案",
-                filetypes=(("CSV 檔案", "*.csv"), ("所有檔案", "*.*"))
-            )
-            root.destroy()
-            if csv_file_path:
-                print(f"選擇的檔案: {csv_file_path}")
-                import_csv_to_db(csv_file_path, table)
-            else:
-                print(f"未選擇 '{table}' 的檔案，跳過此表格。")
+        _import_group(tables)
     
     elif action == 'export':
         print("\n用戶及聯絡人數據導出操作:")
         for table in tables:
             print(f"\n正在處理表格: {table}")
-            root = tk.Tk()
-            root.withdraw()
-            csv_file_path = filedialog.asksaveasfilename(
-                defaultextension=".csv",
-                filetypes=[("CSV files", "*.csv"), ("All files", "*.*")],
-                title=f"請選擇 '{table}' 的匯出位置和檔名"
-            )
-            root.destroy()
+            csv_file_path = _ask_save_csv(table)
             if csv_file_path:
                 export_db_to_csv(table, csv_file_path)
             else:
@@ -527,13 +2557,7 @@ def import_export_auth_foodie(action):
     elif action == 'erase':
         print("\n用戶及聯絡人數據清除操作:")
         print("警告：此操作將清除所有用戶及聯絡人相關表格的數據！")
-        confirm = input("確定要繼續嗎？(y/n): ").lower()
-        if confirm == 'y':
-            for table in tables:
-                print(f"\n正在清除表格: {table}")
-                erase_table_data(table)
-        else:
-            print("操作已取消。")
+        erase_tables(tables)
     
     else:
         print(f"未知操作: {action}")
@@ -545,13 +2569,7 @@ def import_export_foodie_contact(action):
     if action == 'import':
         print("\n美食家聯絡人數據導入操作:")
         print(f"\n正在處理表格: {table}")
-        root = tk.Tk()
-        root.withdraw()
-        csv_file_path = filedialog.askopenfilename(
-            title=f"請選擇要導入到 '{table}' 的 CSV 檔案",
-            filetypes=(("CSV 檔案", "*.csv"), ("所有檔案", "*.*"))
-        )
-        root.destroy()
+        csv_file_path = _ask_open_csv(table)
         if csv_file_path:
             print(f"選擇的檔案: {csv_file_path}")
             import_csv_to_db(csv_file_path, table)
@@ -561,14 +2579,7 @@ def import_export_foodie_contact(action):
     elif action == 'export':
         print("\n美食家聯絡人數據導出操作:")
         print(f"\n正在處理表格: {table}")
-        root = tk.Tk()
-        root.withdraw()
-        csv_file_path = filedialog.asksaveasfilename(
-            defaultextension=".csv",
-            filetypes=[("CSV files", "*.csv"), ("All files", "*.*")],
-            title=f"請選擇 '{table}' 的匯出位置和檔名"
-        )
-        root.destroy()
+        csv_file_path = _ask_save_csv(table)
         if csv_file_path:
             export_db_to_csv(table, csv_file_path)
         else:
@@ -577,16 +2588,35 @@ def import_export_foodie_contact(action):
     elif action == 'erase':
         print("\n美食家聯絡人數據清除操作:")
         print("警告：此操作將清除美食家聯絡人表格的數據！")
-        confirm = input("確定要繼續嗎？(y/n): ").lower()
-        if confirm == 'y':
-            print(f"\n正在清除表格: {table}")
-            erase_table_data(table)
-        else:
-            print("操作已取消。")
+        erase_table_data(table)
     
     else:
         print(f"未知操作: {action}")
 
+def import_export_all(action):
+    """Handles import, export, and erase operations for every managed table."""
+    if action == 'import':
+        print("\n全部表格導入操作:")
+        _import_group(MANAGED_TABLES)
+
+    elif action == 'export':
+        print("\n全部表格導出操作:")
+        for table in MANAGED_TABLES + rating_aggregates.AGGREGATE_TABLES:
+            print(f"\n正在處理表格: {table}")
+            csv_file_path = _ask_save_csv(table)
+            if csv_file_path:
+                export_db_to_csv(table, csv_file_path)
+            else:
+                print(f"未選擇 '{table}' 的儲存路徑，跳過此表格。")
+
+    elif action == 'erase':
+        print("\n全部表格清除操作:")
+        print("警告：此操作將清除所有表格的數據！")
+        erase_tables(MANAGED_TABLES)
+
+    else:
+        print(f"未知操作: {action}")
+
 # --- CLI Interaction --- #
 
 def get_table_choice(action_description="操作"):
@@ -596,14 +2626,16 @@ def get_table_choice(action_description="操作"):
     print("  2. 管理員用戶資料 (adminusers_adminuser)")
     print("  3. 評論數據 (comments_comment_rate & comments_commentrating)")
     print("  4. 美食家聯絡人數據 (foodie_contact)")
+    print("  5. 全部表格 (按外鍵依賴並行導入)")
     table_map = {
         '1': 'listings_two_dish_rice',
         '2': 'adminusers_adminuser',
         '3': 'comments_data', 
-        '4': 'foodie_contact_data'
+        '4': 'foodie_contact_data',
+        '5': 'all_data'
     }
     while True:
-        choice = input("請輸入代號 (1-4): ")
+        choice = input("請輸入代號 (1-5): ")
         if choice in table_map:
             return table_map[choice]
         else:
@@ -617,9 +2649,10 @@ def main():
         print("  1. 導入 CSV 文件到數據庫")
         print("  2. 從數據庫導出表格到 CSV 文件")
         print("  3. 清除數據庫表格的數據")
-        print("  4. 退出")
+        print("  4. 備份全部表格 (一致快照)")
+        print("  5. 退出")
         
-        action_choice = input("請輸入操作代號 (1-4): ")
+        action_choice = input("請輸入操作代號 (1-5): ")
 
         if action_choice == '1': # 導入
             selected_item = get_table_choice(action_description="導入")
@@ -627,14 +2660,10 @@ def main():
                 import_export_comments(action='import')
             elif selected_item == 'foodie_contact_data':
                 import_export_foodie_contact(action='import')
+            elif selected_item == 'all_data':
+                import_export_all(action='import')
             elif selected_item:
-                root = tk.Tk()
-                root.withdraw()
-                csv_file_path = filedialog.askopenfilename(
-                    title=f"請選擇要導入到 '{selected_item}' 的 CSV 檔案",
-                    filetypes=(("CSV 檔案", "*.csv"), ("所有檔案", "*.*"))
-                )
-                root.destroy()
+                csv_file_path = _ask_open_csv(selected_item)
                 if csv_file_path:
                     print(f"選擇的檔案: {csv_file_path}")
                     import_csv_to_db(csv_file_path, selected_item)
@@ -647,15 +2676,10 @@ def main():
                 import_export_comments(action='export')
             elif selected_item == 'foodie_contact_data':
                 import_export_foodie_contact(action='export')
+            elif selected_item == 'all_data':
+                import_export_all(action='export')
             elif selected_item:
-                root = tk.Tk()
-                root.withdraw()
-                csv_file_path = filedialog.asksaveasfilename(
-                    defaultextension=".csv",
-                    filetypes=[("CSV files", "*.csv"), ("All files", "*.*")],
-                    title=f"請選擇 '{selected_item}' 的匯出位置和檔名"
-                )
-                root.destroy()
+                csv_file_path = _ask_save_csv(selected_item)
                 if csv_file_path:
                     export_db_to_csv(selected_item, csv_file_path)
                 else:
@@ -667,10 +2691,19 @@ def main():
                 import_export_comments(action='erase')
             elif selected_item == 'foodie_contact_data':
                 import_export_foodie_contact(action='erase')
+            elif selected_item == 'all_data':
+                import_export_all(action='erase')
             elif selected_item:
                 erase_table_data(selected_item)
         
-        elif action_choice == '4': # 退出
+        elif action_choice == '4': # 快照備份
+            parent_dir = _ask_snapshot_dir()
+            if parent_dir:
+                snapshot_export(os.path.join(parent_dir, f"snapshot_{datetime.now().strftime('%Y%m%d%H%M%S')}"))
+            else:
+                print("未選擇資料夾，操作取消。")
+
+        elif action_choice == '5': # 退出
             print("感謝使用，再見！")
             break
         
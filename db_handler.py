@@ -1,5 +1,10 @@
 import os
+import time
+import atexit
+import threading
+from contextlib import contextmanager
 import psycopg2
+from psycopg2 import pool
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -12,6 +17,18 @@ DB_Config = {
     'port': os.getenv('DB_PORT', 5432),
 }
 
+# 連接池設定：最少/最多保持的連接數，以及閒置多久後借出前需要做健康檢查 (秒)
+POOL_Config = {
+    'minconn': int(os.getenv('DB_POOL_MIN', 1)),
+    'maxconn': int(os.getenv('DB_POOL_MAX', 5)),
+    'healthcheck_after': float(os.getenv('DB_POOL_HEALTHCHECK_AFTER', 30)),
+}
+
+_pool = None
+_pool_slots = None
+_pool_lock = threading.Lock()
+_last_used = {}
+
 def connect_db():
     """Establish a connection to the PostgreSQL database."""
     try:
@@ -19,4 +36,109 @@ def connect_db():
         return conn
     except Exception as e:
         print( f"無法連接到數據庫 : {e}")
-        return None
\ No newline at end of file
+        return None
+
+def get_pool():
+    """Returns the shared connection pool, creating it on first use."""
+    global _pool, _pool_slots
+    with _pool_lock:
+        if _pool is None:
+            _pool = pool.ThreadedConnectionPool(POOL_Config['minconn'], POOL_Config['maxconn'], **DB_Config)
+            # ThreadedConnectionPool 在連接用盡時直接拋出錯誤，用信號量讓借用者排隊等待
+            _pool_slots = threading.BoundedSemaphore(POOL_Config['maxconn'])
+        return _pool
+
+def close_pool():
+    """Closes every connection held by the shared pool."""
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.closeall()
+            _pool = None
+            _last_used.clear()
+
+atexit.register(close_pool)
+
+def _is_healthy(conn):
+    """Checks that a pooled connection is still usable, probing the server only if it has been idle for a while."""
+    if conn.closed:
+        return False
+    last_used = _last_used.get(id(conn))
+    # 剛建立的連接無需檢查
+    if last_used is None or time.monotonic() - last_used < POOL_Config['healthcheck_after']:
+        return True
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT 1")
+        conn.rollback()
+        return True
+    except psycopg2.Error:
+        return False
+
+@contextmanager
+def db_connection():
+    """Borrows a connection from the shared pool for the duration of a with-block.
+
+    Yields None if no connection can be established. Any transaction left open when the
+    block exits is rolled back before the connection goes back to the pool.
+    """
+    try:
+        db_pool = get_pool()
+    except Exception as e:
+        print( f"無法連接到數據庫 : {e}")
+        yield None
+        return
+
+    _pool_slots.acquire()
+    conn = None
+    try:
+        try:
+            conn = db_pool.getconn()
+            # 丟棄已斷開的連接並重新取得，最多嘗試 maxconn 次
+            for _ in range(POOL_Config['maxconn']):
+                if _is_healthy(conn):
+                    break
+                _last_used.pop(id(conn), None)
+                db_pool.putconn(conn, close=True)
+                conn = db_pool.getconn()
+            else:
+                raise psycopg2.OperationalError("連接池中沒有可用的連接")
+        except Exception as e:
+            print( f"無法連接到數據庫 : {e}")
+            if conn is not None:
+                db_pool.putconn(conn, close=True)
+                conn = None
+            yield None
+            return
+
+        try:
+            yield conn
+        finally:
+            broken = conn.closed != 0
+            if not broken:
+                try:
+                    conn.rollback()
+                except psycopg2.Error:
+                    broken = True
+            if broken:
+                _last_used.pop(id(conn), None)
+            else:
+                _last_used[id(conn)] = time.monotonic()
+            db_pool.putconn(conn, close=broken)
+    finally:
+        _pool_slots.release()
+
+def get_foreign_keys(cursor):
+    """Returns (table, column, referenced_table, referenced_column) for every foreign key visible in the search path."""
+    cursor.execute("""
+        SELECT cl.relname, att.attname, ref.relname, ref_att.attname
+        FROM pg_constraint con
+        JOIN pg_class cl ON cl.oid = con.conrelid
+        JOIN pg_class ref ON ref.oid = con.confrelid
+        CROSS JOIN LATERAL unnest(con.conkey, con.confkey) AS k(attnum, ref_attnum)
+        JOIN pg_attribute att ON att.attrelid = con.conrelid AND att.attnum = k.attnum
+        JOIN pg_attribute ref_att ON ref_att.attrelid = con.confrelid AND ref_att.attnum = k.ref_attnum
+        WHERE con.contype = 'f' AND pg_table_is_visible(cl.oid)
+        ORDER BY cl.relname, att.attname
+    """)
+    return cursor.fetchall()
@@ -0,0 +1,178 @@
+"""Catalog-driven table knowledge for the CSV toolkit.
+
+get_table_schema() reads a table's columns (type, nullability, default, identity or serial
+sequence) and foreign keys from information_schema / pg_catalog once per session and caches
+them. ImportPlan compiles a schema and the columns of a cleaned frame into the projection and
+coercion applied before loading, so that a file that does not fit the table is rejected before
+anything is written, and a new table needs no code changes to be imported.
+"""
+import threading
+import warnings
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+
+from db_handler import get_foreign_keys
+
+# generated: 由序列或 IDENTITY 產生的欄位 (例如 id)，導入時不提供，由數據庫生成
+ColumnInfo = namedtuple('ColumnInfo', 'name data_type nullable default max_length generated sequence')
+
+INTEGER_RANGES = {
+    'smallint': (-2**15, 2**15 - 1),
+    'integer': (-2**31, 2**31 - 1),
+    'bigint': (-2**63, 2**63 - 1),
+}
+NUMERIC_TYPES = {'numeric', 'real', 'double precision'}
+DATETIME_TYPES = {'date', 'timestamp without time zone', 'timestamp with time zone'}
+# PostgreSQL 接受的布林值文字 (不分大小寫)
+BOOLEAN_TEXT = {'t', 'true', 'y', 'yes', 'on', '1', 'f', 'false', 'n', 'no', 'off', '0'}
+DATETIME_SPECIAL = {'infinity', '-infinity', 'epoch', 'now', 'today', 'tomorrow', 'yesterday'}
+PROBLEM_SAMPLES = 3 # 每個問題欄位列出的無效值數量
+
+class TableSchema:
+    """Columns (in table order), identity sequence and foreign keys of one table."""
+
+    def __init__(self, name, columns, foreign_keys):
+        self.name = name
+        self.columns = {column.name: column for column in columns}
+        self.foreign_keys = foreign_keys
+        self.sequence = next((column.sequence for column in columns if column.sequence), None)
+
+    def columns_of_type(self, *data_types):
+        """Returns the names of the columns with one of the given data types."""
+        return [name for name, column in self.columns.items() if column.data_type in data_types]
+
+    def fingerprint(self):
+        """Returns a string that changes whenever the column names or types change."""
+        return ','.join(f"{name}:{column.data_type}" for name, column in self.columns.items())
+
+_schemas = {}
+_schemas_lock = threading.Lock()
+
+def get_table_schema(cursor, table_name):
+    """Returns the TableSchema of a table visible in the search path, or None if there is none.
+
+    The catalog is only queried the first time a table is asked for in this process; call
+    invalidate_schema() after changing a table's definition.
+    """
+    with _schemas_lock:
+        if table_name in _schemas:
+            return _schemas[table_name]
+    cursor.execute("""
+        SELECT column_name, data_type, is_nullable = 'YES', column_default, character_maximum_length,
+               is_identity = 'YES' OR coalesce(column_default LIKE 'nextval(%%', false),
+               pg_get_serial_sequence(quote_ident(table_schema) || '.' || quote_ident(table_name), column_name)
+        FROM information_schema.columns
+        WHERE table_name = %s AND table_schema = ANY(current_schemas(false))
+        ORDER BY ordinal_position
+    """, (table_name,))
+    columns = [ColumnInfo(*row) for row in cursor.fetchall()]
+    if not columns:
+        return None
+    foreign_keys = [fk for fk in get_foreign_keys(cursor) if fk[0] == table_name]
+    schema = TableSchema(table_name, columns, foreign_keys)
+    with _schemas_lock:
+        _schemas[table_name] = schema
+    return schema
+
+def invalidate_schema(table_name=None):
+    """Forgets the cached schema of a table (or of every table)."""
+    with _schemas_lock:
+        if table_name is None:
+            _schemas.clear()
+        else:
+            _schemas.pop(table_name, None)
+
+def _samples(series, bad):
+    """Formats a few of the offending values for an error message."""
+    return ', '.join(repr(value) for value in series[bad].head(PROBLEM_SAMPLES).tolist())
+
+def _to_number(series, present):
+    """Parses a column as numbers; values that are not numbers (including booleans) become NaN."""
+    if pd.api.types.is_bool_dtype(series.dtype):
+        return pd.Series(np.nan, index=series.index)
+    if pd.api.types.is_numeric_dtype(series.dtype):
+        return series
+    text = series.astype(str).str.strip().where(present)
+    return pd.to_numeric(text, errors='coerce')
+
+def _coerce_column(series, column):
+    """Returns (series converted for COPY, mask of values the column type cannot hold)."""
+    present = series.notna()
+    if column.data_type in INTEGER_RANGES:
+        low, high = INTEGER_RANGES[column.data_type]
+        numbers = _to_number(series, present)
+        if pd.api.types.is_integer_dtype(numbers.dtype):
+            ok = (numbers.isna() | ((numbers >= low) & (numbers <= high))).fillna(True)
+            return numbers, present & ~ok
+        numbers = numbers.astype('float64')
+        ok = (numbers == np.floor(numbers)) & (numbers >= low) & (numbers <= high)
+        # 整數值的浮點數 (例如 3.0) 以整數寫入，與 COPY 接受的格式一致
+        return numbers.where(ok).astype('Int64'), present & ~ok
+    if column.data_type in NUMERIC_TYPES:
+        numbers = _to_number(series, present)
+        return (series if numbers is series else numbers), present & numbers.isna()
+    if column.data_type == 'boolean':
+        if pd.api.types.is_bool_dtype(series.dtype):
+            return series, present & False
+        text = series.astype(str).str.strip().str.lower()
+        return series, present & ~text.isin(BOOLEAN_TEXT)
+    if column.data_type in DATETIME_TYPES and not pd.api.types.is_datetime64_any_dtype(series.dtype):
+        with warnings.catch_warnings():
+            # 格式不一致時 pandas 會警告並逐個解析，下面只重新解析失敗的值
+            warnings.simplefilter('ignore', UserWarning)
+            parsed = pd.to_datetime(series.where(present), errors='coerce', utc=True)
+        retry = present & parsed.isna()
+        if retry.any():
+            parsed[retry] = pd.to_datetime(series[retry], format='mixed', errors='coerce', utc=True)
+        special = series.astype(str).str.strip().str.lower().isin(DATETIME_SPECIAL)
+        return series, present & parsed.isna() & ~special
+    if column.max_length is not None:
+        lengths = series.astype(str).str.len().where(present)
+        return series, present & (lengths > column.max_length)
+    return series, present & False
+
+class ImportPlan:
+    """Projection and coercion of cleaned frames into one table, compiled from its TableSchema.
+
+    Generated columns (identity/serial, e.g. id) are dropped so the database assigns them, the
+    remaining columns are converted where the table's types need it, and every value that the
+    column could not hold (wrong type, out of range, too long, NULL in a NOT NULL column) is
+    reported instead of failing half-way through a load.
+    """
+
+    def __init__(self, schema, columns):
+        self.table = schema.name
+        self.unknown = [col for col in columns if col not in schema.columns]
+        self.generated = [col for col in columns if col in schema.columns and schema.columns[col].generated]
+        self.columns = [schema.columns[col] for col in columns
+                        if col in schema.columns and col not in self.generated]
+        provided = {column.name for column in self.columns}
+        self.missing = [column.name for column in schema.columns.values()
+                        if not column.nullable and column.default is None and not column.generated
+                        and column.name not in provided]
+
+    def file_errors(self):
+        """Returns problems with the file's columns as a whole."""
+        errors = []
+        if self.unknown:
+            errors.append(f"表格 '{self.table}' 沒有以下欄位: {', '.join(self.unknown)}")
+        if self.missing:
+            errors.append(f"缺少表格 '{self.table}' 的必填欄位 (NOT NULL 且沒有預設值): {', '.join(self.missing)}")
+        return errors
+
+    def apply(self, df):
+        """Returns (projected and coerced frame, list of problems found in its values)."""
+        out = {}
+        problems = []
+        for column in self.columns:
+            series = df[column.name]
+            coerced, bad = _coerce_column(series, column)
+            if bad.any():
+                problems.append(f"欄位 '{column.name}' ({column.data_type}) 有 {int(bad.sum())} 個無效值，"
+                                f"例如: {_samples(series, bad)}")
+            if not column.nullable and series.isna().any():
+                problems.append(f"欄位 '{column.name}' 不可為空，但有 {int(series.isna().sum())} 行為空。")
+            out[column.name] = coerced
+        return pd.DataFrame(out, index=df.index), problems
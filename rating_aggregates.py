@@ -0,0 +1,136 @@
+"""Rating aggregates kept up to date by the CSV toolkit's imports.
+
+Each aggregate table holds the number, sum and average of one rating column per key of its
+source table, e.g. the average restaurant_rating per two_dish_rice_id, plus the time the key
+last changed. The tables are only created on request (rebuild(create=True), the batch command
+line's "aggregates --create"), never as a side effect of an import. Once a table exists, every
+INSERT or UPDATE the toolkit runs on its source returns the rows it changed (RETURNING) and the
+same statement folds them into the aggregate, so keeping it current costs time in proportion
+to the batch, not to the table; while it does not exist, the statements run untracked. Changes
+made outside the toolkit are not seen; rebuild() recomputes the aggregates from scratch.
+"""
+from collections import namedtuple
+
+from psycopg2 import sql
+
+# table: 匯總表格；source/key/value: 來源表格、分組欄位及評分欄位
+Aggregate = namedtuple('Aggregate', 'table source key value')
+
+AGGREGATES = [
+    Aggregate('comments_restaurant_rating_summary', 'comments_comment_rate', 'two_dish_rice_id', 'restaurant_rating'),
+    Aggregate('comments_comment_rating_summary', 'comments_commentrating', 'comment_id', 'rating'),
+]
+AGGREGATE_TABLES = [aggregate.table for aggregate in AGGREGATES]
+
+def aggregates_of(table_name):
+    """Returns the aggregates computed from a source table."""
+    return [aggregate for aggregate in AGGREGATES if aggregate.source == table_name]
+
+def _exists(cursor, table_name):
+    """Tells whether a table is visible in the search path."""
+    cursor.execute("SELECT to_regclass(%s) IS NOT NULL", (table_name,))
+    return cursor.fetchone()[0]
+
+def _summary_select(aggregate):
+    """Returns the GROUP BY query computing an aggregate from its whole source table."""
+    return sql.SQL(
+        "SELECT {key}, count({value}) AS rating_count, coalesce(sum({value}), 0)::numeric AS rating_sum, "
+        "now() AS last_updated FROM {source} WHERE {key} IS NOT NULL GROUP BY {key}").format(
+            key=sql.Identifier(aggregate.key), value=sql.Identifier(aggregate.value),
+            source=sql.Identifier(aggregate.source))
+
+def tracked(cursor, table_name):
+    """Returns the aggregates of a source table whose tables exist, i.e. the ones its changes update."""
+    return [aggregate for aggregate in aggregates_of(table_name) if _exists(cursor, aggregate.table)]
+
+def _create(cursor, aggregate):
+    """Creates an aggregate table filled from the current rows of its source."""
+    table = sql.Identifier(aggregate.table)
+    # 以 CREATE TABLE AS 建立，分組欄位沿用來源表格的類型
+    cursor.execute(sql.SQL("CREATE TABLE {table} AS {select}").format(table=table, select=_summary_select(aggregate)))
+    cursor.execute(sql.SQL(
+        "ALTER TABLE {table} ADD PRIMARY KEY ({key}), "
+        "ALTER COLUMN rating_count SET NOT NULL, ALTER COLUMN rating_sum SET NOT NULL, "
+        "ALTER COLUMN last_updated SET NOT NULL, "
+        "ADD COLUMN rating_avg numeric GENERATED ALWAYS AS (rating_sum / NULLIF(rating_count, 0)) STORED").format(
+            table=table, key=sql.Identifier(aggregate.key)))
+
+def clear(cursor, tables):
+    """Empties the existing aggregates of source tables whose rows have all been removed."""
+    targets = [aggregate.table for table_name in tables for aggregate in aggregates_of(table_name)
+               if _exists(cursor, aggregate.table)]
+    if targets:
+        cursor.execute(sql.SQL("TRUNCATE {tables}").format(
+            tables=sql.SQL(', ').join(sql.Identifier(table) for table in targets)))
+
+def rebuild(cursor, tables=None, create=False):
+    """Recomputes the aggregates of the given source tables (default: all) from their full contents.
+
+    Aggregate tables that do not exist are skipped, or with create, created and filled.
+    Returns the names of the aggregate tables that were filled.
+    """
+    filled = []
+    for aggregate in AGGREGATES:
+        if tables is not None and aggregate.source not in tables:
+            continue
+        if not _exists(cursor, aggregate.source):
+            continue
+        if not _exists(cursor, aggregate.table):
+            if create:
+                _create(cursor, aggregate)
+                filled.append(aggregate.table)
+            continue
+        table = sql.Identifier(aggregate.table)
+        cursor.execute(sql.SQL("TRUNCATE {table}").format(table=table))
+        cursor.execute(sql.SQL(
+            "INSERT INTO {table} ({key}, rating_count, rating_sum, last_updated) {select}").format(
+                table=table, key=sql.Identifier(aggregate.key), select=_summary_select(aggregate)))
+        filled.append(aggregate.table)
+    return filled
+
+def execute_tracked(cursor, table_name, statement, old_alias=None):
+    """Runs an INSERT or UPDATE on a source table and applies the rows it changed to its aggregates.
+
+    statement must alias the target table as "t" and have no RETURNING clause. For an UPDATE,
+    old_alias names a second reference to the table in the FROM list, joined to "t" on ctid,
+    which still holds the values from before the update. Aggregates whose table has not been
+    created are left out. Returns the number of rows changed.
+    """
+    aggregates = tracked(cursor, table_name)
+    if not aggregates:
+        cursor.execute(statement)
+        return cursor.rowcount
+
+    columns = list(dict.fromkeys(col for aggregate in aggregates for col in (aggregate.key, aggregate.value)))
+    returning = [sql.SQL("t.{c} AS {alias}").format(c=sql.Identifier(col), alias=sql.Identifier(f"new_{col}"))
+                 for col in columns]
+    if old_alias is not None:
+        returning += [sql.SQL("{o}.{c} AS {alias}").format(o=sql.Identifier(old_alias), c=sql.Identifier(col),
+                                                          alias=sql.Identifier(f"old_{col}")) for col in columns]
+    parts = [sql.SQL("changed AS ({statement} RETURNING {returning})").format(
+        statement=statement, returning=sql.SQL(', ').join(returning))]
+
+    for index, aggregate in enumerate(aggregates):
+        key = sql.Identifier(aggregate.key)
+        new_key, new_value = sql.Identifier(f"new_{aggregate.key}"), sql.Identifier(f"new_{aggregate.value}")
+        deltas = sql.SQL("SELECT {new_key} AS key, {new_value} AS value, 1 AS sign FROM changed").format(
+            new_key=new_key, new_value=new_value)
+        if old_alias is not None:
+            # 更新前的值從匯總中減去；分組欄位及評分都沒有改變的行不影響匯總
+            old_key, old_value = sql.Identifier(f"old_{aggregate.key}"), sql.Identifier(f"old_{aggregate.value}")
+            moved = sql.SQL("({old_key}, {old_value}) IS DISTINCT FROM ({new_key}, {new_value})").format(
+                old_key=old_key, old_value=old_value, new_key=new_key, new_value=new_value)
+            deltas = sql.SQL(
+                "SELECT {old_key} AS key, {old_value} AS value, -1 AS sign FROM changed WHERE {moved} "
+                "UNION ALL SELECT {new_key}, {new_value}, 1 FROM changed WHERE {moved}").format(
+                    old_key=old_key, old_value=old_value, new_key=new_key, new_value=new_value, moved=moved)
+        parts.append(sql.SQL(
+            "{name} AS (INSERT INTO {table} AS a ({key}, rating_count, rating_sum, last_updated) "
+            "SELECT key, coalesce(sum(sign) FILTER (WHERE value IS NOT NULL), 0), coalesce(sum(sign * value), 0), now() "
+            "FROM ({deltas}) d WHERE key IS NOT NULL GROUP BY key "
+            "ON CONFLICT ({key}) DO UPDATE SET rating_count = a.rating_count + excluded.rating_count, "
+            "rating_sum = a.rating_sum + excluded.rating_sum, last_updated = excluded.last_updated)").format(
+                name=sql.Identifier(f"aggregate_{index}"), table=sql.Identifier(aggregate.table), key=key,
+                deltas=deltas))
+    cursor.execute(sql.SQL("WITH {parts} SELECT count(*) FROM changed").format(parts=sql.SQL(', ').join(parts)))
+    return cursor.fetchone()[0]
@@ -0,0 +1,256 @@
+"""Shared fixtures: the sample files, catalog schemas guessed from DTYPE_PLANS and a fake database.
+
+FakeDatabase stands in for PostgreSQL on the import path. COPY batches, checkpoint rows and
+sequence values are kept per transaction and only become visible on commit; leaving a
+connection without committing rolls them back, like returning it to the pool does. The
+fake_db fixture replaces copy_frame_to_table with a recorder of COPY batches; sql_db keeps
+the toolkit's own statements and runs them on the tables of fake_sql.FakeTables instead.
+"""
+import contextlib
+import copy
+import json
+import os
+import shutil
+import sys
+
+import pandas as pd
+import pytest
+from psycopg2 import sql
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import clean_cache  # noqa: E402
+import csv_toolkit  # noqa: E402
+import toolkit_metrics  # noqa: E402
+from db_schema import ColumnInfo, TableSchema  # noqa: E402
+from fake_sql import FakeTables  # noqa: E402
+
+SAMPLE_FILES = {
+    'listings.csv': 'listings_two_dish_rice',
+    'adminuser.csv': 'adminusers_adminuser',
+    'comment_rate.csv': 'comments_comment_rate',
+    'commentrating.csv': 'comments_commentrating',
+    'foodie_contact.csv': 'foodie_contact',
+}
+
+COPY_FRAME_TO_TABLE = csv_toolkit.copy_frame_to_table
+
+def _column(table_name, name):
+    """Guesses the catalog entry of a column from its name and the table's cleaning plan."""
+    plan = csv_toolkit.DTYPE_PLANS[table_name]
+    if name == 'id':
+        return ColumnInfo(name, 'integer', False, "nextval('seq')", None, True, f'public.{table_name}_id_seq')
+    if name in plan['flags']:
+        return ColumnInfo(name, 'boolean', True, None, None, False, None)
+    if name.endswith('_id') or name == 'rating':
+        return ColumnInfo(name, 'integer', True, None, None, False, None)
+    if name.endswith('price') or name.endswith('rating'):
+        return ColumnInfo(name, 'numeric', True, None, None, False, None)
+    if name in ('list_date', 'edit_date', 'updated_date'):
+        return ColumnInfo(name, 'date', True, None, None, False, None)
+    if name == 'created_date':
+        return ColumnInfo(name, 'timestamp with time zone', True, None, None, False, None)
+    return ColumnInfo(name, 'character varying', True, None, 255, False, None)
+
+def table_schema(table_name, foreign_keys=()):
+    """Returns a TableSchema with every column the cleaning plan of the table knows."""
+    columns = [_column(table_name, name) for name in sorted(csv_toolkit.DTYPE_PLANS[table_name]['columns'])]
+    return TableSchema(table_name, columns, list(foreign_keys))
+
+def render(query):
+    """Returns the text of a psycopg2 sql composition without a connection."""
+    if isinstance(query, sql.Composed):
+        return ''.join(render(part) for part in query.seq)
+    if isinstance(query, sql.Identifier):
+        return '.'.join(f'"{name}"' for name in query.strings)
+    if isinstance(query, sql.Literal):
+        return "'" + str(query.wrapped).replace("'", "''") + "'"
+    if isinstance(query, sql.SQL):
+        return query.string
+    return str(query)
+
+def copy_text(frames):
+    """Returns the COPY text of a list of frames, the form compared by the equivalence checks."""
+    return ''.join(csv_toolkit._frame_to_copy_buffer(frame).getvalue() for frame in frames)
+
+class FakeDatabase:
+    """Committed and pending COPY batches, checkpoint rows and a sequence, per the rules above."""
+
+    def __init__(self):
+        self.rows = {}
+        self.checkpoints = {}
+        self.foreign_keys = []
+        self.schemas = {}
+        self.next_id = 1000
+        self.fail_copy_at = None
+        self.copies = 0
+        self.tables = FakeTables()
+        self.statements = []
+        self._pending_rows = {}
+        self._pending_checkpoints = {}
+        self._pending_tables = None
+
+    def frames(self, table_name):
+        """Returns the committed COPY batches of a table."""
+        return self.rows.get(table_name, [])
+
+    def create_table(self, schema, unique=()):
+        """Creates a table of sql_db from a TableSchema; its generated column is the primary key."""
+        generated = next((col.name for col in schema.columns.values() if col.generated), None)
+        keys = [(generated,)] if generated else []
+        self.tables.create(schema.name, {col.name: col.data_type for col in schema.columns.values()},
+                           keys + [tuple(key) for key in unique], generated)
+        self.schemas[schema.name] = schema
+
+    def table(self, table_name):
+        """Returns the committed rows of a sql_db table."""
+        return self.tables.rows(table_name)
+
+    def _tables(self):
+        """Returns the tables as the current transaction sees them."""
+        if self._pending_tables is None:
+            self._pending_tables = copy.deepcopy(self.tables)
+        return self._pending_tables
+
+    def copy(self, cursor, df, table_name):
+        self.copies += 1
+        if self.copies == self.fail_copy_at:
+            raise RuntimeError('連接中斷')
+        self._pending_rows.setdefault(table_name, []).append(df.copy())
+        return len(df)
+
+    def commit(self):
+        for table_name, frames in self._pending_rows.items():
+            self.rows.setdefault(table_name, []).extend(frames)
+        for key, progress in self._pending_checkpoints.items():
+            if progress is None:
+                self.checkpoints.pop(key, None)
+            else:
+                self.checkpoints[key] = progress
+        if self._pending_tables is not None:
+            self.tables = self._pending_tables
+        self.rollback()
+
+    def rollback(self):
+        self._pending_rows, self._pending_checkpoints, self._pending_tables = {}, {}, None
+
+    def copy_expert(self, text, buffer):
+        return self._tables().copy_from(text, buffer)
+
+    def execute(self, text, params):
+        """Runs the statements the import path sends; returns (result rows, rowcount)."""
+        self.statements.append(text)
+        result = self._tables().execute(text, params, self.foreign_keys)
+        if result is not None:
+            return result
+        rows = self._execute(text, params)
+        return rows, len(rows)
+
+    def _execute(self, text, params):
+        if csv_toolkit.CHECKPOINT_TABLE in text:
+            if text.startswith('SELECT progress'):
+                progress = self.checkpoints.get(tuple(params))
+                return [(json.loads(json.dumps(progress)),)] if progress else []
+            if text.startswith('INSERT'):
+                self._pending_checkpoints[tuple(params[:2])] = json.loads(params[2])
+            elif text.startswith('DELETE'):
+                self._pending_checkpoints[tuple(params)] = None
+            return []
+        if text.startswith('SELECT COUNT(*) FROM'):
+            table_name = text.split()[-1].strip('"')
+            rows = len(self._tables().rows(table_name)) if table_name in self._tables().tables else 0
+            return [(rows + sum(len(frame) for frame in self.frames(table_name)),)]
+        if 'nextval' in text:
+            ids = range(self.next_id, self.next_id + params[1])
+            self.next_id += params[1]
+            return [(value,) for value in ids]
+        return []
+
+class FakeCursor:
+    def __init__(self, db):
+        self._db = db
+        self._result = []
+        self.rowcount = -1
+
+    def execute(self, query, params=None):
+        self._result, self.rowcount = self._db.execute(query if isinstance(query, str) else render(query), params)
+
+    def copy_expert(self, query, buffer):
+        self.rowcount = self._db.copy_expert(query, buffer)
+
+    def fetchone(self):
+        return self._result[0] if self._result else None
+
+    def fetchall(self):
+        return list(self._result)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+class FakeConnection:
+    def __init__(self, db):
+        self._db = db
+
+    def cursor(self):
+        return FakeCursor(self._db)
+
+    def commit(self):
+        self._db.commit()
+
+@pytest.fixture(autouse=True)
+def quiet(monkeypatch):
+    """Keeps metrics and the clean cache out of the tests."""
+    monkeypatch.setitem(toolkit_metrics._settings, 'metrics', 'off')
+    monkeypatch.setitem(toolkit_metrics._settings, 'verbosity', 0)
+    monkeypatch.setitem(clean_cache._settings, 'max_mb', 0)
+
+@pytest.fixture
+def samples(tmp_path):
+    """Copies the sample files to a temporary directory (checkpoints and rejects are written beside them)."""
+    for name in SAMPLE_FILES:
+        shutil.copy(os.path.join(ROOT, name), tmp_path / name)
+    return tmp_path
+
+@pytest.fixture
+def fake_db(monkeypatch):
+    """Routes the import path of csv_toolkit to a FakeDatabase."""
+    db = FakeDatabase()
+
+    @contextlib.contextmanager
+    def connection():
+        try:
+            yield FakeConnection(db)
+        finally:
+            db.rollback()
+
+    def reference_keys(cursor, table_name, column):
+        frames = db.frames(table_name)
+        if not frames:
+            return pd.Index([])
+        return pd.Index(pd.concat(frames)[column].dropna().astype('int64'))
+
+    monkeypatch.setattr(csv_toolkit, 'db_connection', connection)
+    monkeypatch.setattr(csv_toolkit, 'copy_frame_to_table', db.copy)
+    monkeypatch.setattr(csv_toolkit, 'get_foreign_keys', lambda cursor: db.foreign_keys)
+    monkeypatch.setattr(csv_toolkit, 'get_table_schema', lambda cursor, table_name: db.schemas.get(table_name))
+    monkeypatch.setattr(csv_toolkit, '_reference_keys', reference_keys)
+    csv_toolkit.forget_id_maps()
+    yield db
+    csv_toolkit.forget_id_maps()
+
+@pytest.fixture
+def sql_db(fake_db, monkeypatch):
+    """Like fake_db, but COPY, merges and aggregates run as SQL on fake_db.tables."""
+    def reference_keys(cursor, table_name, column):
+        return pd.Index([row[column] for row in fake_db._tables().rows(table_name) if row[column] is not None])
+
+    monkeypatch.setattr(csv_toolkit, 'copy_frame_to_table', COPY_FRAME_TO_TABLE)
+    monkeypatch.setattr(csv_toolkit, '_reference_keys', reference_keys)
+    for cls in (sql.Composed, sql.SQL, sql.Identifier, sql.Literal):
+        # as_string() 需要真正的連接來加引號
+        monkeypatch.setattr(cls, 'as_string', lambda self, context: render(self))
+    return fake_db
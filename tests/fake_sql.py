@@ -0,0 +1,271 @@
+"""In-memory tables that understand the statements the toolkit's write paths send.
+
+FakeTables interprets the exact shapes built by csv_toolkit (COPY into a staging table, the
+ON CONFLICT DO NOTHING merge, the natural-key sync, TRUNCATE) and rating_aggregates (the
+RETURNING deltas of execute_tracked, rebuild and create), matched with regular expressions
+on the rendered SQL. Values are typed from the column types, every row has a ctid and counts
+the times it was written, and unique keys and foreign keys are enforced where PostgreSQL
+would. Statements of any other shape return None so the caller can handle them.
+"""
+import csv
+import re
+from decimal import Decimal
+
+import psycopg2
+
+INTEGER_TYPES = ('smallint', 'integer', 'bigint')
+NUMERIC_TYPES = ('numeric', 'real', 'double precision')
+
+# 以下片段會嵌入其他語句的模式，因此不使用反向引用
+LATEST = r'\(SELECT DISTINCT ON \((.+?)\) (.+?) FROM "([^"]+)" ORDER BY .+?, ctid DESC\) s'
+SUMMARY = (r'SELECT "([^"]+)", count\("([^"]+)"\) AS rating_count, coalesce\(sum\("[^"]+"\), 0\)::numeric AS rating_sum, '
+           r'now\(\) AS last_updated FROM "([^"]+)" WHERE "[^"]+" IS NOT NULL GROUP BY "[^"]+"')
+AGGREGATE = (r'INSERT INTO "([^"]+)" AS a \("([^"]+)", rating_count, rating_sum, last_updated\) '
+             r'SELECT key, coalesce\(sum\(sign\) FILTER \(WHERE value IS NOT NULL\), 0\), '
+             r'coalesce\(sum\(sign \* value\), 0\), now\(\) FROM \((.+)\) d WHERE key IS NOT NULL GROUP BY key '
+             r'ON CONFLICT \("\2"\) DO UPDATE SET rating_count = a\.rating_count \+ excluded\.rating_count, '
+             r'rating_sum = a\.rating_sum \+ excluded\.rating_sum, last_updated = excluded\.last_updated')
+DELTA = (r'SELECT "([^"]+)"(?: AS key)?, "([^"]+)"(?: AS value)?, (-?1)(?: AS sign)? FROM changed'
+         r'(?: WHERE \("([^"]+)", "([^"]+)"\) IS DISTINCT FROM \("([^"]+)", "([^"]+)"\))?')
+
+def _names(text):
+    return re.findall(r'"([^"]+)"', text)
+
+def _key_pairs(text):
+    return re.findall(r't\."([^"]+)" = s\."([^"]+)"', text)
+
+def _value(data_type, text):
+    """Converts a COPY field to the Python value the column type holds."""
+    if text is None:
+        return None
+    if data_type in INTEGER_TYPES:
+        return int(text)
+    if data_type in NUMERIC_TYPES:
+        return Decimal(text)
+    if data_type == 'boolean':
+        return text.strip().lower() in ('t', 'true', 'y', 'yes', 'on', '1')
+    return text
+
+class Row(dict):
+    """A table row: column values plus its ctid and the number of times it was written."""
+
+    def __init__(self, values, ctid):
+        super().__init__(values)
+        self.ctid = ctid
+        self.writes = 1
+
+class FakeTable:
+    def __init__(self, name, columns, unique=(), generated=None):
+        self.name = name
+        self.columns = dict(columns)
+        self.unique = [tuple(key) for key in unique]
+        self.generated = generated
+        self.next_id = 1
+        self.rows = []
+
+class FakeTables:
+    """The tables of one database state; copy it (copy.deepcopy) to get a transaction."""
+
+    def __init__(self):
+        self.tables = {}
+        self._ctid = 0
+
+    def create(self, name, columns, unique=(), generated=None):
+        """Creates a table; generated names a column filled from its own sequence when omitted."""
+        self.tables[name] = FakeTable(name, columns, unique, generated)
+        return self.tables[name]
+
+    def rows(self, name):
+        return self.tables[name].rows
+
+    def insert(self, name, rows):
+        """Inserts rows (dicts of column values) as INSERT without a column list would."""
+        table = self.tables[name]
+        for values in rows:
+            self._insert(table, values, values)
+
+    def _insert(self, table, values, explicit):
+        """Inserts a row unless it conflicts with a unique key; returns the row or None."""
+        row = {col: values.get(col) for col in table.columns}
+        if table.generated is not None and table.generated not in explicit:
+            row[table.generated] = table.next_id
+            table.next_id += 1
+        for key in table.unique:
+            new_key = tuple(row[col] for col in key)
+            if None not in new_key and any(tuple(old[col] for col in key) == new_key for old in table.rows):
+                return None
+        self._ctid += 1
+        row = Row(row, self._ctid)
+        table.rows.append(row)
+        return row
+
+    def _source(self, text):
+        """Returns the rows of a staging table or of the DISTINCT ON subquery over it."""
+        match = re.fullmatch(r'"([^"]+)"', text)
+        if match:
+            return [dict(row) for row in self.rows(match[1])]
+        match = re.fullmatch(LATEST, text)
+        keys, columns = _names(match[1]), _names(match[2])
+        latest = {}
+        for row in sorted(self.rows(match[3]), key=lambda row: row.ctid):
+            latest[tuple(row[col] for col in keys)] = {col: row[col] for col in columns}
+        return list(latest.values())
+
+    def _summary(self, key, value, source):
+        groups = {}
+        for row in self.rows(source):
+            if row[key] is None:
+                continue
+            count, total = groups.get(row[key], (0, 0))
+            if row[value] is not None:
+                count, total = count + 1, total + row[value]
+            groups[row[key]] = (count, total)
+        return [{key: group, 'rating_count': count, 'rating_sum': total, 'last_updated': 'now'}
+                for group, (count, total) in groups.items()]
+
+    def _dml(self, text):
+        """Runs an INSERT or UPDATE; returns the (old row, new row) pairs it changed, or None."""
+        match = re.fullmatch(r'INSERT INTO "([^"]+)" AS t \((.+?)\) SELECT (.+?) FROM (.+) ON CONFLICT DO NOTHING', text)
+        if match:
+            table, columns, source = self.tables[match[1]], _names(match[2]), match[4]
+            missing = re.fullmatch(r'(.+) WHERE NOT EXISTS \(SELECT 1 FROM "([^"]+)" t WHERE (.+)\)', source)
+            rows = self._source(missing[1] if missing else source)
+            if missing:
+                pairs = _key_pairs(missing[3])
+                existing = {tuple(row[t] for t, _ in pairs) for row in table.rows}
+                rows = [row for row in rows if tuple(row[s] for _, s in pairs) not in existing]
+            changes = []
+            for values in rows:
+                row = self._insert(table, {col: values[col] for col in columns}, columns)
+                if row is not None:
+                    changes.append((None, row))
+            return changes
+
+        match = re.fullmatch(r'UPDATE "([^"]+)" t SET (.+?) FROM (' + LATEST + r')(?:, "[^"]+" o)? '
+                             r'WHERE (?:o\.ctid = t\.ctid AND )?(.+?) AND md5\(ROW\((.+?)\)::text\) <> '
+                             r'md5\(ROW\((.+?)\)::text\)', text)
+        if match:
+            table = self.tables[match[1]]
+            assignments = re.findall(r'"([^"]+)" = s\."([^"]+)"', match[2])
+            pairs = _key_pairs(match[7])
+            t_columns = re.findall(r'"?t"?\."([^"]+)"', match[8])
+            s_columns = re.findall(r'"?s"?\."([^"]+)"', match[9])
+            assert t_columns and len(t_columns) == len(s_columns), text
+            latest = {tuple(row[s] for _, s in pairs): row for row in self._source(match[3])}
+            changes = []
+            for row in table.rows:
+                source = latest.get(tuple(row[t] for t, _ in pairs))
+                if source is None:
+                    continue
+                # md5(ROW(...)::text) 比較的是文字形式，例如 numeric 4.50 與 4.5 不同
+                if [str(row[col]) for col in t_columns] == [str(source[col]) for col in s_columns]:
+                    continue
+                old = dict(row)
+                for target, column in assignments:
+                    row[target] = source[column]
+                row.writes += 1
+                changes.append((old, row))
+            return changes
+        return None
+
+    def _tracked(self, text):
+        """Runs execute_tracked's WITH changed AS (... RETURNING ...) statement."""
+        match = re.fullmatch(r'WITH changed AS \((.+?) RETURNING (.+?)\), (.+) SELECT count\(\*\) FROM changed', text)
+        changes = self._dml(match[1])
+        returning = re.findall(r'"?(t|o)"?\."([^"]+)" AS "([^"]+)"', match[2])
+        changed = [{alias: (new if source == 't' else old)[col] for source, col, alias in returning}
+                   for old, new in changes]
+        for part in re.split(r'(?:, )?"aggregate_\d+" AS \(', match[3])[1:]:
+            aggregate = re.fullmatch(AGGREGATE, part[:-1])
+            table, key = self.tables[aggregate[1]], aggregate[2]
+            deltas = []
+            for branch in aggregate[3].split(' UNION ALL '):
+                delta = re.fullmatch(DELTA, branch)
+                for record in changed:
+                    if delta[4] and (record[delta[4]], record[delta[5]]) == (record[delta[6]], record[delta[7]]):
+                        continue
+                    deltas.append((record[delta[1]], record[delta[2]], int(delta[3])))
+            groups = {}
+            for group, value, sign in deltas:
+                if group is None:
+                    continue
+                count, total = groups.get(group, (0, 0))
+                if value is not None:
+                    count, total = count + sign, total + sign * value
+                groups[group] = (count, total)
+            for group, (count, total) in groups.items():
+                row = next((row for row in table.rows if row[key] == group), None)
+                if row is None:
+                    self._insert(table, {key: group, 'rating_count': count, 'rating_sum': total,
+                                         'last_updated': 'now'}, [key])
+                else:
+                    row['rating_count'] += count
+                    row['rating_sum'] += total
+        return [(len(changes),)], len(changes)
+
+    def execute(self, text, params=None, foreign_keys=()):
+        """Runs a statement; returns (result rows, rowcount), or None for a shape it does not know."""
+        if text == "SELECT to_regclass(%s) IS NOT NULL":
+            return [(params[0] in self.tables,)], 1
+        if text == "SELECT table_name FROM information_schema.tables WHERE table_name = ANY(%s)":
+            rows = [(name,) for name in params[0] if name in self.tables]
+            return rows, len(rows)
+        match = re.fullmatch(r'CREATE TEMP TABLE "([^"]+)" AS SELECT (.+) FROM "([^"]+)" WITH NO DATA', text)
+        if match:
+            source = self.tables[match[3]]
+            self.create(match[1], {col: source.columns[col] for col in _names(match[2])})
+            return [], -1
+        match = re.fullmatch(r'DROP TABLE "([^"]+)"', text)
+        if match:
+            del self.tables[match[1]]
+            return [], -1
+        match = re.fullmatch(r'TRUNCATE (.+?)( RESTART IDENTITY)?( CASCADE)?', text)
+        if match:
+            names = _names(match[1])
+            blocking = [fk for fk in foreign_keys if fk[2] in names and fk[0] not in names and fk[0] in self.tables]
+            if blocking and not match[3]:
+                raise psycopg2.errors.FeatureNotSupported(
+                    f'cannot truncate a table referenced in a foreign key constraint: {blocking[0][0]}')
+            for name in names:
+                self.tables[name].rows = []
+                if match[2]:
+                    self.tables[name].next_id = 1
+            return [], -1
+        match = re.fullmatch(r'CREATE TABLE "([^"]+)" AS ' + SUMMARY, text)
+        if match:
+            source = self.tables[match[4]]
+            table = self.create(match[1], {match[2]: source.columns[match[2]], 'rating_count': 'bigint',
+                                           'rating_sum': 'numeric', 'last_updated': 'timestamp'})
+            for values in self._summary(match[2], match[3], match[4]):
+                self._insert(table, values, values)
+            return [], -1
+        match = re.fullmatch(r'ALTER TABLE "([^"]+)" ADD PRIMARY KEY \("([^"]+)"\), .+', text)
+        if match:
+            self.tables[match[1]].unique.append((match[2],))
+            return [], -1
+        match = re.fullmatch(r'INSERT INTO "([^"]+)" \("([^"]+)", rating_count, rating_sum, last_updated\) ' + SUMMARY, text)
+        if match:
+            rows = self._summary(match[3], match[4], match[5])
+            for values in rows:
+                self._insert(self.tables[match[1]], values, values)
+            return [], len(rows)
+        if text.startswith('WITH changed AS ('):
+            return self._tracked(text)
+        changes = self._dml(text)
+        if changes is not None:
+            return [], len(changes)
+        return None
+
+    def copy_from(self, text, buffer):
+        """Runs COPY ... FROM STDIN (FORMAT csv) into a table; returns None for other COPY statements."""
+        match = re.fullmatch(r'COPY "([^"]+)" \((.+)\) FROM STDIN WITH \(FORMAT csv, NULL \'(.*)\'\)', text)
+        if not match:
+            return None
+        table, columns, null = self.tables[match[1]], _names(match[2]), match[3].replace("''", "'")
+        count = 0
+        for fields in csv.reader(buffer):
+            values = {col: _value(table.columns[col], None if field == null else field)
+                      for col, field in zip(columns, fields)}
+            self._insert(table, values, columns)
+            count += 1
+        return count
@@ -0,0 +1,47 @@
+"""The Arrow CSV parser yields the same cleaned data as the default pandas parser."""
+import pytest
+
+import csv_toolkit
+from conftest import ROOT, SAMPLE_FILES, copy_text, table_schema
+from toolkit_metrics import OperationMetrics
+
+pytest.importorskip('pyarrow')
+
+def _cleaned(csv_file, table_name, chunk_size, schema, csv_parser):
+    chunks = csv_toolkit._iter_cleaned_chunks(csv_file, table_name, chunk_size, OperationMetrics('import'),
+                                              schema=schema, csv_parser=csv_parser)
+    return [(copy_text([chunk]), [str(dtype) for dtype in chunk.dtypes]) for chunk in chunks]
+
+@pytest.mark.parametrize('name', sorted(SAMPLE_FILES))
+@pytest.mark.parametrize('chunk_size', [None, 3, 7])
+@pytest.mark.parametrize('with_schema', [False, True])
+def test_arrow_matches_pandas(name, chunk_size, with_schema):
+    csv_file, table_name = f"{ROOT}/{name}", SAMPLE_FILES[name]
+    schema = table_schema(table_name) if with_schema else None
+    assert (_cleaned(csv_file, table_name, chunk_size, schema, 'arrow')
+            == _cleaned(csv_file, table_name, chunk_size, schema, 'pandas'))
+
+def test_arrow_matches_pandas_on_awkward_values(tmp_path):
+    csv_file = tmp_path / 'adminuser.csv'
+    csv_file.write_text(
+        'id,admin_name,admin_email,admin_password\n'
+        '1,"名字, 有逗號",a@example.com,"多行\n密碼"\n'
+        '2,NA,b@example.com,\n'
+        '3,  空白  ,c@example.com,null\n'
+        '4,TRUE,d@example.com,123\n', encoding='utf-8')
+    table_name = 'adminusers_adminuser'
+    for chunk_size in (None, 2):
+        assert (_cleaned(str(csv_file), table_name, chunk_size, None, 'arrow')
+                == _cleaned(str(csv_file), table_name, chunk_size, None, 'pandas'))
+
+def test_integers_beyond_int64_keep_their_digits(tmp_path):
+    csv_file = tmp_path / 'numbers.csv'
+    csv_file.write_text('big,huge\n'
+                        '18446744073709551615,99999999999999999999\n'
+                        '1,2\n', encoding='utf-8')
+    pandas_frame = next(iter(csv_toolkit._read_frames(str(csv_file), None, 'csv')))
+    arrow_frame = next(iter(csv_toolkit._read_frames(str(csv_file), None, 'csv', csv_parser='arrow')))
+    assert str(arrow_frame['big'].dtype) == str(pandas_frame['big'].dtype) == 'uint64'
+    # 超出 uint64 的整數不轉為 float64，數字保持不變
+    assert arrow_frame['huge'].tolist() == ['99999999999999999999', '2']
+    assert copy_text([arrow_frame]) == copy_text([pandas_frame])
@@ -0,0 +1,13 @@
+"""The benchmark console summary."""
+import benchmark
+
+def test_stage_summary_formats_speed():
+    stage = {'seconds': 2.0, 'rows': 3000, 'rows_per_second': 1500.0, 'peak_rss_mb': 80.5}
+    assert benchmark._stage_summary('read', stage) == "read 1,500 行/秒 (80.5 MB)"
+
+def test_stage_summary_without_speed():
+    stage = {'seconds': 0.0, 'rows': 0, 'rows_per_second': None, 'peak_rss_mb': 80.5}
+    assert benchmark._stage_summary('load', stage) == "load - 行/秒 (80.5 MB)"
+
+def test_stage_summary_error():
+    assert benchmark._stage_summary('load', {'error': '連接失敗'}) == "load 失敗: 連接失敗"
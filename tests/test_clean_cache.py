@@ -0,0 +1,38 @@
+"""The clean cache is off by default and, once enabled, replays exactly what cleaning produced."""
+import os
+import stat
+import subprocess
+import sys
+
+import clean_cache
+import csv_toolkit
+from conftest import ROOT, copy_text
+from toolkit_metrics import OperationMetrics
+
+CSV_FILE, TABLE = f"{ROOT}/listings.csv", 'listings_two_dish_rice'
+
+def _cleaned(chunk_size):
+    metrics = OperationMetrics('import')
+    return copy_text(csv_toolkit._iter_cleaned_chunks(CSV_FILE, TABLE, chunk_size, metrics)), metrics
+
+def test_cache_is_opt_in(monkeypatch, tmp_path):
+    env = {name: value for name, value in os.environ.items() if name != 'TOOLKIT_CACHE_MAX_MB'}
+    result = subprocess.run([sys.executable, '-c', 'import clean_cache; print(clean_cache.enabled())'],
+                            cwd=ROOT, env=env, capture_output=True, text=True, check=True)
+    assert result.stdout.strip() == 'False'
+    monkeypatch.setitem(clean_cache._settings, 'cache_dir', str(tmp_path / 'cache'))
+    _cleaned(7)
+    assert not (tmp_path / 'cache').exists()
+
+def test_cached_chunks_match_cleaned_chunks(monkeypatch, tmp_path):
+    cache_dir = tmp_path / 'cache'
+    monkeypatch.setitem(clean_cache._settings, 'cache_dir', str(cache_dir))
+    monkeypatch.setitem(clean_cache._settings, 'max_mb', clean_cache.DEFAULT_MAX_MB)
+    for chunk_size in (None, 7):
+        cleaned, first = _cleaned(chunk_size)
+        replayed, second = _cleaned(chunk_size)
+        assert replayed == cleaned
+        assert second.rows('cache') > 0 and first.rows('cache') == 0
+        assert second.rows('clean') == first.rows('clean')
+        assert second.dropped == first.dropped
+    assert stat.S_IMODE(os.stat(cache_dir).st_mode) == 0o700
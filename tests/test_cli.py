@@ -0,0 +1,37 @@
+"""The batch command line: its import options reach import_csv_to_db, and csv_toolkit.py hands off to it early."""
+import subprocess
+import sys
+
+import pytest
+
+import csv_toolkit
+import toolkit_cli
+from conftest import ROOT
+
+@pytest.fixture
+def imports(monkeypatch):
+    calls = []
+    monkeypatch.setattr(toolkit_cli, '_configure_output', lambda args: None)
+    monkeypatch.setattr(csv_toolkit, 'import_csv_to_db', lambda *args, **options: calls.append((args, options)) or True)
+    return calls
+
+def test_remap_ids_flag_reaches_the_import(imports):
+    assert toolkit_cli.main(['import', 'comments_commentrating', 'commentrating.csv', '--remap-ids']) == 0
+    assert [options['remap_ids'] for _, options in imports] == [True]
+    assert toolkit_cli.main(['import', 'comments_commentrating', 'commentrating.csv']) == 0
+    assert imports[-1][1]['remap_ids'] is False
+
+def test_remap_ids_cannot_resume(imports, capsys):
+    with pytest.raises(SystemExit) as exit_info:
+        toolkit_cli.main(['import', 'comments_commentrating', 'commentrating.csv', '--chunk-size', '5',
+                          '--resume', '--remap-ids'])
+    assert exit_info.value.code == 2 and '--remap-ids' in capsys.readouterr().err
+    assert not imports
+
+def test_csv_toolkit_with_arguments_skips_heavy_imports():
+    # -X importtime 把每個導入的模塊寫到 stderr
+    result = subprocess.run([sys.executable, '-X', 'importtime', 'csv_toolkit.py', '--help'],
+                            cwd=ROOT, capture_output=True, text=True)
+    assert result.returncode == 0 and 'import' in result.stdout
+    imported = {line.split('|')[-1].strip() for line in result.stderr.splitlines()}
+    assert not imported & {'pandas', 'numpy', 'psycopg2'}
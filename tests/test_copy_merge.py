@@ -0,0 +1,41 @@
+"""COPY imports merge through a staging table and report the rows inserted and skipped as duplicates."""
+import re
+
+import pytest
+
+import csv_toolkit
+from conftest import table_schema
+
+TABLE = 'comments_comment_rate'
+
+@pytest.fixture
+def comment_table(sql_db):
+    sql_db.create_table(table_schema(TABLE), unique=[csv_toolkit.NATURAL_KEYS[TABLE]])
+    return sql_db
+
+def _import(csv_file, capsys):
+    assert csv_toolkit.import_csv_to_db(str(csv_file), TABLE, chunk_size=7, if_exists='append')
+    out = capsys.readouterr().out
+    inserted = int(re.search(r'成功插入 (\d+) 筆新數據', out)[1])
+    skipped = re.search(r'跳過了 (\d+) 筆重複數據', out)
+    return inserted, int(skipped[1]) if skipped else 0
+
+def test_rerun_skips_every_row(samples, comment_table, capsys):
+    inserted, skipped = _import(samples / 'comment_rate.csv', capsys)
+    rows = len(comment_table.table(TABLE))
+    assert rows > 0 and (inserted, skipped) == (rows, 0)
+
+    assert _import(samples / 'comment_rate.csv', capsys) == (0, rows)
+    assert len(comment_table.table(TABLE)) == rows
+    assert all(row.writes == 1 for row in comment_table.table(TABLE))
+    assert not [name for name in comment_table.tables.tables if name.startswith('_stage_')]
+
+def test_partly_loaded_file_inserts_only_new_rows(samples, comment_table, capsys):
+    lines = (samples / 'comment_rate.csv').read_text(encoding='utf-8-sig').splitlines(keepends=True)
+    first = samples / 'first.csv'
+    first.write_text(''.join(lines[:11]), encoding='utf-8')
+    loaded, _ = _import(first, capsys)
+
+    inserted, skipped = _import(samples / 'comment_rate.csv', capsys)
+    assert 0 < loaded < len(comment_table.table(TABLE))
+    assert skipped == loaded and inserted == len(comment_table.table(TABLE)) - loaded
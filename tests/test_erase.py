@@ -0,0 +1,49 @@
+"""Erasing tables is one TRUNCATE transaction that never reaches tables the caller did not name."""
+import pytest
+
+import csv_toolkit
+import rating_aggregates
+from conftest import table_schema
+
+PARENT, CHILD = 'comments_comment_rate', 'comments_commentrating'
+FOREIGN_KEY = (CHILD, 'comment_id', PARENT, 'id')
+
+@pytest.fixture
+def linked_tables(sql_db):
+    sql_db.foreign_keys = [FOREIGN_KEY]
+    sql_db.create_table(table_schema(PARENT))
+    sql_db.create_table(table_schema(CHILD, [FOREIGN_KEY]))
+    sql_db.tables.insert(PARENT, [{'comment': '好味'}, {'comment': '一般'}])
+    sql_db.tables.insert(CHILD, [{'comment_id': 1, 'rating': 5}, {'comment_id': 2, 'rating': 3}])
+    return sql_db
+
+def _sizes(db):
+    return len(db.table(PARENT)), len(db.table(CHILD))
+
+def test_referenced_table_is_not_erased_without_its_dependents(linked_tables, monkeypatch):
+    monkeypatch.setattr('builtins.input', lambda prompt: 'n')
+    assert not csv_toolkit.erase_tables([PARENT], confirm=False)
+    assert not csv_toolkit.erase_tables([PARENT], confirm=True)
+    assert _sizes(linked_tables) == (2, 2)
+
+@pytest.mark.parametrize('tables, cascade', [([PARENT, CHILD], False), ([PARENT], True)])
+def test_group_is_erased_and_identities_restart(linked_tables, tables, cascade):
+    assert csv_toolkit.erase_tables(tables, confirm=False, cascade=cascade)
+    assert _sizes(linked_tables) == (0, 0)
+    assert linked_tables.tables.tables[PARENT].next_id == 1
+
+def test_failure_after_truncate_erases_nothing(linked_tables, monkeypatch):
+    def fail(cursor, targets):
+        raise RuntimeError('連接中斷')
+
+    monkeypatch.setattr(rating_aggregates, 'clear', fail)
+    assert not csv_toolkit.erase_tables([PARENT, CHILD], confirm=False)
+    # TRUNCATE 與清除匯總在同一事務中，失敗時一併回滾
+    assert _sizes(linked_tables) == (2, 2)
+    assert linked_tables.tables.tables[PARENT].next_id == 3
+
+def test_truncate_does_not_cascade_to_unlisted_tables(linked_tables, monkeypatch):
+    # 外鍵查詢遺漏了依賴表格時，TRUNCATE 報錯而不是連同未列出的表格一併清除
+    monkeypatch.setattr(csv_toolkit, 'get_foreign_keys', lambda cursor: [])
+    assert not csv_toolkit.erase_tables([PARENT], confirm=False)
+    assert _sizes(linked_tables) == (2, 2)
@@ -0,0 +1,79 @@
+"""A partitioned export reads the table once, sorted by the partition column, and splits it into files."""
+import contextlib
+
+import pandas as pd
+import pytest
+
+import csv_toolkit
+from conftest import render
+from db_schema import ColumnInfo, TableSchema
+
+TABLE = 'listings_two_dish_rice'
+ROWS = [(1, '中西區', 10), (2, '灣仔', None), (3, '中西區', 12), (4, None, 8), (5, '灣仔', 9), (6, '中西區', 7)]
+DESCRIPTION = [('id', 23), ('restaurant_district', 1043), ('rating', 23)]
+
+class ExportCursor:
+    """Answers the profile query and, as a named cursor, streams the rows sorted by district."""
+
+    def __init__(self, queries, named):
+        self._queries, self._named = queries, named
+        self._result, self.description = [], None
+
+    def execute(self, query, params=None):
+        text = query if isinstance(query, str) else render(query)
+        self._queries.append(text)
+        if self._named:
+            # SELECT 分區欄位, * ... ORDER BY 分區欄位；NULL 排在最後，與 PostgreSQL 相同
+            rows = sorted(ROWS, key=lambda row: (row[1] is None, row[1] or ''))
+            self._result = [(row[1],) + row for row in rows]
+            self.description = [('restaurant_district', 1043)] + DESCRIPTION
+        elif 'GROUP BY' in text:
+            districts = {row[1] for row in ROWS}
+            self._result = [(district, any(row[2] is None for row in ROWS if row[1] == district))
+                            for district in districts]
+
+    def fetchmany(self, size):
+        rows, self._result = self._result[:size], self._result[size:]
+        return rows
+
+    def fetchall(self):
+        return self.fetchmany(len(self._result))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+@pytest.fixture
+def queries(monkeypatch):
+    executed = []
+
+    class Connection:
+        def cursor(self, name=None):
+            return ExportCursor(executed, name is not None)
+
+    schema = TableSchema(TABLE, [ColumnInfo('id', 'integer', False, None, None, True, None),
+                                 ColumnInfo('restaurant_district', 'character varying', True, None, 255, False, None),
+                                 ColumnInfo('rating', 'integer', True, None, None, False, None)], [])
+    monkeypatch.setattr(csv_toolkit, 'db_connection', lambda: contextlib.nullcontext(Connection()))
+    monkeypatch.setattr(csv_toolkit, 'get_table_schema', lambda cursor, table_name: schema)
+    monkeypatch.setattr(csv_toolkit, 'EXPORT_FETCH_SIZE', 2) # 分區跨越多批數據
+    return executed
+
+def test_partitions_come_from_one_sorted_query(tmp_path, queries):
+    csv_file = tmp_path / 'listings.csv'
+    assert csv_toolkit.export_db_to_csv(TABLE, str(csv_file), partition_by='restaurant_district')
+
+    selects = [text for text in queries if text.startswith('SELECT')]
+    assert len(selects) == 2 # 一次分組查詢取得格式，一次排序查詢寫入所有分區
+    assert selects[1].endswith('ORDER BY "restaurant_district"')
+    files = {path.name: pd.read_csv(path, encoding='utf-8-sig') for path in tmp_path.iterdir()}
+    assert sorted(files) == ['listings___null__.csv', 'listings_中西區.csv', 'listings_灣仔.csv']
+    assert files['listings_中西區.csv']['id'].tolist() == [1, 3, 6]
+    assert files['listings_灣仔.csv']['id'].tolist() == [2, 5]
+    assert files['listings___null__.csv']['id'].tolist() == [4]
+    # 各文件按自身的數據決定格式：只有含 NULL 的分區把整數欄位寫成浮點數
+    assert '10\n' in (tmp_path / 'listings_中西區.csv').read_text(encoding='utf-8-sig')
+    assert '9.0\n' in (tmp_path / 'listings_灣仔.csv').read_text(encoding='utf-8-sig')
+    assert not list(tmp_path.glob('*.part'))
@@ -0,0 +1,37 @@
+"""Foreign keys are checked on the values that will be written, whatever dtype the file gave them."""
+import pandas as pd
+
+import csv_toolkit
+from db_schema import ColumnInfo, ImportPlan, TableSchema
+
+PARENT, CHILD = 'comments_comment_rate', 'dish_reviews'
+FOREIGN_KEY = (CHILD, 'comment_id', PARENT, 'id')
+SCHEMA = TableSchema(CHILD, [ColumnInfo('id', 'integer', False, "nextval('seq')", None, True, 'public.seq'),
+                             ColumnInfo('comment_id', 'integer', True, None, None, False, None),
+                             ColumnInfo('note', 'character varying', True, None, 255, False, None)],
+                     [FOREIGN_KEY])
+
+def test_float_and_padded_keys_match_integer_keys(fake_db):
+    fake_db.rows[PARENT] = [pd.DataFrame({'id': [1, 2, 3, 5]})]
+    plan = ImportPlan(SCHEMA, ['comment_id', 'note'])
+    for keys in ([5.0, None, 2.0, 7.0], [' 5', None, '2 ', '7']):
+        df_to_insert, problems = plan.apply(pd.DataFrame({'comment_id': keys, 'note': list('abcd')}))
+        assert not problems
+        valid, orphans = csv_toolkit._split_orphans(None, df_to_insert, [FOREIGN_KEY])
+        assert valid['note'].tolist() == ['a', 'b', 'c']
+        assert orphans['note'].tolist() == ['d']
+
+def test_blank_keys_of_a_table_without_cleaning_rules_are_not_orphans(samples, fake_db):
+    fake_db.rows[PARENT] = [pd.DataFrame({'id': [1, 2, 3, 5]})]
+    fake_db.foreign_keys = [FOREIGN_KEY]
+    fake_db.schemas[CHILD] = SCHEMA
+    csv_file = samples / 'dish_reviews.csv'
+    # 空白使 comment_id 讀取為 float64 (5.0, NaN, 2.0, 7.0)
+    csv_file.write_text('id,comment_id,note\n1,5,a\n2,,b\n3,2,c\n4,7,d\n', encoding='utf-8')
+    assert csv_toolkit.import_csv_to_db(str(csv_file), CHILD, if_exists='append')
+
+    written = pd.concat(fake_db.frames(CHILD))
+    assert written['note'].tolist() == ['a', 'b', 'c']
+    assert written['comment_id'].tolist()[::2] == [5, 2]
+    rejects = pd.read_csv(samples / f"dish_reviews{csv_toolkit.REJECT_SUFFIX}", encoding='utf-8-sig')
+    assert rejects['id'].tolist() == [4] and rejects['comment_id'].tolist() == [7.0]
@@ -0,0 +1,34 @@
+"""A chunk that does not fit the table's schema stops the import before anything is written."""
+import pytest
+
+import csv_toolkit
+from conftest import table_schema
+
+TABLE = 'comments_commentrating'
+TOO_LONG = 'x' * 300 # rater_name 為 character varying(255)
+
+@pytest.fixture
+def rating_table(sql_db):
+    sql_db.create_table(table_schema(TABLE))
+    sql_db.tables.insert(TABLE, [{'rater_id': 1, 'rater_name': '舊記錄', 'rating': 3, 'comment_id': 1}])
+    return sql_db
+
+def _write(samples, bad_line):
+    lines = (samples / 'commentrating.csv').read_text(encoding='utf-8-sig').splitlines()
+    fields = lines[bad_line].split(',')
+    fields[2] = TOO_LONG
+    lines[bad_line] = ','.join(fields)
+    csv_file = samples / 'bad.csv'
+    csv_file.write_text('\n'.join(lines) + '\n', encoding='utf-8')
+    return csv_file
+
+@pytest.mark.parametrize('bad_line, if_exists', [(2, 'truncate'), (2, 'append'), (20, 'truncate'), (20, 'append')])
+def test_invalid_chunk_leaves_table_untouched(samples, rating_table, capsys, bad_line, if_exists):
+    before = [dict(row) for row in rating_table.table(TABLE)]
+    assert not csv_toolkit.import_csv_to_db(str(_write(samples, bad_line)), TABLE, chunk_size=5, if_exists=if_exists)
+    out = capsys.readouterr().out
+    assert "不符合表格 'comments_commentrating' 的結構" in out and 'rater_name' in out
+    # 第一個區塊無效時不會清除或寫入表格；之後的區塊無效時，已寫入的區塊 (及清除) 一併回滾
+    assert [dict(row) for row in rating_table.table(TABLE)] == before
+    if bad_line < 5:
+        assert not [text for text in rating_table.statements if text.startswith(('TRUNCATE', 'CREATE', 'INSERT'))]
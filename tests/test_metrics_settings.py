@@ -0,0 +1,41 @@
+"""Settings taken from the environment are checked and never stop the toolkit from importing."""
+import os
+import subprocess
+import sys
+
+import pytest
+
+import toolkit_metrics
+from conftest import ROOT
+
+def _setting(name, value):
+    env = dict(os.environ, **{f"TOOLKIT_{name.upper()}": value})
+    return subprocess.run([sys.executable, '-c', f'import toolkit_metrics; print(toolkit_metrics._settings["{name}"])'],
+                          cwd=ROOT, env=env, capture_output=True, text=True, check=True)
+
+def _verbosity(value):
+    return _setting('verbosity', value)
+
+@pytest.mark.parametrize('value', ['debug', '', '5', '1.5'])
+def test_invalid_verbosity_falls_back_to_progress(value):
+    result = _verbosity(value)
+    assert result.stdout.strip() == '1'
+    assert 'TOOLKIT_VERBOSITY' in result.stderr
+
+def test_valid_verbosity_is_used_quietly():
+    result = _verbosity('2')
+    assert result.stdout.strip() == '2' and not result.stderr
+
+def test_configure_rejects_unknown_verbosity():
+    with pytest.raises(ValueError):
+        toolkit_metrics.configure(verbosity=3)
+
+@pytest.mark.parametrize('value', ['sumary', 'SUMMARY', ''])
+def test_invalid_metrics_mode_falls_back_to_off(value):
+    result = _setting('metrics', value)
+    assert result.stdout.strip() == 'off'
+    assert 'TOOLKIT_METRICS' in result.stderr
+
+def test_valid_metrics_mode_is_used_quietly():
+    result = _setting('metrics', 'stages')
+    assert result.stdout.strip() == 'stages' and not result.stderr
@@ -0,0 +1,48 @@
+"""Pipelined imports clean and write the same rows, in the same order, as sequential ones."""
+import threading
+from contextlib import closing
+
+import pytest
+
+import csv_toolkit
+from conftest import ROOT, SAMPLE_FILES, copy_text, table_schema
+from toolkit_metrics import OperationMetrics
+
+def _cleaned(csv_file, table_name, chunk_size, pipeline):
+    metrics = OperationMetrics('import')
+    chunks = csv_toolkit._iter_cleaned_chunks(csv_file, table_name, chunk_size, metrics, pipeline=pipeline)
+    if pipeline:
+        chunks = csv_toolkit._pipelined(chunks, 'cleaner')
+    with closing(chunks):
+        return [copy_text([chunk]) for chunk in chunks], metrics
+
+@pytest.mark.parametrize('name', sorted(SAMPLE_FILES))
+@pytest.mark.parametrize('chunk_size', [3, 7])
+def test_pipelined_chunks_match_sequential_chunks(name, chunk_size):
+    csv_file, table_name = f"{ROOT}/{name}", SAMPLE_FILES[name]
+    sequential, sequential_metrics = _cleaned(csv_file, table_name, chunk_size, False)
+    pipelined, pipelined_metrics = _cleaned(csv_file, table_name, chunk_size, True)
+    assert pipelined == sequential
+    assert pipelined_metrics.rows('read') == sequential_metrics.rows('read')
+    assert pipelined_metrics.dropped == sequential_metrics.dropped
+
+def test_pipelined_import_writes_same_rows(samples, fake_db):
+    table_name = 'listings_two_dish_rice'
+    fake_db.schemas[table_name] = table_schema(table_name)
+    results = []
+    for pipeline in (False, True):
+        fake_db.rows.clear()
+        assert csv_toolkit.import_csv_to_db(str(samples / 'listings.csv'), table_name, chunk_size=5,
+                                            if_exists='append', pipeline=pipeline)
+        results.append(copy_text(fake_db.frames(table_name)))
+    assert results[0] == results[1]
+
+def test_closing_pipeline_early_stops_its_threads():
+    chunks = csv_toolkit._pipelined(csv_toolkit._iter_cleaned_chunks(
+        f"{ROOT}/listings.csv", 'listings_two_dish_rice', 3, OperationMetrics('import'), pipeline=True), 'cleaner')
+    next(chunks)
+    chunks.close()
+    producers = [thread for thread in threading.enumerate() if thread.name.startswith('import-')]
+    for thread in producers:
+        thread.join(timeout=5)
+    assert not any(thread.is_alive() for thread in producers)
@@ -0,0 +1,62 @@
+"""Aggregates kept up to date by each import's RETURNING deltas equal a full rebuild()."""
+import pandas as pd
+import pytest
+
+import csv_toolkit
+import rating_aggregates
+from conftest import table_schema
+
+RATE, RATING = 'comments_comment_rate', 'comments_commentrating'
+
+@pytest.fixture
+def rating_db(sql_db):
+    for table_name in (RATE, RATING):
+        sql_db.create_table(table_schema(table_name), unique=[csv_toolkit.NATURAL_KEYS[table_name]])
+    assert csv_toolkit.rebuild_rating_aggregates(create=True)
+    return sql_db
+
+def _aggregates(db):
+    return {aggregate.table: {row[aggregate.key]: (row['rating_count'], row['rating_sum'])
+                              for row in db.table(aggregate.table) if row['rating_count']}
+            for aggregate in rating_aggregates.AGGREGATES}
+
+def _assert_matches_rebuild(db):
+    tracked = _aggregates(db)
+    assert any(tracked.values())
+    assert csv_toolkit.rebuild_rating_aggregates()
+    assert _aggregates(db) == tracked
+
+def _import(csv_file, table_name, if_exists):
+    assert csv_toolkit.import_csv_to_db(str(csv_file), table_name, chunk_size=5, if_exists=if_exists)
+
+def _edited(samples, name, column, edit):
+    df = pd.read_csv(samples / name, encoding='utf-8-sig', dtype=str, keep_default_na=False)
+    df[column] = [edit(index, value) for index, value in enumerate(df[column])]
+    df.to_csv(samples / f"edited_{name}", index=False, encoding='utf-8-sig')
+    return samples / f"edited_{name}"
+
+def test_inserted_rows_are_added(samples, rating_db):
+    _import(samples / 'comment_rate.csv', RATE, 'append')
+    _import(samples / 'commentrating.csv', RATING, 'append')
+    _assert_matches_rebuild(rating_db)
+    # 重複導入時跳過的行不計入匯總
+    _import(samples / 'commentrating.csv', RATING, 'append')
+    _assert_matches_rebuild(rating_db)
+
+def test_updated_and_removed_ratings_move_the_aggregates(samples, rating_db):
+    _import(samples / 'comment_rate.csv', RATE, 'sync')
+    _import(samples / 'commentrating.csv', RATING, 'sync')
+    before = _aggregates(rating_db)
+
+    # 改變部分評分，並刪除 (清空) 另一些餐廳評分
+    _import(_edited(samples, 'comment_rate.csv', 'restaurant_rating',
+                    lambda index, value: '' if index % 3 == 0 else '5' if index % 3 == 1 else value), RATE, 'sync')
+    _import(_edited(samples, 'commentrating.csv', 'rating',
+                    lambda index, value: '1' if index % 2 else value), RATING, 'sync')
+    assert _aggregates(rating_db) != before
+    _assert_matches_rebuild(rating_db)
+
+def test_erased_sources_empty_their_aggregates(samples, rating_db):
+    _import(samples / 'commentrating.csv', RATING, 'append')
+    assert csv_toolkit.erase_tables([RATING], confirm=False)
+    assert not rating_db.table('comments_comment_rating_summary')
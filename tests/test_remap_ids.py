@@ -0,0 +1,58 @@
+"""Importing parent and child files with remap_ids keeps every child row pointing at its original parent."""
+import os
+
+import pandas as pd
+import pytest
+
+import csv_toolkit
+from conftest import table_schema
+
+PARENT, CHILD = 'comments_comment_rate', 'comments_commentrating'
+FOREIGN_KEY = (CHILD, 'comment_id', PARENT, 'id')
+
+@pytest.fixture
+def linked_db(fake_db):
+    fake_db.foreign_keys = [FOREIGN_KEY]
+    fake_db.schemas[PARENT] = table_schema(PARENT)
+    fake_db.schemas[CHILD] = table_schema(CHILD, [FOREIGN_KEY])
+    return fake_db
+
+def _import(samples, name, table_name, chunk_size):
+    return csv_toolkit.import_csv_to_db(str(samples / name), table_name, chunk_size=chunk_size,
+                                        if_exists='append', remap_ids=True)
+
+def test_child_keys_follow_parent_ids(samples, linked_db):
+    assert _import(samples, 'comment_rate.csv', PARENT, 7)
+    assert _import(samples, 'commentrating.csv', CHILD, 5)
+
+    parents = pd.concat(linked_db.frames(PARENT))
+    children = pd.concat(linked_db.frames(CHILD))
+    source_children = pd.read_csv(samples / 'commentrating.csv', encoding='utf-8-sig')
+    assert parents['id'].min() >= 1000 # 新 id 來自序列，與文件中的 id 不同
+    assert len(children) == len(source_children)
+
+    # 子記錄按文件順序寫入，每個新 comment_id 對應回文件中原本的 comment_id
+    id_map = csv_toolkit._id_map(PARENT, 'id')
+    new_to_old = pd.Series(id_map.index, index=id_map.to_numpy())
+    assert new_to_old.loc[children['comment_id'].to_numpy()].tolist() == source_children['comment_id'].tolist()
+
+def test_unmapped_references_are_left_to_the_foreign_key_check(samples, linked_db):
+    assert _import(samples, 'comment_rate.csv', PARENT, 7)
+    id_map = csv_toolkit._id_map(PARENT, 'id')
+    kept = id_map.iloc[:-3]
+    csv_toolkit.forget_id_maps([PARENT])
+    csv_toolkit._publish_ids(PARENT, 'id', [(kept.index.to_numpy(), kept.to_numpy())])
+
+    assert _import(samples, 'commentrating.csv', CHILD, 5)
+    rejects = pd.read_csv(samples / f"commentrating{csv_toolkit.REJECT_SUFFIX}", encoding='utf-8-sig')
+    referenced = set(pd.read_csv(samples / 'commentrating.csv', encoding='utf-8-sig')['comment_id'])
+    unmapped = set(id_map.index[-3:]) & referenced
+    # 對應不到的舊 id 保持原值，不存在於上層表格的新 id 中，因此按外鍵檢查隔離
+    assert unmapped and set(rejects['comment_id']) == unmapped
+    assert rejects['_reject_reason'].str.contains('不存在於').all()
+
+def test_remap_ids_cannot_resume(samples, linked_db):
+    assert not csv_toolkit.import_csv_to_db(str(samples / 'comment_rate.csv'), PARENT, chunk_size=7,
+                                            if_exists='append', resume=True, remap_ids=True)
+    assert not os.path.exists(csv_toolkit._checkpoint_file(str(samples / 'comment_rate.csv')))
+    assert not linked_db.frames(PARENT)
@@ -0,0 +1,69 @@
+"""Resumable imports: an interrupted run followed by a rerun loads exactly the rows of one clean run."""
+import os
+
+import pytest
+
+import csv_toolkit
+from conftest import copy_text, table_schema
+
+TABLE = 'comments_comment_rate'
+CHUNK_SIZE = 7
+
+def _import(samples, **options):
+    return csv_toolkit.import_csv_to_db(str(samples / 'comment_rate.csv'), TABLE, chunk_size=CHUNK_SIZE,
+                                        if_exists='append', **options)
+
+@pytest.fixture
+def reference(samples, fake_db):
+    """The COPY text of an uninterrupted import; the fake database is emptied afterwards."""
+    fake_db.schemas[TABLE] = table_schema(TABLE)
+    assert _import(samples)
+    text = copy_text(fake_db.frames(TABLE))
+    fake_db.rows.clear()
+    fake_db.copies = 0
+    return text
+
+@pytest.mark.parametrize('pipeline', [False, True])
+@pytest.mark.parametrize('fail_copy_at', [1, 2, 3])
+def test_rerun_after_failed_chunk_matches_clean_run(samples, fake_db, reference, pipeline, fail_copy_at):
+    fake_db.fail_copy_at = fail_copy_at
+    assert not _import(samples, resume=True, pipeline=pipeline)
+    assert len(fake_db.frames(TABLE)) == fail_copy_at - 1
+
+    fake_db.fail_copy_at, fake_db.copies = None, 0
+    assert _import(samples, resume=True, pipeline=pipeline)
+    assert copy_text(fake_db.frames(TABLE)) == reference
+    assert not fake_db.checkpoints
+    assert not os.path.exists(csv_toolkit._checkpoint_file(str(samples / 'comment_rate.csv')))
+
+@pytest.mark.parametrize('pipeline', [False, True])
+def test_crash_between_commit_and_checkpoint_file_does_not_replay(samples, fake_db, reference, monkeypatch, pipeline):
+    save_checkpoint = csv_toolkit._save_checkpoint
+    calls = []
+
+    def crash_on_second_save(checkpoint_file, checkpoint):
+        calls.append(checkpoint['chunks'])
+        if len(calls) == 2:
+            raise OSError('磁碟已滿')
+        save_checkpoint(checkpoint_file, checkpoint)
+
+    monkeypatch.setattr(csv_toolkit, '_save_checkpoint', crash_on_second_save)
+    assert not _import(samples, resume=True, pipeline=pipeline)
+    # 第二個區塊已提交，但檢查點文件仍停留在第一個區塊
+    assert len(fake_db.frames(TABLE)) == 2
+
+    monkeypatch.setattr(csv_toolkit, '_save_checkpoint', save_checkpoint)
+    assert _import(samples, resume=True, pipeline=pipeline)
+    assert copy_text(fake_db.frames(TABLE)) == reference
+    assert not fake_db.checkpoints
+
+def test_progress_of_other_content_is_ignored(samples, fake_db, reference):
+    fake_db.fail_copy_at = 2
+    assert not _import(samples, resume=True)
+    with open(samples / 'comment_rate.csv', 'a', encoding='utf-8') as f:
+        f.write('\n')
+
+    fake_db.rows.clear()
+    fake_db.fail_copy_at, fake_db.copies = None, 0
+    assert _import(samples, resume=True)
+    assert copy_text(fake_db.frames(TABLE)) == reference
@@ -0,0 +1,36 @@
+"""Row hashes used for cross-chunk de-duplication do not depend on the dtypes a chunk was read with."""
+import numpy as np
+import pandas as pd
+
+import csv_toolkit
+
+def test_same_values_hash_alike_across_dtypes():
+    as_numbers = pd.DataFrame({'n': pd.Series([5, 6], dtype='int64'), 'r': [1.5, 2.0], 'f': [True, False]})
+    as_text = pd.DataFrame({'n': pd.Series(['5', '6'], dtype=object), 'r': ['1.5', '2'],
+                            'f': pd.Series([True, False], dtype=object)})
+    as_other = pd.DataFrame({'n': pd.Series([5.0, 6.0]), 'r': pd.Series(['1.50', '2.0'], dtype='category'),
+                             'f': pd.array([True, False], dtype='boolean')})
+    expected = csv_toolkit._row_hashes(as_numbers).tolist()
+    assert csv_toolkit._row_hashes(as_text).tolist() == expected
+    assert csv_toolkit._row_hashes(as_other).tolist() == expected
+
+def test_different_values_hash_differently():
+    df = pd.DataFrame({'v': pd.Series(['5', '5.5', 'abc', None, '', '4617878467915022336'], dtype=object)})
+    hashes = csv_toolkit._row_hashes(df).tolist()
+    assert hashes[3] == hashes[4] # 空值與空字串視為相同，與去重前的寫法一致
+    assert len(set(hashes)) == 5
+    assert csv_toolkit._row_hashes(pd.DataFrame({'v': [5.5]}))[0] == hashes[1]
+    assert csv_toolkit._row_hashes(pd.DataFrame({'v': [np.int64(4617878467915022336)]}))[0] == hashes[5]
+
+def test_chunked_read_drops_duplicates_split_across_differently_typed_chunks(tmp_path):
+    csv_file = tmp_path / 'commentrating.csv'
+    # 第一個區塊的 comment_id 推斷為整數，第二個區塊因 'x' 推斷為字串；第三行與第一行相同
+    csv_file.write_text('id,rater_id,rater_name,rating,created_date,comment_id\n'
+                        '1,2,User1,4,2025-06-22,7\n'
+                        '2,3,User2,5,2025-06-22,8\n'
+                        '1,2,User1,4,2025-06-22,7\n'
+                        '3,4,User3,5,2025-06-22,x\n', encoding='utf-8')
+    chunks = list(csv_toolkit._read_frames(str(csv_file), 2, 'csv', 'comments_commentrating'))
+    assert chunks[0]['comment_id'].dtype != chunks[1]['comment_id'].dtype
+    first, second = (csv_toolkit._row_hashes(chunk) for chunk in chunks)
+    assert first.iloc[0] == second.iloc[0]
@@ -0,0 +1,33 @@
+"""Sync imports insert new keys, update changed rows and leave unchanged rows untouched."""
+import re
+
+import pandas as pd
+
+import csv_toolkit
+from conftest import table_schema
+
+TABLE = 'comments_comment_rate'
+
+def _sync(csv_file, capsys):
+    assert csv_toolkit.import_csv_to_db(str(csv_file), TABLE, chunk_size=7, if_exists='sync')
+    counts = re.search(r'新增 (\d+) 筆，更新 (\d+) 筆，(\d+) 筆未變更', capsys.readouterr().out)
+    return tuple(int(count) for count in counts.groups())
+
+def test_sync_counts_and_rewrites_only_changed_rows(samples, sql_db, capsys):
+    sql_db.create_table(table_schema(TABLE), unique=[csv_toolkit.NATURAL_KEYS[TABLE]])
+    inserted, _, _ = _sync(samples / 'comment_rate.csv', capsys)
+    rows = len(sql_db.table(TABLE))
+    assert inserted == rows > 3
+    assert _sync(samples / 'comment_rate.csv', capsys) == (0, 0, rows)
+    assert all(row.writes == 1 for row in sql_db.table(TABLE))
+
+    df = pd.read_csv(samples / 'comment_rate.csv', encoding='utf-8-sig', dtype=str, keep_default_na=False)
+    df.loc[0, 'comment'] = '改了評語'
+    df.loc[1, 'restaurant_rating'] = '1' if df.loc[1, 'restaurant_rating'] != '1' else '2'
+    added = df.iloc[[2]].assign(id='999', foodie_name_id='99')
+    pd.concat([df, added]).to_csv(samples / 'changed.csv', index=False, encoding='utf-8-sig')
+
+    assert _sync(samples / 'changed.csv', capsys) == (1, 2, rows - 2)
+    writes = {(row['foodie_name_id'], row['comment']): row.writes for row in sql_db.table(TABLE)}
+    assert writes[(int(df.loc[0, 'foodie_name_id']), '改了評語')] == 2
+    assert sorted(writes.values()) == [1] * (rows - 1) + [2] * 2
@@ -0,0 +1,376 @@
+"""Non-interactive command line for the CSV toolkit.
+
+Runs single commands or a JSON job manifest without prompts or file dialogs, so the toolkit can
+be driven from cron or a deploy pipeline. pandas and psycopg2 are only imported once a command
+actually needs the database, and tkinter is never imported.
+
+Manifest example:
+
+    {
+        "parallel": true,
+        "defaults": {"if_exists": "append", "chunk_size": 50000},
+        "jobs": [
+            {"action": "import", "table": "listings_two_dish_rice", "file": "listings.csv", "if_exists": "sync",
+             "key": ["restaurant_name", "restaurant_address"]},
+            {"action": "export", "table": "comments_comment_rate", "file": "out/comment_rate.csv", "incremental": "append"},
+            {"action": "export", "table": "listings_two_dish_rice", "file": "out/listings.csv",
+             "columns": ["restaurant_name", "restaurant_district", "list_date"],
+             "filters": [["is_published", "=", true]], "order_by": ["-list_date"], "partition_by": "restaurant_district"},
+            {"action": "erase", "table": ["comments_comment_rate", "comments_commentrating"], "confirm": true}
+        ]
+    }
+
+Relative file paths are resolved against the manifest's directory. An erase job may list several
+tables; they are cleared together in one transaction. Tables referencing them through foreign keys
+must be listed as well, or the job must set "cascade": true. With "remap_ids": true, import jobs of
+parent and child files keep their links: the children's foreign keys are rewritten to the ids
+the database gave the parents' rows earlier in the same run. Export filters are [column, operator, value]
+triples (see EXPORT_FILTER_OPERATORS); on the command line they are written as "column operator
+value", e.g. --filter "is_published = true" or --filter "restaurant_district in 中西區,灣仔區".
+"""
+import argparse
+import json
+import os
+import re
+import sys
+
+ACTIONS = ('import', 'export', 'erase')
+IMPORT_POLICIES = ('append', 'truncate', 'sync') # 批處理模式不能詢問，只接受明確的策略
+JOB_DEFAULTS = {'if_exists': 'append', 'chunk_size': None, 'dry_run': False, 'confirm': False, 'key': None,
+                'incremental': None, 'format': None, 'workers': None, 'pipeline': False,
+                'resume': False, 'parser': 'pandas', 'columns': None, 'filters': None, 'order_by': None,
+                'partition_by': None, 'remap_ids': False, 'cascade': False}
+INCREMENTAL_MODES = ('append', 'delta')
+FILE_FORMATS = ('csv', 'parquet') # 未指定時按副檔名判斷 (.parquet / .pq 為 Parquet)
+CSV_PARSERS = ('pandas', 'arrow') # 與 csv_toolkit.CSV_PARSERS 一致
+# 與 csv_toolkit.EXPORT_FILTER_OPERATORS 一致；in / not in 的值為列表
+EXPORT_FILTER_OPERATORS = ('=', '!=', '<', '<=', '>', '>=', 'like', 'in', 'not in', 'is null', 'is not null')
+FILTER_PATTERN = re.compile(r'^\s*(\w+)(?:\s+(is\s+not\s+null|is\s+null)|\s+(not\s+in|in|like)\s+(.*?)'
+                            r'|\s*(!=|<=|>=|=|<|>)\s*(.*?))\s*$', re.IGNORECASE)
+_EXPORT_QUERY_OPTIONS = ('columns', 'filters', 'order_by', 'partition_by') # 增量導出不支援的導出選項
+
+def _configure_output(args):
+    """Applies the metrics, verbosity and cache options before any command runs."""
+    import toolkit_metrics
+    verbosity = 2 if args.verbose else 0 if args.quiet else None
+    metrics = args.metrics
+    if metrics is None and os.getenv('TOOLKIT_METRICS') is None:
+        # 批處理模式預設每個操作輸出一筆指標記錄；已設定 TOOLKIT_METRICS 時沿用 (已檢查的) 設定
+        metrics = 'summary'
+    toolkit_metrics.configure(metrics=metrics, metrics_file=args.metrics_file, verbosity=verbosity)
+    if args.no_cache or args.cache:
+        import clean_cache
+        if args.no_cache:
+            clean_cache.configure(max_mb=0)
+        elif not clean_cache.enabled():
+            clean_cache.configure(max_mb=clean_cache.DEFAULT_MAX_MB)
+
+def _toolkit():
+    """Imports csv_toolkit (and with it pandas and psycopg2) on first use."""
+    import csv_toolkit
+    return csv_toolkit
+
+def parse_filter(text):
+    """Parses a command line filter such as "is_published = true" into a [column, operator, value] triple.
+
+    Values stay text and are converted to the column's type by the database; an in / not in
+    value is a comma separated list.
+    """
+    match = FILTER_PATTERN.match(text)
+    if not match:
+        raise argparse.ArgumentTypeError(
+            f"無法解析篩選條件 '{text}'，格式為 \"欄位 運算符 值\"，運算符: {', '.join(EXPORT_FILTER_OPERATORS)}")
+    column, null_check, list_operator, list_value, operator, value = match.groups()
+    if null_check:
+        return [column, ' '.join(null_check.lower().split()), None]
+    if list_operator:
+        list_operator = ' '.join(list_operator.lower().split())
+        if list_operator == 'like':
+            return [column, list_operator, list_value]
+        return [column, list_operator, [item.strip() for item in list_value.split(',')]]
+    return [column, operator, value]
+
+def _validate_filters(filters, where):
+    """Returns the problems found in an export job's filters."""
+    if not isinstance(filters, list):
+        return [f"{where} 的 filters 必須是 [欄位, 運算符, 值] 列表。"]
+    errors = []
+    for item in filters:
+        if not isinstance(item, list) or len(item) != 3 or not isinstance(item[0], str):
+            errors.append(f"{where} 的篩選條件 {item!r} 必須是 [欄位, 運算符, 值]。")
+        elif not isinstance(item[1], str) or ' '.join(item[1].lower().split()) not in EXPORT_FILTER_OPERATORS:
+            errors.append(f"{where} 的篩選運算符 {item[1]!r} 必須是 {', '.join(EXPORT_FILTER_OPERATORS)} 之一。")
+        elif item[1].lower().split()[-1] == 'in' and not isinstance(item[2], list):
+            errors.append(f"{where} 的篩選條件 {item!r} 使用 {item[1]}，值必須是列表。")
+    return errors
+
+def _validate_job(job, index):
+    """Returns a list of problems found in one manifest job."""
+    errors = []
+    where = f"第 {index + 1} 個任務"
+    if not isinstance(job, dict):
+        return [f"{where} 必須是 JSON 物件。"]
+    if job.get('action') not in ACTIONS:
+        errors.append(f"{where} 的 action 必須是 {', '.join(ACTIONS)} 之一。")
+    table = job.get('table')
+    if job.get('action') == 'erase' and isinstance(table, list):
+        if not table or not all(isinstance(name, str) and name for name in table):
+            errors.append(f"{where} 的 table 必須是表格名稱或表格名稱列表。")
+    elif not isinstance(table, str) or not table:
+        errors.append(f"{where} 缺少 table。")
+    if job.get('action') in ('import', 'export') and not job.get('file'):
+        errors.append(f"{where} 缺少 file。")
+    if job.get('if_exists') not in IMPORT_POLICIES:
+        errors.append(f"{where} 的 if_exists 必須是 {', '.join(IMPORT_POLICIES)} 之一。")
+    if job.get('incremental') not in (None,) + INCREMENTAL_MODES:
+        errors.append(f"{where} 的 incremental 必須是 {', '.join(INCREMENTAL_MODES)} 之一。")
+    if job.get('format') not in (None,) + FILE_FORMATS:
+        errors.append(f"{where} 的 format 必須是 {', '.join(FILE_FORMATS)} 之一。")
+    elif job.get('format') == 'parquet' and job.get('incremental'):
+        errors.append(f"{where} 的增量導出只支援 CSV 格式。")
+    key = job.get('key')
+    if key is not None and (not isinstance(key, list) or not key or not all(isinstance(col, str) for col in key)):
+        errors.append(f"{where} 的 key 必須是欄位名稱列表。")
+    chunk_size = job.get('chunk_size')
+    if chunk_size is not None and (not isinstance(chunk_size, int) or chunk_size <= 0):
+        errors.append(f"{where} 的 chunk_size 必須是正整數。")
+    workers = job.get('workers')
+    if workers is not None and (not isinstance(workers, int) or workers <= 0):
+        errors.append(f"{where} 的 workers 必須是正整數。")
+    for flag in ('pipeline', 'resume', 'remap_ids', 'cascade'):
+        if not isinstance(job.get(flag), bool):
+            errors.append(f"{where} 的 {flag} 必須是 true 或 false。")
+    if job.get('resume') and chunk_size is None:
+        errors.append(f"{where} 的 resume 需要指定 chunk_size。")
+    if job.get('resume') is True and job.get('remap_ids') is True:
+        errors.append(f"{where} 的 remap_ids 不能與 resume 一併使用 (id 對應只保存在記憶體中)。")
+    if job.get('parser') not in CSV_PARSERS:
+        errors.append(f"{where} 的 parser 必須是 {', '.join(CSV_PARSERS)} 之一。")
+    for option in ('columns', 'order_by'):
+        names = job.get(option)
+        if names is not None and (not isinstance(names, list) or not names
+                                  or not all(isinstance(col, str) and col for col in names)):
+            errors.append(f"{where} 的 {option} 必須是欄位名稱列表。")
+    if job.get('filters') is not None:
+        errors.extend(_validate_filters(job['filters'], where))
+    partition_by = job.get('partition_by')
+    if partition_by is not None and (not isinstance(partition_by, str) or not partition_by):
+        errors.append(f"{where} 的 partition_by 必須是欄位名稱。")
+    if job.get('incremental') and any(job.get(option) is not None for option in _EXPORT_QUERY_OPTIONS):
+        errors.append(f"{where} 的增量導出不支援 {', '.join(_EXPORT_QUERY_OPTIONS)}。")
+    return errors
+
+def load_manifest(manifest_path):
+    """Reads and validates a job manifest; returns (jobs, parallel) or raises ValueError."""
+    with open(manifest_path, encoding='utf-8') as f:
+        manifest = json.load(f)
+    if not isinstance(manifest, dict) or not isinstance(manifest.get('jobs'), list):
+        raise ValueError("清單必須是包含 'jobs' 列表的 JSON 物件。")
+
+    base_dir = os.path.dirname(os.path.abspath(manifest_path))
+    defaults = {**JOB_DEFAULTS, **manifest.get('defaults', {})}
+    jobs = []
+    errors = []
+    for index, raw_job in enumerate(manifest['jobs']):
+        job = {**defaults, **raw_job} if isinstance(raw_job, dict) else raw_job
+        errors.extend(_validate_job(job, index))
+        if not errors and job.get('file'):
+            job['file'] = os.path.join(base_dir, job['file'])
+        jobs.append(job)
+    if errors:
+        raise ValueError("\n".join(errors))
+    return jobs, bool(manifest.get('parallel', False))
+
+def _job_tables(job):
+    """Returns the job's table names as a list (erase jobs may name several tables)."""
+    return job['table'] if isinstance(job['table'], list) else [job['table']]
+
+def run_job(job):
+    """Runs one validated job and returns True on success."""
+    toolkit = _toolkit()
+    action = job['action']
+    if action == 'import':
+        return toolkit.import_csv_to_db(job['file'], job['table'], chunk_size=job['chunk_size'],
+                                        if_exists=job['if_exists'], dry_run=job['dry_run'], key_columns=job['key'],
+                                        file_format=job['format'], workers=job['workers'],
+                                        pipeline=job['pipeline'], resume=job['resume'], csv_parser=job['parser'],
+                                        remap_ids=job['remap_ids'])
+    if action == 'export':
+        if job['incremental']:
+            return toolkit.export_incremental(job['table'], job['file'], mode=job['incremental'])
+        filters = [tuple(item) for item in job['filters']] if job['filters'] else None
+        return toolkit.export_db_to_csv(job['table'], job['file'], file_format=job['format'], columns=job['columns'],
+                                        filters=filters, order_by=job['order_by'], partition_by=job['partition_by'])
+    if not job['confirm']:
+        print(f"清除表格 '{', '.join(_job_tables(job))}' 需要明確確認 (--yes 或清單中的 \"confirm\": true)，已跳過。")
+        return False
+    return toolkit.erase_tables(_job_tables(job), confirm=False, cascade=job['cascade'])
+
+def _parallel_batches(jobs):
+    """Groups consecutive import jobs that share the same settings so they can be loaded together.
+
+    Jobs with an explicit natural key, file format, worker count, pipeline, resume or CSV parser run
+    on their own, since the parallel loader uses NATURAL_KEYS, picks the format from the file
+    extension and reads and cleans in-process on the loading thread with the default parser.
+    """
+    batch = []
+    for job in jobs:
+        groupable = job['action'] == 'import' and not job['dry_run'] and job['key'] is None and job['format'] is None \
+            and job['workers'] is None and not job['pipeline'] and not job['resume'] and job['parser'] == 'pandas'
+        key = (job['if_exists'], job['chunk_size'], job['remap_ids'])
+        if batch and (not groupable or key != batch[0][1] or job['table'] in {j['table'] for j, _ in batch}):
+            yield [j for j, _ in batch]
+            batch = []
+        if groupable:
+            batch.append((job, key))
+        else:
+            yield [job]
+    if batch:
+        yield [j for j, _ in batch]
+
+def run_jobs(jobs, parallel=False):
+    """Runs jobs in manifest order and returns the number of failures."""
+    failures = 0
+    batches = _parallel_batches(jobs) if parallel else ([job] for job in jobs)
+    for batch in batches:
+        if len(batch) == 1:
+            job = batch[0]
+            print(f"\n>>> {job['action']} {', '.join(_job_tables(job))}")
+            failures += 0 if run_job(job) else 1
+            continue
+        print(f"\n>>> 並行導入 {', '.join(job['table'] for job in batch)}")
+        results = _toolkit().import_tables_parallel(
+            {job['table']: job['file'] for job in batch},
+            if_exists=batch[0]['if_exists'], chunk_size=batch[0]['chunk_size'], remap_ids=batch[0]['remap_ids'])
+        failures += sum(1 for job in batch if not results.get(job['table']))
+    return failures
+
+def build_parser():
+    """Builds the argument parser for the batch command line."""
+    parser = argparse.ArgumentParser(prog='csv_toolkit', description="CSV 數據庫工具包 (批處理模式)")
+    parser.add_argument('--metrics', choices=('off', 'summary', 'stages'), default=None,
+                        help="以 JSON 行輸出的指標：summary 每個操作一筆，stages 另加每個階段一筆 (預設取自 TOOLKIT_METRICS)")
+    parser.add_argument('--metrics-file', default=None, help="把指標追加到此文件，而不是輸出到 stderr")
+    cache = parser.add_mutually_exclusive_group()
+    cache.add_argument('--cache', action='store_true',
+                       help="使用並保存清洗結果的緩存 (未加密的 pickle，包括聯絡資料；見 clean_cache)")
+    cache.add_argument('--no-cache', action='store_true', help="不使用也不保存清洗結果的緩存，即使已設定 TOOLKIT_CACHE_MAX_MB")
+    verbosity = parser.add_mutually_exclusive_group()
+    verbosity.add_argument('-v', '--verbose', action='store_true', help="顯示每個欄位的清洗細節及調試信息")
+    verbosity.add_argument('-q', '--quiet', action='store_true', help="只顯示錯誤及結果")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    import_cmd = commands.add_parser('import', help="導入 CSV 或 Parquet 文件到數據庫表格")
+    import_cmd.add_argument('table')
+    import_cmd.add_argument('file')
+    import_cmd.add_argument('--if-exists', choices=IMPORT_POLICIES, default='append',
+                            help="表格已有數據時：append 跳過重複數據，truncate 先清除再導入，sync 按自然鍵新增及更新")
+    import_cmd.add_argument('--key', default=None, help="sync 模式使用的自然鍵欄位，以逗號分隔")
+    import_cmd.add_argument('--chunk-size', type=int, default=None, help="分塊導入，每塊的行數")
+    import_cmd.add_argument('--dry-run', action='store_true', help="只讀取並清洗數據，不寫入數據庫")
+    import_cmd.add_argument('--format', choices=FILE_FORMATS, default=None, help="文件格式，預設按副檔名判斷")
+    import_cmd.add_argument('-j', '--workers', type=int, default=None, help="以多個進程清洗大型文件 (或每個區塊)")
+    import_cmd.add_argument('--pipeline', action='store_true',
+                            help="分塊導入時以獨立線程讀取、清洗及寫入，寫入當前區塊時同時處理後續區塊 (需要 --chunk-size)")
+    import_cmd.add_argument('--resume', action='store_true',
+                            help="每個區塊單獨提交並記錄檢查點，中斷後再次執行時從上次提交的區塊繼續 (需要 --chunk-size)")
+    import_cmd.add_argument('--parser', choices=CSV_PARSERS, default='pandas',
+                            help="CSV 解析器：arrow 以多線程解析並以 Arrow 緩衝保存字串 (需要安裝 pyarrow)")
+    import_cmd.add_argument('--remap-ids', action='store_true',
+                            help="記錄被引用表格的新 id，並把外鍵改寫為本次執行中已導入的上層表格的新 id "
+                                 "(對應只保存在記憶體中，相關的多個文件請以任務清單一併導入；不能與 --resume 一起使用)")
+
+    export_cmd = commands.add_parser('export', help="從數據庫表格導出到 CSV 或 Parquet 文件")
+    export_cmd.add_argument('table')
+    export_cmd.add_argument('file')
+    export_cmd.add_argument('--incremental', choices=INCREMENTAL_MODES, default=None,
+                            help="只導出上次導出後的新數據：append 追加到文件，delta 寫入新的增量文件")
+    export_cmd.add_argument('--format', choices=FILE_FORMATS, default=None,
+                            help="文件格式，預設按副檔名判斷；Parquet 需要安裝 pyarrow")
+    export_cmd.add_argument('--columns', default=None, help="只導出這些欄位 (按此順序)，以逗號分隔")
+    export_cmd.add_argument('--filter', dest='filters', action='append', type=parse_filter, default=None,
+                            help="篩選條件 \"欄位 運算符 值\" (可重複，全部須成立)，由數據庫執行，"
+                                 "例如 \"is_published = true\"")
+    export_cmd.add_argument('--order-by', default=None, help="排序欄位，以逗號分隔；欄位前加 - 表示降序")
+    export_cmd.add_argument('--partition-by', default=None,
+                            help="按此欄位的每個值各寫一個文件 (<文件名>_<值>.<副檔名>)")
+
+    erase_cmd = commands.add_parser('erase', help="清除數據庫表格的數據，全部在同一事務中完成")
+    erase_cmd.add_argument('tables', nargs='+')
+    erase_cmd.add_argument('--yes', action='store_true', help="確認清除 (批處理模式下必須提供)")
+    erase_cmd.add_argument('--cascade', action='store_true',
+                           help="一併清除透過外鍵引用這些表格的其他表格 (否則有引用時拒絕清除)")
+
+    snapshot_cmd = commands.add_parser('snapshot', help="在同一數據庫快照中並行導出全部表格，生成帶清單及校驗和的備份目錄")
+    snapshot_cmd.add_argument('archive', nargs='?', default=None, help="備份目錄 (預設為 snapshot_<時間>)")
+    snapshot_cmd.add_argument('--tables', nargs='+', default=None, help="只備份這些表格 (預設為全部受管理表格)")
+    snapshot_cmd.add_argument('--format', choices=FILE_FORMATS, default='csv', help="文件格式；Parquet 需要安裝 pyarrow")
+    snapshot_cmd.add_argument('--workers', type=int, default=None, help="並行導出的連接數 (預設受 DB_POOL_MAX 限制)")
+
+    aggregates_cmd = commands.add_parser('aggregates', help="從來源表格重新計算評分匯總表格 (導入時會自動增量更新)")
+    aggregates_cmd.add_argument('--tables', nargs='+', default=None,
+                                help="只重新計算這些來源表格的匯總 (預設為全部)")
+    aggregates_cmd.add_argument('--create', action='store_true',
+                                help="建立尚未存在的匯總表格 (匯總表格只會經此建立，不會在導入時自動建立)")
+
+    run_cmd = commands.add_parser('run', help="執行 JSON 任務清單")
+    run_cmd.add_argument('manifest')
+    run_cmd.add_argument('--check', action='store_true', help="只檢查清單格式，不執行")
+    run_cmd.add_argument('--dry-run', action='store_true', help="所有導入任務只讀取並清洗數據")
+    return parser
+
+def main(argv=None):
+    """Entry point for the batch command line; returns the process exit code."""
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    _configure_output(args)
+
+    if args.command == 'snapshot':
+        archive = _toolkit().snapshot_export(args.archive, args.tables, file_format=args.format,
+                                             max_workers=args.workers)
+        return 0 if archive else 1
+
+    if args.command == 'aggregates':
+        return 0 if _toolkit().rebuild_rating_aggregates(args.tables, create=args.create) else 1
+
+    if args.command == 'run':
+        try:
+            jobs, parallel = load_manifest(args.manifest)
+        except (OSError, ValueError) as e:
+            print(f"無法讀取任務清單 '{args.manifest}': {e}")
+            return 2
+        if args.check:
+            print(f"任務清單 '{args.manifest}' 格式正確，共 {len(jobs)} 個任務。")
+            return 0
+        if args.dry_run:
+            for job in jobs:
+                job['dry_run'] = True
+            jobs = [job for job in jobs if job['action'] == 'import']
+    elif args.command == 'import':
+        jobs = [{**JOB_DEFAULTS, 'action': 'import', 'table': args.table, 'file': args.file,
+                 'if_exists': args.if_exists, 'chunk_size': args.chunk_size, 'dry_run': args.dry_run,
+                 'key': args.key.split(',') if args.key else None, 'format': args.format,
+                 'workers': args.workers, 'pipeline': args.pipeline,
+                 'resume': args.resume, 'parser': args.parser, 'remap_ids': args.remap_ids}]
+        if args.resume and args.remap_ids:
+            parser.error("--remap-ids 不能與 --resume 一起使用 (id 對應只保存在記憶體中)")
+        parallel = False
+    elif args.command == 'export':
+        jobs = [{**JOB_DEFAULTS, 'action': 'export', 'table': args.table, 'file': args.file,
+                 'incremental': args.incremental, 'format': args.format,
+                 'columns': args.columns.split(',') if args.columns else None, 'filters': args.filters,
+                 'order_by': args.order_by.split(',') if args.order_by else None,
+                 'partition_by': args.partition_by}]
+        if args.incremental and any(jobs[0][option] is not None for option in _EXPORT_QUERY_OPTIONS):
+            parser.error("--incremental 不能與 --columns、--filter、--order-by 或 --partition-by 一起使用")
+        parallel = False
+    else:
+        jobs = [{**JOB_DEFAULTS, 'action': 'erase', 'table': args.tables, 'confirm': args.yes,
+                 'cascade': args.cascade}]
+        parallel = False
+
+    failures = run_jobs(jobs, parallel)
+    return 1 if failures else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,163 @@
+"""Structured metrics and console verbosity for the CSV toolkit.
+
+Every import or export records the wall time and rows in/out of each stage (cache, read, clean,
+validate, prepare, insert, commit, export) and the rows dropped by each cleaning rule, and emits them as
+one JSON object per line through the 'csv_toolkit.metrics' logger. Settings come from the
+environment (or configure(), used by the batch command line):
+
+    TOOLKIT_METRICS        off | summary (one record per operation) | stages (also one per stage call);
+                           defaults to off in the interactive menu and summary in the batch command line
+    TOOLKIT_METRICS_FILE   append the JSON lines to this file instead of stderr
+    TOOLKIT_VERBOSITY      0 errors only, 1 progress (default), 2 debug details
+
+An unknown TOOLKIT_METRICS or TOOLKIT_VERBOSITY value is reported on stderr and replaced by
+the default (off, 1).
+"""
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+METRICS_MODES = ('off', 'summary', 'stages')
+VERBOSITY_LEVELS = (0, 1, 2)
+DEBUG_PREVIEW_SIZE = 20 # 調試輸出中最多列出的值
+
+def _env_choice(name, default, choices, parse=str):
+    """Returns an environment setting parsed with parse, or default (with a warning) if it is not one of choices."""
+    value = os.getenv(name)
+    if value is None:
+        return default
+    try:
+        parsed = parse(value)
+    except ValueError:
+        parsed = None
+    if parsed not in choices:
+        print(f"警告: {name} 的值 '{value}' 無效 (應為 {'、'.join(map(str, choices))} 之一)，改用 {default}。",
+              file=sys.stderr)
+        return default
+    return parsed
+
+_settings = {
+    'metrics': _env_choice('TOOLKIT_METRICS', 'off', METRICS_MODES),
+    'metrics_file': os.getenv('TOOLKIT_METRICS_FILE'),
+    'verbosity': _env_choice('TOOLKIT_VERBOSITY', 1, VERBOSITY_LEVELS, int),
+}
+_logger = logging.getLogger('csv_toolkit.metrics')
+_logger_lock = threading.Lock()
+
+def configure(metrics=None, metrics_file=None, verbosity=None):
+    """Overrides the metrics mode, metrics file and console verbosity taken from the environment."""
+    if metrics is not None:
+        if metrics not in METRICS_MODES:
+            raise ValueError(f"未知的指標模式: {metrics}")
+        _settings['metrics'] = metrics
+    if metrics_file is not None:
+        _settings['metrics_file'] = metrics_file
+    if verbosity is not None:
+        if verbosity not in VERBOSITY_LEVELS:
+            raise ValueError(f"未知的輸出詳細程度: {verbosity}")
+        _settings['verbosity'] = verbosity
+    with _logger_lock:
+        for handler in list(_logger.handlers):
+            _logger.removeHandler(handler)
+            handler.close()
+
+def _emit(record):
+    """Writes one metrics record as a JSON line, setting up the handler on first use."""
+    if _settings['metrics'] == 'off':
+        return
+    with _logger_lock:
+        if not _logger.handlers:
+            path = _settings['metrics_file']
+            handler = logging.FileHandler(path, encoding='utf-8') if path else logging.StreamHandler(sys.stderr)
+            handler.setFormatter(logging.Formatter('%(message)s'))
+            _logger.addHandler(handler)
+            _logger.setLevel(logging.INFO)
+            _logger.propagate = False
+    _logger.info(json.dumps(record, ensure_ascii=False, default=str))
+
+def info(message):
+    """Prints a progress message unless verbosity is 0."""
+    if _settings['verbosity'] >= 1:
+        print(message)
+
+def debug(message):
+    """Prints a detail message only at verbosity 2."""
+    if _settings['verbosity'] >= 2:
+        print(message)
+
+def is_debug():
+    """Tells whether debug details are printed, so callers can skip building them."""
+    return _settings['verbosity'] >= 2
+
+def preview(values, limit=DEBUG_PREVIEW_SIZE):
+    """Formats at most limit values of a list, noting how many there are in total."""
+    values = list(values)
+    if len(values) <= limit:
+        return f"{values}"
+    return f"{values[:limit]} ... (共 {len(values)} 個)"
+
+class _Stage:
+    """Row counts reported by the code running inside OperationMetrics.stage()."""
+    def __init__(self):
+        self.rows_in = None
+        self.rows_out = None
+
+class OperationMetrics:
+    """Collects stage timings, row counts and dropped rows for one import or export."""
+
+    def __init__(self, operation, **context):
+        self.operation = operation
+        self.context = context
+        self.stages = {}
+        self.dropped = {}
+        self._started = time.perf_counter()
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def stage(self, name):
+        """Times a block as one call of the named stage; set rows_in/rows_out on the yielded object."""
+        record = _Stage()
+        started = time.perf_counter()
+        try:
+            yield record
+        finally:
+            seconds = time.perf_counter() - started
+            with self._lock:
+                totals = self.stages.setdefault(name, {'calls': 0, 'seconds': 0.0, 'rows_in': 0, 'rows_out': 0})
+                totals['calls'] += 1
+                totals['seconds'] += seconds
+                totals['rows_in'] += record.rows_in or 0
+                totals['rows_out'] += record.rows_out or 0
+            if _settings['metrics'] == 'stages':
+                _emit({'event': 'stage', 'operation': self.operation, **self.context, 'stage': name,
+                       'seconds': round(seconds, 6), 'rows_in': record.rows_in, 'rows_out': record.rows_out})
+
+    def drop(self, rule, rows):
+        """Records rows removed by a cleaning rule."""
+        if rows:
+            with self._lock:
+                self.dropped[rule] = self.dropped.get(rule, 0) + rows
+
+    def seconds(self, name):
+        """Returns the total seconds spent in a stage so far."""
+        return self.stages.get(name, {}).get('seconds', 0.0)
+
+    def rows(self, name, field='rows_out'):
+        """Returns the total rows_out (or rows_in) of a stage so far."""
+        return self.stages.get(name, {}).get(field, 0)
+
+    def finish(self, success, **extra):
+        """Emits the summary record of the operation."""
+        _emit({
+            'event': 'operation', 'operation': self.operation, **self.context, **extra,
+            'status': 'ok' if success else 'failed',
+            'finished_at': datetime.now().isoformat(timespec='seconds'),
+            'seconds': round(time.perf_counter() - self._started, 6),
+            'stages': {name: {**totals, 'seconds': round(totals['seconds'], 6)} for name, totals in self.stages.items()},
+            'dropped': self.dropped,
+        })